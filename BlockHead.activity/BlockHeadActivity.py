@@ -29,20 +29,60 @@ __version__ = 2076.1 # SUGAR_ACTIVITY set to True
 # set to False to run as a standard Python program
 SUGAR_ACTIVITY = True
 
+# startup phases are timed from here, before the GUI modules are imported
+from timeit import default_timer as Clock
+StartupClock = Clock()
+
 import pygtk
 pygtk.require('2.0')
 import gtk
+import gobject
 import pango
+import cairo
 if SUGAR_ACTIVITY:
     from sugar.activity import activity
     import logging
+import atexit
+import cProfile
+import cStringIO
+import ctypes
+import ctypes.util
+import glob
+import json
 import os
+import pstats
 import sys
-from time import sleep
+import tempfile
+import thread
+import threading
+import time
+from collections import deque
+from functools import wraps
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 SnapX = SnapY = ClickX = ClickY = TargetColumn = None
-CarryCount = 0
+# images rendered for the current device profile: see PrerenderAssets()
+ImageCache = {}
+# sprites for the current device profile, if there is an atlas: see LoadAtlas()
+Atlas = None
+Num1 = Num2 = NumA = None
+# answer columns that currently display a carry arrow
+CarryColumns = []
+# columns whose blocks changed since the last layout commit: see CommitLayout()
+ChangedColumns = []
+# columns whose carry/borrow arrows may need updating: see UpdateArrows()
+ArrowColumns = []
+# columns in the middle of a carry or borrow animation: their arrows
+# are not updated until it is over
+RegroupColumns = []
 DropOk = False
+# widget currently highlighted by a hint, and timer that will unhighlight it
+HintWidget = HintTimer = None
+# main-loop wakeup accounting, if the environment asks for it: see WakeupCounter
+Wakeups = None
 
 class P():
     """
@@ -51,12 +91,41 @@ class P():
     # debug flag
     DEBUG = False
 
+    # does a click on any carry arrow perform every carry (including the
+    # carries they cause) at once? see CarryAll()
+    CARRY_ALL = False
+
+    # borrow chains (borrowing from an empty column borrows from the
+    # columns to its left first) longer than this are played as a single
+    # borrow: the empty columns are refilled at once (0: never)
+    BORROW_COLLAPSE = 0
+
+    # tracing: environment variable ("spans", "chrome[=PATH]", "profile",
+    # "startup", "quit" and/or "wakeups", comma-separated), keys (with Ctrl+Shift) that toggle span tracing and
+    # the profiler, Chrome trace-event file (%d: process ID) and how often
+    # (seconds) it is written to, profiler stats file and callbacks to print
+    TRACE_ENV = "BLOCKHEAD_TRACE"
+    TRACE_KEY = "T"
+    PROFILE_KEY = "P"
+    TRACE_FILE = "blockhead-%d.trace.json"
+    TRACE_FLUSH_INTERVAL = 0.5
+    # launch time (a time.time() value), if the launcher sets it;
+    # "startup" in TRACE_ENV prints the startup phases (msec) on a line
+    # starting with STARTUP_PREFIX, "quit" quits after the first frame
+    LAUNCH_ENV = "BLOCKHEAD_LAUNCH_TIME"
+    STARTUP_PREFIX = "startup:"
+    PROFILE_FILE = "blockhead-%d.prof"
+    PROFILE_LINES = 30
+
     # show help button and help window?
     HELP_ENABLE = False if SUGAR_ACTIVITY else True
 
     # show exit button?
     EXIT_ENABLE = False if SUGAR_ACTIVITY else True
 
+    # show button for checking a student's own written answer?
+    CHECK_ENABLE = True
+
     # number of columns
     COL_COUNT = 3
 
@@ -69,6 +138,24 @@ class P():
     COL_TO_COL = 0.20
     SHRINK_EXPAND_DELAY = 0.07
     PAUSE = 0.25
+    # how long a hint stays highlighted (milliseconds)
+    HINT_TIME = 2000
+
+    # largest canvas snapshot (the size of a Sugar Journal preview)
+    THUMBNAIL_SIZE = (300, 225)
+    # session log: directory that gets a snapshot of the canvas of each
+    # solved problem (no log if the environment variable is not set)
+    SESSION_LOG_ENV = "BLOCKHEAD_SESSION_LOG"
+
+    # power saving: no timer wakeups and no redraws while nothing is
+    # animating or being dragged (see PowerSave()); the environment
+    # variable forces it on ("1") or off ("0"), else it is on when the
+    # machine has a battery
+    POWER_SAVE = False
+    POWER_SAVE_ENV = "BLOCKHEAD_POWER_SAVE"
+    BATTERY_FILES = "/sys/class/power_supply/*/type"
+    # wakeup accounting ("wakeups" in TRACE_ENV): report interval (seconds)
+    WAKEUP_REPORT_SECS = 60
 
     ###
     ### sizes
@@ -92,10 +179,63 @@ class P():
     TOTAL_LABEL_HGT = 30
     # height adjustment for control panel, to ensure display of carry/borrow blocks
     WINDOW_HGT_ADJ = 100
+    # steps in a block move and in the carry animation; a carry shrink
+    # lasts SHRINK_EXPAND_DELAY * FULL_SHRINK_FRAMES, a borrow expansion
+    # SHRINK_EXPAND_DELAY * BASE
+    FULL_MOVE_FRAMES = 12
+    FULL_SHRINK_FRAMES = 12
+    # fewest steps, on a slow device
+    MIN_FRAMES = 4
+    # steps and scaling interpolation for this device: see Calibrate()
+    MOVE_FRAMES = FULL_MOVE_FRAMES
+    SHRINK_FRAMES = FULL_SHRINK_FRAMES
+    INTERP = gtk.gdk.INTERP_BILINEAR
+    # calibration: a frame takes this many times as long as scaling and
+    # uploading a carry-shrink frame (it is also redrawn); bilinear
+    # scaling is dropped if it takes longer than this (seconds)
+    FRAME_COST_FACTOR = 3
+    BILINEAR_BUDGET = 0.005
+    CALIBRATION_RUNS = 3
+    # clock_gettime() clock ID
+    CLOCK_MONOTONIC = 1
+
+    # device profiles: (name, block width, padding), smallest first;
+    # the sizes above (and the XPM images) are for "xo",
+    # and are changed by SetScale() at startup
+    PROFILES = [("xo", 24, 12),
+                ("compact", 32, 13),
+                ("desktop", 40, 16),
+                ("large", 56, 22),
+                ("huge", 80, 32),
+                ]
+    PROFILE = "xo"
+    # preferred block width on the screen (millimeters)
+    BLOCK_MM = 10.0
+    # window height not taken by the columns: room for carry/borrow blocks,
+    # control panel, Sugar toolbar
+    CHROME_HGT = 275
+    # environment variable that forces a profile (e.g. for a kiosk)
+    PROFILE_ENV = "BLOCKHEAD_PROFILE"
 
     # operations,  modes
     ADD_MODE, SUBTRACT_MODE, CARRY, BORROW = range(4)
 
+    # operator and carry/borrow images: sprite names
+    IMAGES = {
+        ADD_MODE: "plus",
+        SUBTRACT_MODE: "minus",
+        CARRY: "carry",
+        BORROW: "borrow",
+    }
+
+    # sprite atlas: one file per profile, in the bundle (see BuildAtlas())
+    ATLAS_FILE = "sprites-%s.atlas"
+    ATLAS_MAGIC = "BHATLAS2"
+    # atlas width, in block widths
+    ATLAS_COLUMNS = 16
+    # profiles whose atlas is shipped in the bundle (see setup.py, MANIFEST)
+    BUNDLE_PROFILES = ["xo"]
+
     # fonts
     FONTNAME = "Sans Bold"
     FONT = pango.FontDescription("%s 12" % FONTNAME)
@@ -110,6 +250,8 @@ class P():
     CANV_COLOR_STR = '#C8C8C8'
 
     CAN_DROP_COLOR = 0x00FF0000
+    # unit lines and block outlines
+    LINE_PIXEL_COLOR = 0x00000000
     CANNOT_DROP_COLOR = 0x22222200
 
     # colors repeat every N columns
@@ -143,6 +285,226 @@ class P():
         'answer': ["Answer", None],
     }
 
+class Span(object):
+    """
+    one timed run of a named piece of code (use in a "with" statement)
+    """
+    __slots__ = ('tracer', 'name', 'start')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = Clock()
+        return self
+
+    def __exit__(self, *_exc):
+        self.tracer.Record(self.name, self.start, Clock() - self.start)
+        return False
+
+class NoSpan(object):
+    """
+    span used while tracing is off: does nothing
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+NO_SPAN = NoSpan()
+
+class ChromeTrace(object):
+    """
+    write spans to a file, as complete ("X") events of Chrome's
+    trace-event format; spans are queued as they end, and encoded
+    and written by a background thread
+    """
+    def __init__(self, path, origin):
+        # timestamps are microseconds after origin (a Clock() value)
+        self.origin = origin
+        self.pid = os.getpid()
+        self.queue = deque()
+        self.wakeup = threading.Event()
+        self.closing = False
+        self.outfile = open(path, "w")
+        self.outfile.write("[\n" + json.dumps({"name": "process_name", "ph": "M", "pid": self.pid,
+                                                "tid": 0, "args": {"name": "BlockHead"}}))
+        self.writer = threading.Thread(target=self.Writer, name="trace writer")
+        self.writer.setDaemon(True)
+        self.writer.start()
+
+    def Record(self, name, start, duration):
+        self.queue.append((name, start, duration, thread.get_ident()))
+
+    def Flush(self):
+        queue = self.queue
+        while queue:
+            name, start, duration, tid = queue.popleft()
+            self.outfile.write(",\n" + json.dumps(
+                {"name": name, "ph": "X", "pid": self.pid, "tid": tid,
+                 "ts": round((start - self.origin) * 1e6, 1),
+                 "dur": round(duration * 1e6, 1)}))
+        self.outfile.flush()
+
+    def Writer(self):
+        while not self.closing:
+            self.wakeup.wait(P.TRACE_FLUSH_INTERVAL)
+            self.Flush()
+
+    def Close(self):
+        self.closing = True
+        self.wakeup.set()
+        self.writer.join()
+        self.Flush()
+        self.outfile.write("\n]\n")
+        self.outfile.close()
+
+class Tracer(object):
+    """
+    named spans around the handlers and animation loops; when tracing
+    is off, a traced function costs one flag test per call
+    """
+    def __init__(self):
+        self.enabled = False
+        # span name -> [count, total seconds, longest seconds]
+        self.stats = {}
+        # ChromeTrace, if spans are written to a file
+        self.chrome = None
+        self.profiler = None
+        self.options = {}
+        atexit.register(self.Shutdown)
+
+        # startup phases: (name, start, duration), timed from launch,
+        # if the launcher says when that was, else from module import
+        self.origin = self.phase_start = StartupClock
+        self.phases = []
+        launch = os.environ.get(P.LAUNCH_ENV)
+        if launch:
+            launch_delay = max(time.time() - (Clock() - StartupClock) - float(launch), 0.0)
+            self.origin -= launch_delay
+            self.phases.append(("launch", self.origin, launch_delay))
+
+    def Span(self, name):
+        return Span(self, name) if self.enabled else NO_SPAN
+
+    def Traced(self, name):
+        """
+        decorator: record each call of the function as a span
+        """
+        def _decorate(func):
+            @wraps(func)
+            def _traced(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = Clock()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.Record(name, start, Clock() - start)
+            return _traced
+        return _decorate
+
+    def Sleep(self, seconds):
+        """
+        time.sleep(), recorded as a "sleep" span
+        """
+        start = Clock()
+        time.sleep(seconds)
+        if self.enabled:
+            self.Record("sleep", start, Clock() - start)
+
+    def Record(self, name, start, duration):
+        entry = self.stats.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += duration
+        entry[2] = max(entry[2], duration)
+        if self.chrome:
+            self.chrome.Record(name, start, duration)
+
+    def SpanCount(self):
+        return sum([entry[0] for entry in self.stats.values()])
+
+    def Toggle(self):
+        """
+        start tracing, or stop it and print the per-span summary
+        (msec, longest total first)
+        """
+        self.enabled = not self.enabled
+        if self.enabled:
+            self.stats = {}
+            return
+        rows = sorted(self.stats.items(), key=lambda item: -item[1][1])
+        for name, (count, total, longest) in rows:
+            print >> sys.stderr, "%-24s %6d calls %9.1f ms total %8.2f ms max" % (
+                name, count, total * 1000, longest * 1000)
+
+    def ToggleProfile(self):
+        """
+        start the profiler, or stop it, print the callbacks with the
+        highest cumulative time, and write the full stats to a file
+        """
+        if not self.profiler:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            return
+        self.profiler.disable()
+        stats = pstats.Stats(self.profiler, stream=sys.stderr)
+        self.profiler = None
+        path = os.path.join(tempfile.gettempdir(), P.PROFILE_FILE % os.getpid())
+        stats.dump_stats(path)
+        stats.sort_stats("cumulative").print_stats(P.PROFILE_LINES)
+        print >> sys.stderr, "profile written to %s" % path
+
+    def Phase(self, name):
+        """
+        end a startup phase (the next one starts now)
+        """
+        now = Clock()
+        self.phases.append((name, self.phase_start, now - self.phase_start))
+        self.phase_start = now
+
+    def StartupDone(self):
+        """
+        the first frame is on screen: add the startup phases to the trace,
+        and print them, if asked to; return True if the app should quit now
+        """
+        for name, start, duration in self.phases:
+            if self.enabled:
+                self.Record("startup." + name, start, duration)
+        if "startup" in self.options:
+            print >> sys.stderr, P.STARTUP_PREFIX, " ".join(
+                ["%s=%.1f" % (name, duration * 1000) for name, _, duration in self.phases] +
+                ["first_frame=%.1f" % ((Clock() - self.origin) * 1000)])
+        return "quit" in self.options
+
+    def Configure(self, spec):
+        options = self.options = dict(word.strip().partition("=")[::2]
+                                      for word in (spec or "").split(","))
+        if "chrome" in options:
+            path = options["chrome"] or os.path.join(tempfile.gettempdir(),
+                                                     P.TRACE_FILE % os.getpid())
+            self.chrome = ChromeTrace(path, self.origin)
+        if ("spans" in options or "chrome" in options or "wakeups" in options) \
+                and not self.enabled:
+            self.Toggle()
+        if "profile" in options and not self.profiler:
+            self.ToggleProfile()
+
+    def Shutdown(self):
+        if self.profiler:
+            self.ToggleProfile()
+        if self.enabled:
+            self.Toggle()
+        if self.chrome:
+            self.chrome.Close()
+            self.chrome = None
+
+TRACE = Tracer()
+
 class HelpWindow(gtk.Window):
     """
     window to display help text for ADD mode or SUB mode
@@ -273,12 +635,182 @@ class BlockPanel(object):
         self.canv = gtk.Fixed()
         self.canv.set_size_request(wid, hgt)
 
+        # every redraw of the canvas counts as a change,
+        # so a snapshot of an unchanged canvas can be reused
+        self.serial = 0
+        self.canv.connect("expose-event", self.CanvasChanged)
+        # size -> (serial, PNG string)
+        self.snapshots = {}
+        # (serial, size) -> callbacks waiting for a snapshot being encoded
+        self.waiting = {}
+
+        # widgets to be reused from one problem to the next
+        self.pool = WidgetPool(self.canv)
+
+    def CanvasChanged(self, _widget, _event):
+        self.serial += 1
+        return False
+
+    def DisplayList(self):
+        """
+        list what the canvas shows, from the client-side sources of its
+        widgets (Pixbufs, label texts), so that a snapshot can be drawn
+        without reading pixels back from the X server
+
+        return (canvas size, background RGB, items), where each item is
+        (x, y, Pixbuf, None) or (x, y, None, (text, font name)), bottom to top
+        """
+        alloc = self.canv.allocation
+        # a canvas without its own window is drawn in its parent's window
+        x0, y0 = (alloc.x, alloc.y) if self.canv.flags() & gtk.NO_WINDOW else (0, 0)
+
+        # columns, then labels, then blocks and arrows
+        layers = ([], [], [])
+        for widget in self.canv.get_children():
+            if not widget.flags() & gtk.VISIBLE:
+                continue
+            if isinstance(widget, gtk.Label):
+                x, y = widget.get_layout_offsets()
+                layers[1].append((x - x0, y - y0, None,
+                                  (widget.get_text(), widget.style.font_desc.to_string())))
+            elif getattr(widget, "sprite", None):
+                # centered in the widget (an arrow is drawn inside a button)
+                walloc, sprite = widget.allocation, widget.sprite
+                layers[0 if isinstance(widget, gtk.Image) else 2].append(
+                    (walloc.x - x0 + (walloc.width - sprite.get_width()) // 2,
+                     walloc.y - y0 + (walloc.height - sprite.get_height()) // 2,
+                     sprite, None))
+
+        bg = self.canv.style.bg[gtk.STATE_NORMAL]
+        return ((alloc.width, alloc.height),
+                (bg.red / 65535.0, bg.green / 65535.0, bg.blue / 65535.0),
+                layers[0] + layers[1] + layers[2])
+
+    def Snapshot(self, callback, size=P.THUMBNAIL_SIZE):
+        """
+        capture the canvas as a PNG string, scaled down to fit within
+        size (wid, hgt), and pass it to callback, from the main loop
+
+        the canvas contents are listed, and the labels drawn, here; the rest
+        of the drawing and the encoding are done in a worker thread, so the
+        main loop (and any animation) keeps running
+        """
+        cached = self.snapshots.get(size)
+        if cached and cached[0] == self.serial:
+            gobject.idle_add(self.Deliver, [callback], cached[1])
+            return
+
+        key = (self.serial, size)
+        if key in self.waiting:
+            self.waiting[key].append(callback)
+            return
+        self.waiting[key] = [callback]
+
+        display_list = self.DisplayList()
+        labels = SnapshotLabels(display_list, size)
+        if P.POWER_SAVE:
+            # no worker threads when saving power: encode in the main loop
+            gobject.idle_add(lambda: self.SnapshotDone(key, SnapshotPNG(display_list, size, labels)))
+            return
+
+        def _encode():
+            gobject.idle_add(self.SnapshotDone, key, SnapshotPNG(display_list, size, labels))
+        worker = threading.Thread(target=_encode)
+        worker.setDaemon(True)
+        worker.start()
+
+    def SnapshotDone(self, key, png):
+        serial, size = key
+        self.snapshots[size] = (serial, png)
+        return self.Deliver(self.waiting.pop(key), png)
+
+    def Deliver(self, callbacks, png):
+        for callback in callbacks:
+            callback(png)
+        # idle callback: do not repeat
+        return False
+
+    def Thumbnail(self, size=P.THUMBNAIL_SIZE):
+        """
+        capture the canvas as a PNG string, as Snapshot() does, but
+        encode it right away and return it
+        """
+        cached = self.snapshots.get(size)
+        if not (cached and cached[0] == self.serial):
+            display_list = self.DisplayList()
+            cached = self.snapshots[size] = (self.serial, SnapshotPNG(display_list, size,
+                                                                      SnapshotLabels(display_list, size)))
+        return cached[1]
+
+class WidgetPool(object):
+    """
+    widgets taken off the canvas are hidden and kept for reuse, rather than
+    destroyed, so that a new problem does not have to create their
+    X windows and pixmaps again
+
+    a reusable widget has a pool_key attribute: widgets with the same key
+    are interchangeable
+    """
+    def __init__(self, canv):
+        self.canv = canv
+        # pool_key -> list of hidden widgets
+        self.free = {}
+
+    def Get(self, key):
+        """
+        return a hidden widget with the specified key (None if there is none)
+        """
+        widgets = self.free.get(key)
+        if not widgets:
+            return None
+        widget = widgets.pop()
+        widget.pooled = False
+        widget.set_no_show_all(False)
+
+        # a reused window may be underneath newer ones: bring it to the top,
+        # as if it were new
+        if widget.window and not widget.flags() & gtk.NO_WINDOW:
+            widget.window.raise_()
+        return widget
+
+    def Put(self, widget, x, y):
+        """
+        place a widget, new or reused, on the canvas
+        """
+        if widget.parent:
+            self.canv.move(widget, x, y)
+        else:
+            self.canv.put(widget, x, y)
+
+    def Recycle(self, widget):
+        """
+        take a widget off the canvas: keep it, if it is reusable,
+        otherwise destroy it
+        """
+        if getattr(widget, "pooled", False):
+            return
+
+        # block: drop its dragging callbacks
+        if hasattr(widget, "block"):
+            widget.block.DisableDrag()
+
+        key = getattr(widget, "pool_key", None)
+        if key is None:
+            widget.destroy()
+            return
+
+        # keep it hidden, even when the main window does show_all()
+        widget.hide_all()
+        widget.set_no_show_all(True)
+        widget.pooled = True
+        self.free.setdefault(key, []).append(widget)
+
 class CtrlPanel(gtk.Frame):
     """
     input fields, labels, and buttons at bottom of BlockHead window
     """
     # offsets into buttons list
-    DRAW, NEW, HELP, EXIT = range(4)
+    DRAW, NEW, HINT, CHECK, HELP, EXIT = range(6)
     # offsets into entries/labels lists
     N1, N2, ANS = range(3)
 
@@ -316,11 +848,13 @@ class CtrlPanel(gtk.Frame):
         self.algn_equ.add(equ)
 
         # control buttons
-        self.ctrlbtns = [None, None, None, None]
+        self.ctrlbtns = [None, None, None, None, None, None]
         self.ctrlbtns[self.DRAW] = gtk.Button("Draw Blocks")
         self.ctrlbtns[self.DRAW].connect("clicked", self.DrawBlocksCmd)
         self.ctrlbtns[self.NEW] = gtk.Button("New")
         self.ctrlbtns[self.NEW].connect("clicked", self.NewCmd)
+        self.ctrlbtns[self.HINT] = gtk.Button("Hint")
+        self.ctrlbtns[self.HINT].connect("clicked", self.HintCmd)
         if P.EXIT_ENABLE:
             self.ctrlbtns[self.EXIT] = gtk.Button("Exit")
             self.ctrlbtns[self.EXIT].connect("clicked", gtk.main_quit)
@@ -331,6 +865,11 @@ class CtrlPanel(gtk.Frame):
             self.ctrlbtns[self.HELP].connect("clicked", self.HelpCmd)
         else:
             del self.ctrlbtns[self.HELP]
+        if P.CHECK_ENABLE:
+            self.ctrlbtns[self.CHECK] = gtk.Button("Check")
+            self.ctrlbtns[self.CHECK].connect("clicked", self.CheckCmd)
+        else:
+            del self.ctrlbtns[self.CHECK]
 
         # font settings
         for wgt in (self.entries + self.entry_labels):
@@ -445,17 +984,74 @@ class CtrlPanel(gtk.Frame):
 
         HelpWin.Update()
 
+    @TRACE.Traced("HintCmd")
+    def HintCmd(self, _btn="not used"):
+        """
+        highlight the next useful move
+        """
+        ShowHint()
+
+    @TRACE.Traced("CheckCmd")
+    def CheckCmd(self, _btn="not used"):
+        """
+        ask for the student's own written answer to the current problem,
+        and explain any carry/borrow mistakes in it
+        """
+        operands = [self.entries[i].get_text() for i in (self.N1, self.N2)]
+        if not all(operands):
+            ShowMessage("Enter two numbers first.")
+            return
+
+        operator = E.ADD_OP if Mode == P.ADD_MODE else E.SUBTRACT_OP
+        problem = "%s %s %s" % (operands[0], operator, operands[1])
+
+        # dialog with an entry field for the answer
+        # (in Sugar, MainWin is a frame inside the activity window)
+        dlg = gtk.Dialog("Check My Answer", MainWin.get_toplevel(),
+                         gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT,
+                         (gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL, gtk.STOCK_OK, gtk.RESPONSE_OK))
+        dlg.set_default_response(gtk.RESPONSE_OK)
+        ent = gtk.Entry(max=P.COL_COUNT+1)
+        ent.set_activates_default(True)
+        dlg.vbox.pack_start(gtk.Label("Your answer to %s:" % problem))
+        dlg.vbox.pack_start(ent)
+        dlg.show_all()
+        response = dlg.run()
+        answer = ent.get_text()
+        dlg.destroy()
+
+        if response != gtk.RESPONSE_OK or not answer:
+            return
+
+        try:
+            mistakes = ExplainAnswer(operands[0], operator, operands[1], answer, P.BASE)
+        except ValueError, exc_data:
+            ShowMessage("Cannot check %s: %s" % (problem, exc_data))
+            return
+
+        if mistakes:
+            ShowMessage("%s = %s is not right. You probably:\n%s"
+                        % (problem, answer, "\n".join(msg for _, _, msg in mistakes)))
+        else:
+            ShowMessage("%s = %s is right!" % (problem, answer))
+
+    @TRACE.Traced("NewCmd")
     def NewCmd(self, _btn="not used"):
         """
         start over
         """
-        # empty the canvas
+        global Num1, Num2, NumA
+
+        ClearHint()
+        Num1 = Num2 = NumA = None
+        del CarryColumns[:]
+        del ChangedColumns[:]
+        del ArrowColumns[:]
+        del RegroupColumns[:]
+
+        # empty the canvas, keeping widgets for the next problem
         for obj in Bpnl.canv.get_children():
-            try:
-                obj.destroy()
-            except Exception, exc_data: # ?? what kinds of exceptions can be raised?
-                print "exception in NewCmd():", exc_data
-                pass
+            Bpnl.pool.Recycle(obj)
 
         # reinit entry fields, reset focus
         for ent in self.entries:
@@ -474,6 +1070,7 @@ class CtrlPanel(gtk.Frame):
         # continue with mode-specific initialization
         InitializeMode()
 
+    @TRACE.Traced("DrawBlocksCmd")
     def DrawBlocksCmd(self, _btn="not used"):
         """
         get values from Entry fields
@@ -517,14 +1114,14 @@ class CtrlPanel(gtk.Frame):
                           bottomY)
 
             # enable borrow buttons (maybe)
-            DrawBorrowButtons()
+            UpdateArrows()
 
         # disable buttons and entry fields
         for obj in [self.ctrlbtns[self.DRAW], self.opbtn] + self.entries:
             obj.set_sensitive(False)
 
         # update panel
-        Bpnl.canv.show_all()
+        CommitLayout()
 
     def ValidateInput(self, fld, event):
         """
@@ -573,6 +1170,8 @@ class Number(object):
         self.centerX = x
         # Y-coordinate of bottom of column-set
         self.bottomY = y
+        # indexes of columns that still contain blocks to be dragged
+        self.pending = set()
         self.columns = self.InitColumns(P.COL_COUNT)
         self.InitBlocks()
 
@@ -609,11 +1208,18 @@ class Number(object):
 
             # column total
             # flush left on column, since label width == column width
-            Bpnl.canv.put(col.total_label, col.x, col.y + P.TOTAL_OFFSET)
+            Bpnl.pool.Put(col.total_label, col.x, col.y + P.TOTAL_OFFSET)
 
         # record list in attribute
         return col_list
 
+    def PendingColumn(self):
+        """
+        return the rightmost column that still contains blocks to be dragged
+        (None if there is no such column)
+        """
+        return self.columns[min(self.pending)] if self.pending else None
+
     def InitBlocks(self):
         """
         create Block objects in each Column of self.columns list,
@@ -647,10 +1253,6 @@ class Number(object):
             if not isinstance(self, AnswerNumber):
                 blk.EnableDrag()
 
-            #DbgPrint("before initial show", tuple(blk.drag_wgt.allocation))
-            col.ShowBlocks()
-            #DbgPrint("after initial show", tuple(blk.drag_wgt.allocation))
-
 class AnswerNumber(Number):
     """
     a Number object to be used as the answer
@@ -663,6 +1265,8 @@ class AnswerNumber(Number):
         self.centerX = x
         # Y-coordinate of bottom of column-set
         self.bottomY = y
+        # answer blocks are never dragged, so this remains empty
+        self.pending = set()
         self.columns = (self.InitColumns(P.COL_COUNT+1)
                         if Mode == P.ADD_MODE else
                         self.InitColumns(P.COL_COUNT))
@@ -678,6 +1282,7 @@ class Column():
         """
         initialize a column, either input or answer
         """
+        self.colnumber = colnumber
         self.color = P.COLUMN_PIXEL_COLORS[colnumber]
 
         # list of Block objects in this column
@@ -689,10 +1294,14 @@ class Column():
         # will be filled in by Column.Draw()
         self.image = None
 
-        self.total_label = gtk.Label()
-        self.total_label.modify_font(P.FONT)
-        self.total_label.set_size_request(P.COL_WID, P.TOTAL_LABEL_HGT)
-        self.total_label.set_alignment(0.5, 0.5)
+        self.total_label = Bpnl.pool.Get(("label",))
+        if not self.total_label:
+            self.total_label = gtk.Label()
+            self.total_label.modify_font(P.FONT)
+            self.total_label.set_size_request(P.COL_WID, P.TOTAL_LABEL_HGT)
+            self.total_label.set_alignment(0.5, 0.5)
+            self.total_label.pool_key = ("label",)
+        self.total_label.set_text("")
         self.total_label.show()
 
     def Index(self):
@@ -700,7 +1309,7 @@ class Column():
         return index within Number.columns
         (to indicate ones column, tens column, etc.)
         """
-        return self.number_obj.columns.index(self)
+        return self.colnumber
 
     def UpperLeft(self):
         """
@@ -713,15 +1322,20 @@ class Column():
         """
         draw a column
         """
-        # sized image
-        img = gtk.Image()
-        img.set_size_request(P.COL_WID, P.COL_HGT)
-
-        # color it in
+        key = ("column", self.color)
+        img = Bpnl.pool.Get(key)
+        if not img:
+            # sized image
+            img = gtk.Image()
+            img.set_size_request(P.COL_WID, P.COL_HGT)
+            img.pool_key = key
+
+        # color it in (a reused column may have been left as a drop target)
         PixelFill(img, self.color)
 
         # place column on canvas (gtk.Fixed)
-        Bpnl.canv.put(img, *self.UpperLeft())
+        Bpnl.pool.Put(img, *self.UpperLeft())
+        img.show()
 
         # cross-register gtk.Image and app's Column object
         self.image = img
@@ -744,43 +1358,50 @@ class Column():
         remove the specified block from this column
         """
         self.blocks.remove(blk)
+        if not self.blocks:
+            self.number_obj.pending.discard(self.colnumber)
+        self.Changed()
 
-    def PlaceBlock(self, blk, carry_button_suppress=False):
+    def Clear(self):
         """
-        send an existing block to this column
+        remove all the blocks from this column, taking their widgets off the canvas
         """
-        # carry_button_suppress is needed when creating a P.BASE-size ("filled") block
-        # during execution of Carry() method
-
-        global CarryCount
+        for blk in self.blocks:
+            Bpnl.pool.Recycle(blk.drag_wgt)
+        self.blocks = []
+        self.Changed()
 
-        # save current column total, before adding new block
-        old_total = self.Total()
+    def Changed(self):
+        """
+        change notification: the column's blocks have changed, lay it out
+        at the next CommitLayout(), and recheck its arrows at the next
+        UpdateArrows()
+        """
+        if self not in ChangedColumns:
+            ChangedColumns.append(self)
+        if self not in ArrowColumns:
+            ArrowColumns.append(self)
 
+    def PlaceBlock(self, blk):
+        """
+        send an existing block to this column
+        (a carry arrow, if needed, is created by UpdateArrows())
+        """
         # cross-register Block and Column objects
         self.blocks.append(blk)
         blk.column = self
+        self.Changed()
 
-        # SUB: maybe we're done
-        if Mode == P.SUBTRACT_MODE or blk.value == 0:
-            return
-
-        # ADD maybe create carry arrow
-        if self.Total() >= P.BASE and not carry_button_suppress and not self.carryarrow:
-            self.carryarrow = gtk.Button()
-            self.carryarrow.set_image(gtk.image_new_from_pixbuf(Pix[P.CARRY]))
-            Bpnl.canv.put(self.carryarrow,
-                           self.x + P.ARROW_OFFSET[0],
-                           self.y + P.ARROW_OFFSET[1])
-            self.carryarrow.connect("clicked", self.Carry)
-            self.carryarrow.hide_all()
-            CarryCount += 1
-            DbgPrint("Created carry arrow:", self.carryarrow)
+        # blocks of the input numbers are waiting to be dragged
+        if not isinstance(self.number_obj, AnswerNumber):
+            self.number_obj.pending.add(self.colnumber)
 
+    @TRACE.Traced("Column.ShowBlocks")
     def ShowBlocks(self):
         """
-        display the column's blocks
+        lay out the column: display the column's blocks
         display the total of the blocks in a label below the column
+        (shown on the screen at the end of CommitLayout())
         """
         # calculation of total is always performed in base-10
         total = 0
@@ -791,14 +1412,11 @@ class Column():
                # first, adjust upward by height of block
                # second, adjust upward to account for earlier blocks in this column
                self.y - (blk.value * P.UNIT_HGT) - (total * P.UNIT_HGT))
+            blk.drag_wgt.show_all()
 
             # update column total
             total += blk.value
 
-        # maybe: carry arrow
-        if self.carryarrow:
-            self.carryarrow.show_all()
-
         # convert total value to string, using P.BASE, and display it
 
         ## single digit
@@ -812,65 +1430,65 @@ class Column():
         self.total_label.set_text(strval)
         self.total_label.show()
 
-        # display new column configuration: blocks, carry arrow, and total label
-        UpdateScreen()
-
     def Total(self):
         """
         base-10 total of column's blocks
         """
         return sum([blk.value for blk in self.blocks])
 
+    @TRACE.Traced("Column.Carry")
     def Carry(self, event):
         """
         calculate carry for specified column
         btn = ID of dynamically-created carry button, to be deleted
         """
-        global CarryCount
+        ClearHint()
 
         srccol = self
         destcol = srccol.ColumnToLeft()
+        RegroupColumns.extend([srccol, destcol])
 
         # delete carry arrow
-        srccol.carryarrow.destroy()
+        Bpnl.pool.Recycle(srccol.carryarrow)
         srccol.carryarrow = None
-        CarryCount -= 1
+        CarryColumns.remove(srccol)
 
         # save total value of blocks, for creation of new blocks
         total = srccol.Total()
 
         # clear out all the blocks in this column
-        for blk in srccol.blocks:
-            blk.DisableDrag()
-            blk.drag_wgt.destroy()
-        srccol.blocks = []
+        srccol.Clear()
 
         # "full-column" block -- P.BASE units
-        fullblk = Block(P.BASE, srccol, carry_button_suppress=True)
+        fullblk = Block(P.BASE, srccol)
         #DbgPrint("before carry add:", tuple(fullblk.drag_wgt.allocation))
         #DbgPrint("after carry add:", tuple(fullblk.drag_wgt.allocation))
 
         # "excess" block (1+ units)
-        excessblk = (Block(total - P.BASE, srccol, carry_button_suppress=True)
+        excessblk = (Block(total - P.BASE, srccol)
                      if total > P.BASE else
                      None)
 
-        srccol.ShowBlocks()
-        sleep(P.PAUSE)
+        CommitLayout()
+        TRACE.Sleep(P.PAUSE)
 
         # collapse the block of P.BASE units into a single unit
         # TBD: change the color to that of the "carry-to" column
-        pbufs = fullblk.GenScaledPixbufs(P.ADD_MODE)
-
-        for smaller_pbuf in pbufs:
-            sleep(P.SHRINK_EXPAND_DELAY)
-            eventbox = fullblk.drag_wgt
-            # get rid of old image, add new one
-            eventbox.remove(eventbox.get_child())
-            eventbox.add(gtk.image_new_from_pixbuf(smaller_pbuf))
-            # show animation step
-            UpdateScreen()
-        sleep(P.PAUSE)
+
+        # its image will be replaced: not reusable
+        eventbox = fullblk.drag_wgt
+        eventbox.pool_key = None
+        frames = ShrinkFrames(fullblk.color)
+        for i in PacedFrames(len(frames), P.SHRINK_EXPAND_DELAY * P.FULL_SHRINK_FRAMES):
+            with TRACE.Span("Carry.shrink_frame"):
+                # get rid of old image, add new one
+                smaller_pbuf, smaller_pmap = frames[i-1]
+                eventbox.sprite = smaller_pbuf
+                eventbox.remove(eventbox.get_child())
+                eventbox.add(FrameImage(smaller_pmap))
+                # show animation step
+                CommitLayout()
+        TRACE.Sleep(P.PAUSE)
 
         # move the shrunken (1-unit-high) block to the next column
         AniMove(fullblk.drag_wgt,
@@ -879,7 +1497,7 @@ class Column():
 
         # dest column: replace shrunken P.BASE-unit block with 1-unit "carry block"
         Block(1, destcol)
-        destcol.ShowBlocks()
+        CommitLayout()
 
         # drop the "excess block" into position
         if excessblk:
@@ -888,85 +1506,62 @@ class Column():
                     srccol.y - excessblk.value * P.UNIT_HGT)
 
         # source column: delete the "full-column" block, and update column total
-        fullblk.drag_wgt.destroy()
+        Bpnl.pool.Recycle(fullblk.drag_wgt)
         srccol.Remove(fullblk)
-        srccol.ShowBlocks()
+        CommitLayout()
+        RegroupColumns.remove(srccol)
+        RegroupColumns.remove(destcol)
+        UpdateArrows()
 
         # are we done?
         CalcAnswer()
 
+    @TRACE.Traced("Column.Borrow")
     def Borrow(self, event):
         """
         borrow 1 unit FROM this column:
         send P.BASE units to the column to the right
         """
-        # can we borrow from this column?
-        # if not, first borrow from column to the left
-        if self.Total() == 0:
-            self.ColumnToLeft().Borrow(event)
-            sleep(P.PAUSE)
-
-        srccol = self
-        destcol = srccol.ColumnToRight()
-        srccol_index = srccol.Index()
-
-        # decompose last block in this column (ex: 8 --> 7+1)
-        original_blk = srccol.blocks[-1]
-
-        # delete the topmost block from this column
-        original_blk.drag_wgt.destroy()
-        srccol.Remove(original_blk)
-
-        # delete the borrow arrow
-        if srccol.borrowarrow:
-            srccol.borrowarrow.destroy()
-            srccol.borrowarrow = None
-
-        # create block of size N-1, to be left behind in this column
-        if original_blk.value > 1:
-            remaining_blk = Block(original_blk.value-1, srccol)
-            srccol.ShowBlocks()
-
-        # create block of size 1, which will get borrowed
-        borrow_blk = Block(1, srccol)
-        srccol.ShowBlocks()
-
-        # at GTK level, move the unexpanded (1-unit-high) block to next column
-        top_of_destblock_Y = destcol.y - destcol.Total()*P.UNIT_HGT
-        AniMove(borrow_blk.drag_wgt,
-                destcol.x + P.BLOCK_PAD,
-                top_of_destblock_Y - 1*P.UNIT_HGT)
-
-        # expand vertically from 1 unit to P.BASE units
-        newblk_color = P.BLOCK_PIXEL_COLORS[self.Index()-1]
-        eventbox = borrow_blk.drag_wgt
-        for i in range(1, P.BASE+1):
-            sleep(P.SHRINK_EXPAND_DELAY)
-            eventbox.remove(eventbox.get_child())
-            img, _ = CreateBlockImage(i, newblk_color, borrow_block_flag=True)
-            eventbox.add(img)
-            Bpnl.canv.move(eventbox,
-                eventbox.allocation.x,
-                top_of_destblock_Y - i*P.UNIT_HGT)
-            # show animation step
-            UpdateScreen()
+        ClearHint()
 
-        # at application level, replace "borrow from" block in source column ...
-        borrow_blk.drag_wgt.destroy()
-        srccol.Remove(borrow_blk)
-        srccol.ShowBlocks()
-        # ... with "borrow to" block in destination column
-        Block(P.BASE, destcol)
-        destcol.ShowBlocks()
+        # can we borrow from this column?
+        # if not, first borrow from the columns to the left: plan the
+        # chain of borrows up front, from the nearest non-empty column
+        chain = [self]
+        while chain[-1].Total() == 0:
+            chain.append(chain[-1].ColumnToLeft())
+        chain.reverse()
+
+        # delete the borrow arrows
+        for srccol in chain:
+            if srccol.borrowarrow:
+                Bpnl.pool.Recycle(srccol.borrowarrow)
+                srccol.borrowarrow = None
+
+        destcol = self.ColumnToRight()
+        RegroupColumns.extend(chain + [destcol])
+        if P.BORROW_COLLAPSE and len(chain) > P.BORROW_COLLAPSE:
+            # collapse the chain: each empty column gets the P.BASE-1 units
+            # it keeps at once, and a single block moves all the way
+            for col in chain[1:]:
+                Block(P.BASE-1, col)
+            hops = [(chain[0], destcol, P.BASE)]
+        else:
+            # each empty column keeps P.BASE-1 of the P.BASE units it borrows
+            hops = [(srccol, nextcol, P.BASE-1) for srccol, nextcol in zip(chain, chain[1:])]
+            hops.append((self, destcol, P.BASE))
+        PlayBorrows(hops)
+        for col in chain + [destcol]:
+            RegroupColumns.remove(col)
 
         # recalc the borrow buttons
-        DrawBorrowButtons()
+        UpdateArrows()
 
 class Block(object):
     """
     represents one digit of a number
     """
-    def __init__(self, value, colobj, carry_button_suppress=False):
+    def __init__(self, value, colobj):
         self.value = value
         self.column = colobj
         self.color = P.BLOCK_PIXEL_COLORS[self.column.Index()]
@@ -979,25 +1574,29 @@ class Block(object):
         if self.value == 0:
             return
 
-        # event box with sized image
-        ebox = gtk.EventBox()
-        # self.pmap to be used by GenScaledPixbufs()
-        img, self.pmap = CreateBlockImage(self.value, self.color)
-        ebox.add(img)
+        # event box with sized image (reused, if possible)
+        key = ("block", self.value, self.color)
+        ebox = Bpnl.pool.Get(key)
+        if not ebox:
+            ebox = gtk.EventBox()
+            ebox.add(CreateBlockImage(self.value, self.color))
+            ebox.pool_key = key
+        # client-side source of the block's pixels (for snapshots)
+        ebox.sprite = self.sprite = BlockSprite(self.value, self.color)
 
         # cross-link draggable gtk.EventBox widget and app's Block object
         ebox.block = self
         self.drag_wgt = ebox
 
         # put the image in upper left corner, but make it invisible
-        Bpnl.canv.put(self.drag_wgt, 0, 0)
+        Bpnl.pool.Put(self.drag_wgt, 0, 0)
         self.drag_wgt.hide_all()
 
         # allocate list for dragging callback IDs
         self.callback_ids = []
 
         # add the Block to the specified Column
-        self.column.PlaceBlock(self, carry_button_suppress)
+        self.column.PlaceBlock(self)
 
     def UpperLeft(self):
         """
@@ -1007,33 +1606,6 @@ class Block(object):
         alloc = self.drag_wgt.allocation
         return (alloc.x, alloc.y)
 
-    def GenScaledPixbufs(self, mode):
-        """
-        generate a set of scaled Pixbufs for this block,
-        in decreasing size
-        """
-        # set the target vertical scaling factor
-        start = 1.0
-        end = 1.0/P.BASE if mode == P.ADD_MODE else 1.0*P.BASE
-
-        mysize = (P.BLOCK_WID, self.value * P.UNIT_HGT)
-        img = gtk.Image()
-        img.set_size_request(*mysize)
-        orig_pbuf = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, *mysize)
-        # initialize Pixbuf to original image, which was stored as a Pixmap
-        orig_pbuf.get_from_drawable(self.pmap, img.get_colormap(), 0, 0, 0, 0, *mysize)
-
-        # generator loop: yield a series of Pixbufs, of decreasing size
-        x0, y0 = mysize
-        count = 12
-        # "sf" is scale factor
-        for sf in (end*(1.0*i/count) + start*(1-1.0*i/count) for i in range(1, count+1)):
-            # scale vertically, but not horizontally
-            y = int(sf * y0)
-            newpbuf = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, x0, y)
-            orig_pbuf.scale(newpbuf, 0,0, x0,y, 0,0, 1.0,sf, gtk.gdk.INTERP_BILINEAR)
-            yield newpbuf
-
     def EnableDrag(self):
         """
         make block draggable
@@ -1054,12 +1626,15 @@ class Block(object):
 ### functions
 ###
 
+@TRACE.Traced("BlockClicked")
 def BlockClicked(widget, context):
     """
     callback: mouse clicked on a Block
     """
     global SnapX, SnapY, ClickX, ClickY, TargetColumn
 
+    ClearHint()
+
     alloc = widget.allocation
     # global (SnapX, SnapY) is location of Block when first clicked
     SnapX = alloc.x
@@ -1077,6 +1652,7 @@ def BlockClicked(widget, context):
     #DbgPrint("widget allocation: (%d,%d) width=%d, height=%d" % (SnapX, SnapY, alloc.width, alloc.height))
     #DbgPrint("offset within widget: (%d,%d)" % (ClickX, ClickY))
 
+@TRACE.Traced("MoveBlock")
 def MoveBlock(widget, context):
     """
     callback: dragging a Block
@@ -1108,6 +1684,7 @@ def MoveBlock(widget, context):
         PixelFill(TargetColumn.image, TargetColumn.color)
         DropOk = False
 
+@TRACE.Traced("DropBlock")
 def DropBlock(widget, context):
     """
     callback: mouse released on a Block being dragged
@@ -1148,9 +1725,8 @@ def DropBlock_Sub(widget):
         AniMove(widget, endX, endY)
 
         # delete block from original column
-        blk.drag_wgt.destroy()
+        Bpnl.pool.Recycle(blk.drag_wgt)
         origcol.Remove(blk)
-        origcol.ShowBlocks()
 
         ##
         ## process result
@@ -1158,18 +1734,15 @@ def DropBlock_Sub(widget):
         result = current_value - sub_value
 
         # clear target column
-        for blk in TargetColumn.blocks:
-            blk.DisableDrag()
-            blk.drag_wgt.destroy()
-        TargetColumn.blocks = []
+        TargetColumn.Clear()
 
-        # create result block (maybe) and show value
+        # create result block (maybe); show both columns
         if result > 0:
             blk = Block(result, TargetColumn)
-        TargetColumn.ShowBlocks()
+        CommitLayout()
 
         # recalc the borrow buttons
-        DrawBorrowButtons()
+        UpdateArrows()
 
     else:
         # snap back
@@ -1201,34 +1774,338 @@ def DropBlock_Add(widget):
         blk.DisableDrag()
 
         # show results
-        origcol.ShowBlocks()
-        TargetColumn.ShowBlocks()
+        CommitLayout()
+        UpdateArrows()
 
     else:
         # snap back
         AniMove(widget, SnapX, SnapY)
 
+@TRACE.Traced("AniMove")
 def AniMove(widget, endX, endY):
     """
     animate the move of a widget from current position to (endX,endY)
     """
-    origX = widget.allocation.x
-    origY = widget.allocation.y
-    count = 12
-    for i in range(1, count+1):
-        sleep(P.IN_COL/count)
-        # set progress factor, and move a little
-        pf = i * 1.0 / count
-        widget.parent.move(widget,
-                           int(pf*endX + (1-pf)*origX),
-                           int(pf*endY + (1-pf)*origY))
-        # show animation step
-        UpdateScreen()
+    AniMoveAll([(widget, endX, endY)])
+
+def AniMoveAll(moves):
+    """
+    animate several moves at the same time, sharing each frame
+    moves = list of (widget, endX, endY)
+    """
+    origins = [(widget.allocation.x, widget.allocation.y) for widget, _, _ in moves]
+    count = P.MOVE_FRAMES
+    for i in PacedFrames(count, P.IN_COL):
+        with TRACE.Span("AniMove.frame"):
+            # set progress factor, and move a little
+            pf = i * 1.0 / count
+            for (widget, endX, endY), (origX, origY) in zip(moves, origins):
+                widget.parent.move(widget,
+                                   int(pf*endX + (1-pf)*origX),
+                                   int(pf*endY + (1-pf)*origY))
+            # show animation step
+            CommitLayout()
 
     # final move, to take care of roundoff errors
-    widget.parent.move(widget, endX, endY)
+    for widget, endX, endY in moves:
+        widget.parent.move(widget, endX, endY)
     # pause for effect
-    sleep(P.PAUSE)
+    TRACE.Sleep(P.PAUSE)
+
+@TRACE.Traced("CarryAll")
+def CarryAll(_btn="not used"):
+    """
+    perform every pending carry, and every carry they cause, in one pass
+
+    the columns that have overflowed carry at the same time, sharing each
+    animation frame (see CarryWave()); a column that overflows when a
+    carry arrives carries in the next wave
+    """
+    ClearHint()
+
+    # a column that overflows between waves is carried by the next one,
+    # not given an arrow
+    RegroupColumns.extend(NumA.columns)
+    wave = sorted(CarryColumns, key=Column.Index)
+    while wave:
+        wave = [col for col in CarryWave(wave) if col.Total() >= P.BASE]
+    for col in NumA.columns:
+        RegroupColumns.remove(col)
+
+    UpdateArrows()
+    CalcAnswer()
+
+def CarryWave(wave):
+    """
+    carry from each of the (overflowed) columns in the list at the same time,
+    as Column.Carry() does for one column
+    return the columns carried to
+    """
+    carries = []
+    for srccol in wave:
+        # delete carry arrow (a column that overflowed during CarryAll() has none)
+        if srccol.carryarrow:
+            Bpnl.pool.Recycle(srccol.carryarrow)
+            srccol.carryarrow = None
+            CarryColumns.remove(srccol)
+
+        # replace the column's blocks with a "full-column" block of P.BASE
+        # units, and an "excess" block (maybe)
+        total = srccol.Total()
+        srccol.Clear()
+        fullblk = Block(P.BASE, srccol)
+        excessblk = (Block(total - P.BASE, srccol)
+                     if total > P.BASE else
+                     None)
+
+        # its image will be replaced: not reusable
+        fullblk.drag_wgt.pool_key = None
+        carries.append((srccol, fullblk, excessblk))
+
+    CommitLayout()
+    TRACE.Sleep(P.PAUSE)
+
+    # collapse all the blocks of P.BASE units into single units
+    frames = [ShrinkFrames(blk.color) for _, blk, _ in carries]
+    for i in PacedFrames(P.SHRINK_FRAMES, P.SHRINK_EXPAND_DELAY * P.FULL_SHRINK_FRAMES):
+        with TRACE.Span("CarryAll.shrink_frame", columns=len(carries)):
+            for (_, fullblk, _), full_frames in zip(carries, frames):
+                eventbox = fullblk.drag_wgt
+                smaller_pbuf, smaller_pmap = full_frames[i-1]
+                eventbox.sprite = smaller_pbuf
+                eventbox.remove(eventbox.get_child())
+                eventbox.add(FrameImage(smaller_pmap))
+            # show animation step
+            CommitLayout()
+    TRACE.Sleep(P.PAUSE)
+
+    # move the shrunken blocks to the next columns, and drop the "excess" blocks
+    moves = []
+    for srccol, fullblk, excessblk in carries:
+        destcol = srccol.ColumnToLeft()
+        # land on the blocks the next column keeps after its own carry (if any)
+        kept = destcol.Total()
+        if destcol in wave:
+            kept -= P.BASE
+        moves.append((fullblk.drag_wgt,
+                      destcol.x + P.BLOCK_PAD,
+                      destcol.y - (kept + 1) * P.UNIT_HGT))
+        if excessblk:
+            moves.append((excessblk.drag_wgt,
+                          srccol.x + P.BLOCK_PAD,
+                          srccol.y - excessblk.value * P.UNIT_HGT))
+    AniMoveAll(moves)
+
+    # replace each shrunken block with a 1-unit "carry block" in the next column
+    for srccol, fullblk, _ in carries:
+        Bpnl.pool.Recycle(fullblk.drag_wgt)
+        srccol.Remove(fullblk)
+        Block(1, srccol.ColumnToLeft())
+    CommitLayout()
+
+    return [srccol.ColumnToLeft() for srccol, _, _ in carries]
+
+def PlayBorrows(hops):
+    """
+    play a chain of borrows as one pipelined animation: in each round, a
+    1-unit block moves to the next column while the block that arrived
+    in the round before expands, so the stages of neighbouring borrows
+    overlap
+    hops = list of (srccol, destcol, units), leftmost first: the first
+    srccol is not empty, each later one is the destcol of the hop before;
+    the block that arrives in destcol expands to units
+
+    blocks in flight are kept out of the columns' blocks until the round
+    that expands them ends, so no column total shows a half-done borrow
+    """
+    # bottom of each expansion, before any block arrives
+    bottoms = [destcol.y - destcol.Total()*P.UNIT_HGT for _, destcol, _ in hops]
+
+    # decompose last block in the first column (ex: 8 --> 7+1)
+    srccol = hops[0][0]
+    borrow_orig_blk = srccol.blocks[-1]
+    borrow_val = borrow_orig_blk.value
+    Bpnl.pool.Recycle(borrow_orig_blk.drag_wgt)
+    srccol.Remove(borrow_orig_blk)
+    if borrow_val > 1:
+        Block(borrow_val-1, srccol)
+    moving = Block(1, srccol)
+    arrived = None
+    CommitLayout()
+    TRACE.Sleep(P.PAUSE)
+
+    for h in range(len(hops) + 1):
+        move = expand = None
+        if h < len(hops):
+            srccol, destcol, _ = hops[h]
+            move = (moving, destcol.x + P.BLOCK_PAD, bottoms[h] - 1*P.UNIT_HGT)
+        if arrived:
+            _, prevcol, units = hops[h-1]
+            frames = ExpandFrames(P.BLOCK_PIXEL_COLORS[prevcol.Index()])[:units]
+            expand = (arrived, frames, bottoms[h-1])
+        BorrowRound(move, expand)
+
+        # at application level, replace the expanded block with a block
+        # of its units ...
+        if arrived:
+            Bpnl.pool.Recycle(arrived.drag_wgt)
+            Block(units, prevcol)
+        # ... and take the moved block out of the column it left (it is
+        # added to its new column when it has expanded); unless it is the
+        # last, that column lends 1 unit to the next column, starting from
+        # the column's bottom
+        arrived = None
+        if move:
+            if moving in srccol.blocks:
+                srccol.Remove(moving)
+            arrived = moving
+            if h+1 < len(hops):
+                moving = Block(1, destcol)
+                destcol.Remove(moving)
+                Bpnl.pool.Put(moving.drag_wgt, destcol.x + P.BLOCK_PAD, bottoms[h] - 1*P.UNIT_HGT)
+                moving.drag_wgt.show_all()
+        CommitLayout()
+
+def BorrowRound(move, expand):
+    """
+    one round of PlayBorrows(): move a 1-unit block, and expand another,
+    at the same time, sharing each frame
+    move = (Block, endX, endY) or None
+    expand = (Block, frames of 1, 2, ... units, bottom y-coord) or None
+    """
+    count = duration = 0
+    shown = 1
+    if move:
+        blk, endX, endY = move
+        widget = blk.drag_wgt
+        origX, origY = widget.allocation.x, widget.allocation.y
+        count, duration = P.MOVE_FRAMES, P.IN_COL
+    if expand:
+        blk, frames, bottomY = expand
+        eventbox = blk.drag_wgt
+        # its image will be replaced: not reusable
+        eventbox.pool_key = None
+        count = max(count, len(frames))
+        duration = max(duration, P.SHRINK_EXPAND_DELAY * len(frames))
+
+    for i in PacedFrames(count, duration):
+        with TRACE.Span("Borrow.frame"):
+            if move:
+                # set progress factor, and move a little
+                pf = i * 1.0 / count
+                widget.parent.move(widget,
+                                   int(pf*endX + (1-pf)*origX),
+                                   int(pf*endY + (1-pf)*origY))
+            # expand vertically, to i/count of the block's final height
+            units = max(1, i * len(frames) // count) if expand else 1
+            if units != shown:
+                shown = units
+                larger_pbuf, larger_pmap = frames[units-1]
+                eventbox.sprite = larger_pbuf
+                eventbox.remove(eventbox.get_child())
+                eventbox.add(FrameImage(larger_pmap))
+                Bpnl.canv.move(eventbox,
+                    eventbox.allocation.x,
+                    bottomY - units*P.UNIT_HGT)
+            # show animation step
+            CommitLayout()
+
+    # final move, to take care of roundoff errors
+    if move:
+        widget.parent.move(widget, endX, endY)
+
+class TimeSpec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+def MonotonicClock():
+    """
+    return a function that reads the monotonic clock (seconds),
+    or time.time, if the C library has no clock_gettime()
+    """
+    try:
+        lib = ctypes.CDLL(ctypes.util.find_library("rt") or ctypes.util.find_library("c"))
+        clock_gettime = lib.clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(TimeSpec)]
+    timespec = TimeSpec()
+    def _monotonic():
+        clock_gettime(P.CLOCK_MONOTONIC, ctypes.byref(timespec))
+        return timespec.tv_sec + timespec.tv_nsec * 1e-9
+    return _monotonic
+
+Monotonic = MonotonicClock()
+
+def PacedFrames(count, duration):
+    """
+    generator: frame numbers (1 to count) of an animation lasting
+    duration seconds; frame N is due (N-1)/count of the way through,
+    and the last frame stays on screen until the end
+
+    a frame that is not drawn before the next one is due is dropped,
+    so the animation keeps its duration on a slow device (the last
+    frame is never dropped)
+    """
+    if duration <= 0:
+        for frame in range(1, count+1):
+            yield frame
+        return
+
+    step = float(duration) / count
+    start = Monotonic()
+    frame = 1
+    while True:
+        yield frame
+        if frame == count:
+            break
+        # the frame that is due now, or the next one
+        frame = min(max(frame + 1, int((Monotonic() - start) / step) + 1), count)
+        wait = start + (frame - 1) * step - Monotonic()
+        if wait > 0:
+            TRACE.Sleep(wait)
+
+    wait = start + duration - Monotonic()
+    if wait > 0:
+        TRACE.Sleep(wait)
+
+def FrameCount(duration, frame_cost, max_frames):
+    """
+    number of frames (at most max_frames) that can be drawn in
+    duration seconds, at frame_cost seconds each
+    """
+    if frame_cost <= 0:
+        return max_frames
+    return max(min(int(duration / frame_cost), max_frames), min(P.MIN_FRAMES, max_frames))
+
+def Calibrate():
+    """
+    time a carry-shrink frame (scaling, and upload to the X server) on
+    this device, and choose the scaling interpolation and the number of
+    animation frames, so that animations take their intended time
+    """
+    sprite = BlockSprite(P.BASE, P.BLOCK_PIXEL_COLORS[0])
+    wid, hgt = sprite.get_width(), sprite.get_height() // 2
+
+    def _frame_cost(interp):
+        costs = []
+        for _ in range(P.CALIBRATION_RUNS):
+            start = Monotonic()
+            ServerPixmap(sprite.scale_simple(wid, hgt, interp))
+            # wait for the X server
+            gtk.gdk.flush()
+            costs.append(Monotonic() - start)
+        return min(costs)
+
+    cost = _frame_cost(gtk.gdk.INTERP_BILINEAR)
+    if cost > P.BILINEAR_BUDGET:
+        P.INTERP = gtk.gdk.INTERP_NEAREST
+        cost = _frame_cost(P.INTERP)
+
+    frame_cost = cost * P.FRAME_COST_FACTOR
+    P.MOVE_FRAMES = FrameCount(P.IN_COL, frame_cost, P.FULL_MOVE_FRAMES)
+    P.SHRINK_FRAMES = FrameCount(P.SHRINK_EXPAND_DELAY * P.FULL_SHRINK_FRAMES,
+                                 frame_cost, P.FULL_SHRINK_FRAMES)
 
 def InTargetColumn(widget):
     """
@@ -1237,13 +2114,35 @@ def InTargetColumn(widget):
     sect_tuple = tuple(widget.allocation.intersect(TargetColumn.image.allocation))
     return True if any(sect_tuple) else False
 
-def PixelFill(image, color_int, wid=P.COL_WID, hgt=P.COL_HGT):
+def PixelFill(image, color_int, wid=None, hgt=None):
     """
     fill in a background image (for a column) with a color, specd as integer
+    (default size: column size, for the current profile)
+    """
+    wid, hgt = wid or P.COL_WID, hgt or P.COL_HGT
+    # client-side source of the image's pixels (for snapshots)
+    image.sprite = FilledPixbuf(color_int, wid, hgt)
+    image.set_from_pixmap(FilledPixmap(color_int, wid, hgt), None)
+
+def FilledPixbuf(color_int, wid, hgt):
     """
-    pbuf = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, wid, hgt)
-    pbuf.fill(color_int)
-    image.set_from_pixbuf(pbuf)
+    a Pixbuf of one color (created once, shared by all images)
+    """
+    key = ("fill", color_int, wid, hgt)
+    if key not in ImageCache:
+        pbuf = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, wid, hgt)
+        pbuf.fill(color_int)
+        ImageCache[key] = pbuf
+    return ImageCache[key]
+
+def FilledPixmap(color_int, wid, hgt):
+    """
+    a Pixmap of one color (copied to the X server once, shared by all images)
+    """
+    key = ("fillmap", color_int, wid, hgt)
+    if key not in ImageCache:
+        ImageCache[key] = ServerPixmap(FilledPixbuf(color_int, wid, hgt))
+    return ImageCache[key]
 
 def DbgPrint(*arglist):
     """
@@ -1254,6 +2153,93 @@ def DbgPrint(*arglist):
             print arg,
         print
 
+class WakeupCounter(gobject.Source):
+    """
+    main-loop source that never fires: it counts the main loop's
+    iterations (one per wakeup), and, with an emission hook, redraws
+    (expose events); once every P.WAKEUP_REPORT_SECS seconds, it prints
+    the wakeups, redraws and CPU time of that interval, per minute
+    """
+    def __init__(self):
+        gobject.Source.__init__(self)
+        self.wakeups = self.redraws = 0
+        gobject.add_emission_hook(gtk.Widget, "expose-event", self.Redraw)
+        self.attach()
+        self.Reset()
+        gobject.timeout_add_seconds(P.WAKEUP_REPORT_SECS, self.Report)
+
+    def prepare(self):
+        self.wakeups += 1
+        # not ready, and no timeout of its own
+        return False, -1
+
+    def check(self):
+        return False
+
+    def dispatch(self, _callback, _args):
+        return True
+
+    def Redraw(self, *_args):
+        self.redraws += 1
+        return True
+
+    def Reset(self):
+        self.start = (self.wakeups, self.redraws, sum(os.times()[:2]), TRACE.SpanCount())
+
+    def Report(self):
+        """
+        timer callback: print the counts, and start a new interval
+        """
+        wakeups, redraws, cpu, spans = self.start
+        per_minute = 60.0 / P.WAKEUP_REPORT_SECS
+        # this timer's own wakeup does not count
+        print >> sys.stderr, "wakeups: %.0f/min, redraws: %.0f/min, CPU: %.3f s/min%s" % (
+            (self.wakeups - wakeups - 1) * per_minute,
+            (self.redraws - redraws) * per_minute,
+            (sum(os.times()[:2]) - cpu) * per_minute,
+            " (idle)" if TRACE.SpanCount() == spans else "")
+        self.Reset()
+        return True
+
+def PowerSave():
+    """
+    should the activity save power? (see P.POWER_SAVE)
+    """
+    setting = os.environ.get(P.POWER_SAVE_ENV)
+    if setting:
+        return setting != "0"
+    for path in glob.glob(P.BATTERY_FILES):
+        if open(path).read().strip() == "Battery":
+            return True
+    return False
+
+def TraceKeyPress(_widget, event):
+    """
+    key chords: Ctrl+Shift+T toggles span tracing,
+    Ctrl+Shift+P toggles the profiler
+    """
+    chord = gtk.gdk.CONTROL_MASK | gtk.gdk.SHIFT_MASK
+    if event.state & chord != chord:
+        return False
+    key = gtk.gdk.keyval_name(event.keyval).upper()
+    if key == P.TRACE_KEY:
+        TRACE.Toggle()
+    elif key == P.PROFILE_KEY:
+        TRACE.ToggleProfile()
+    else:
+        return False
+    return True
+
+def FirstFrame(widget, _event):
+    """
+    first expose of the main window: startup is over
+    """
+    widget.disconnect(widget.first_frame_handler)
+    TRACE.Phase("first_expose")
+    if TRACE.StartupDone():
+        gobject.idle_add(gtk.main_quit)
+    return False
+
 def InitializeMode():
     """
     adjust labels on entry fields for ADD/SUB mode
@@ -1269,26 +2255,178 @@ def InitializeMode():
 
     Cpnl.opbtn.set_property("image", Pix[Mode])
 
-def DrawBorrowButtons():
+@TRACE.Traced("UpdateArrows")
+def UpdateArrows():
+    """
+    create the carry and borrow arrows needed by the columns that changed
+    since the last update (see Column.Changed()), and only those
+
+    an arrow that depends on a column in the middle of a carry or borrow
+    (see RegroupColumns) waits for the update at the end of it, so that
+    it cannot be clicked while the animation (which lets other events,
+    such as a drop, be handled) is still running
+    """
+    deferred = []
+    for col in ArrowColumns:
+        idx = col.Index()
+        if Mode == P.ADD_MODE:
+            if col.number_obj is not NumA:
+                continue
+            # the column's own carry arrow
+            watched = [NumA.columns[idx]]
+        else:
+            # a change to column N of the answer or of the number being
+            # subtracted can only affect the borrow arrow of its left neighbour
+            watched = NumA.columns[idx:idx+2]
+        if [c for c in watched if c in RegroupColumns]:
+            deferred.append(col)
+        elif Mode == P.ADD_MODE:
+            UpdateCarryArrow(col)
+        else:
+            UpdateBorrowArrow(idx)
+    ArrowColumns[:] = deferred
+
+def UpdateCarryArrow(col):
+    """
+    create a carry arrow for an answer column that has overflowed
+    """
+    if col.Total() >= P.BASE and not col.carryarrow:
+        col.carryarrow = ArrowButton(P.CARRY, CarryAll if P.CARRY_ALL else col.Carry,
+                                     col.x + P.ARROW_OFFSET[0],
+                                     col.y + P.ARROW_OFFSET[1],
+                                     P.BLOCK_PIXEL_COLORS[col.Index()])
+        col.carryarrow.show_all()
+        CarryColumns.append(col)
+        DbgPrint("Created carry arrow:", col.carryarrow)
+
+def UpdateBorrowArrow(idx):
+    """
+    create a borrow arrow on answer column idx+1, if column idx
+    needs to borrow from it
+    """
+    # largest column cannot be the "to" of a borrow operation
+    if idx >= P.COL_COUNT-1:
+        return
+    srccol = NumA.columns[idx+1]
+    destcol = NumA.columns[idx]
+
+    # as appropriate, create borrow image and set binding
+    if destcol.Total() <  Num2.columns[idx].Total() and not srccol.borrowarrow:
+        srccol.borrowarrow = ArrowButton(P.BORROW, srccol.Borrow,
+                                         destcol.x + P.ARROW_OFFSET[0],
+                                         destcol.y + P.ARROW_OFFSET[1],
+                                         P.BLOCK_PIXEL_COLORS[idx])
+        srccol.borrowarrow.show_all()
+        DbgPrint("Created borrow arrow:", srccol.borrowarrow)
+
+def ArrowButton(kind, callback, x, y, color):
+    """
+    place a carry or borrow arrow button (reused, if possible) on the canvas
+    kind = P.CARRY or P.BORROW
+    color = block color of the carry/borrow animation,
+    whose frames are rendered in idle time, before the button is clicked
+    """
+    gobject.idle_add(PrerenderFrames, kind, color)
+
+    key = ("arrow", kind)
+    btn = Bpnl.pool.Get(key)
+    if btn:
+        btn.disconnect(btn.clicked_id)
+    else:
+        btn = gtk.Button()
+        btn.set_property("image", gtk.image_new_from_pixmap(*ArrowPixmap(kind)))
+        btn.pool_key = key
+        # client-side source of the arrow's pixels (for snapshots)
+        btn.sprite = Pix[kind]
+    btn.clicked_id = btn.connect("clicked", callback)
+    Bpnl.pool.Put(btn, x, y)
+    return btn
+
+def ArrowPixmap(kind):
+    """
+    (Pixmap, mask) of a carry or borrow arrow image
+    (copied to the X server once, shared by all arrow buttons)
+    """
+    key = ("arrow", P.PROFILE, kind)
+    if key not in ImageCache:
+        ImageCache[key] = Pix[kind].render_pixmap_and_mask(127)
+    return ImageCache[key]
+
+def NextMove():
     """
-    reconfigure borrow buttons for all columns
+    return the widget for the next useful move: a carry arrow, a borrow arrow,
+    or a block to drag (None if there is nothing to do)
+
+    uses the arrows already created by UpdateArrows(),
+    and the columns' pending blocks, so nothing is recalculated
     """
-    # "-1" because largest column cannot be the "to" of a borrow operation
-    for idx in range(P.COL_COUNT-1):
-        srccol = NumA.columns[idx+1]
-        destcol = NumA.columns[idx]
+    if not NumA:
+        return None
 
-        # as appropriate, create borrow image and set binding
-        if destcol.Total() <  Num2.columns[idx].Total() and not srccol.borrowarrow:
-            srccol.borrowarrow = gtk.Button()
-            srccol.borrowarrow.set_image(gtk.image_new_from_pixbuf(Pix[P.BORROW]))
-            srccol.borrowarrow.show_all()
-            Bpnl.canv.put(srccol.borrowarrow,
-                          destcol.x + P.ARROW_OFFSET[0],
-                          destcol.y + P.ARROW_OFFSET[1])
+    if Mode == P.ADD_MODE:
+        # carry first, starting at the ONES column
+        if CarryColumns:
+            return min(CarryColumns, key=Column.Index).carryarrow
 
-            srccol.borrowarrow.connect("clicked", srccol.Borrow)
-            DbgPrint("Created borrow arrow:", srccol.borrowarrow)
+        # drag the rightmost block of either input number
+        srccols = [col for col in (Num1.PendingColumn(), Num2.PendingColumn()) if col]
+        if not srccols:
+            return None
+        return min(srccols, key=Column.Index).blocks[0].drag_wgt
+
+    elif Mode == P.SUBTRACT_MODE:
+        srccol = Num2.PendingColumn()
+        if not srccol:
+            return None
+
+        # a borrow arrow below the target column means that the block cannot
+        # be subtracted yet
+        idx = srccol.Index()
+        if idx + 1 < len(NumA.columns) and NumA.columns[idx+1].borrowarrow:
+            return NumA.columns[idx+1].borrowarrow
+        return srccol.blocks[-1].drag_wgt
+
+def ShowHint():
+    """
+    highlight the widget for the next useful move, for a few seconds
+    """
+    global HintWidget, HintTimer
+
+    ClearHint()
+
+    HintWidget = NextMove()
+    if not HintWidget:
+        gtk.gdk.beep()
+        return
+
+    HintWidget.drag_highlight()
+    HintTimer = gobject.timeout_add(P.HINT_TIME, HintTimeout)
+
+def HintTimeout():
+    """
+    timer callback: remove hint highlighting
+    """
+    global HintTimer
+
+    HintTimer = None
+    ClearHint()
+    # do not repeat
+    return False
+
+def ClearHint():
+    """
+    remove hint highlighting, if any
+    """
+    global HintWidget, HintTimer
+
+    if HintTimer:
+        gobject.source_remove(HintTimer)
+        HintTimer = None
+
+    # widget might have been destroyed since it was highlighted
+    if HintWidget and HintWidget.window:
+        HintWidget.drag_unhighlight()
+    HintWidget = None
 
 def CalcAnswer():
     """
@@ -1297,7 +2435,7 @@ def CalcAnswer():
     """
     # are we ready to calculate?
     if Mode == P.ADD_MODE:
-        if CarryCount > 0 or any([col.Total() for col in Num1.columns + Num2.columns]):
+        if any([col.Total() for col in Num1.columns + Num2.columns]) or CarryColumns:
             return
     elif Mode == P.SUBTRACT_MODE: # note: there is no 'BorrowCount' to check
         if any([col.Total() for col in Num2.columns]):
@@ -1322,6 +2460,39 @@ def CalcAnswer():
     Cpnl.entries[Cpnl.ANS].set_text(strval)
     gtk.gdk.beep()
 
+    LogSnapshot(strval)
+
+def LogSnapshot(answer):
+    """
+    save a snapshot of the canvas of a solved problem to the session log
+    (if there is one), named for the time and the problem
+    """
+    logdir = os.environ.get(P.SESSION_LOG_ENV)
+    if not logdir:
+        return
+    operands = [Cpnl.entries[i].get_text() for i in (Cpnl.N1, Cpnl.N2)]
+    path = os.path.join(logdir, "%s-%s%s%s=%s.png" % (
+        time.strftime("%Y%m%d-%H%M%S"), operands[0],
+        "plus" if Mode == P.ADD_MODE else "minus", operands[1], answer))
+
+    def _save(png):
+        outfile = open(path, "wb")
+        try:
+            outfile.write(png)
+        finally:
+            outfile.close()
+    # encoded off the main loop: see BlockPanel.Snapshot()
+    Bpnl.Snapshot(_save)
+
+def ShowMessage(msg):
+    """
+    display a message in a modal dialog
+    """
+    dlg = gtk.MessageDialog(MainWin.get_toplevel(), gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT,
+                            gtk.MESSAGE_INFO, gtk.BUTTONS_OK, msg)
+    dlg.run()
+    dlg.destroy()
+
 def SetBgColor(widget, colorstr):
     """
     set background color of a widget
@@ -1334,53 +2505,330 @@ def SetLabelColor(widget, colorstr):
     """
     widget.modify_fg(gtk.STATE_INSENSITIVE, widget.get_colormap().alloc_color(colorstr))
 
+@TRACE.Traced("CommitLayout")
+def CommitLayout():
+    """
+    end the layout transaction of one frame: lay out the columns that
+    changed since the last commit (and only those), then update the
+    screen, once
+    """
+    for col in ChangedColumns:
+        col.ShowBlocks()
+    del ChangedColumns[:]
+    UpdateScreen()
+
+@TRACE.Traced("UpdateScreen")
 def UpdateScreen():
     """
     update the display screen
+    (widgets are shown as they are placed: see Column.ShowBlocks())
     """
-    MainWin.show_all()
     while gtk.events_pending():
         gtk.main_iteration(False)
 
+def FrameImage(pmap):
+    """
+    a (shown) Image of one frame of a carry/borrow animation
+    """
+    img = gtk.image_new_from_pixmap(pmap, None)
+    img.show()
+    return img
+
+def SnapshotScale(display_list, size):
+    """
+    scale factor and (wid, hgt) of a canvas snapshot that fits within size
+    """
+    (wid, hgt), _, _ = display_list
+    scale = min(1.0, 1.0 * size[0] / wid, 1.0 * size[1] / hgt)
+    return scale, (max(1, int(wid * scale)), max(1, int(hgt * scale)))
+
+def SnapshotLabels(display_list, size):
+    """
+    draw the labels of a canvas display list on a transparent layer, for
+    SnapshotPNG() (None if there are none)
+
+    main thread only: Pango's font map is not thread-safe, and GTK uses
+    it to draw its own labels while a worker thread runs
+    """
+    labels = [(x, y, label) for x, y, sprite, label in display_list[2] if not sprite]
+    if not labels:
+        return None
+
+    scale, snap_size = SnapshotScale(display_list, size)
+    layer = cairo.ImageSurface(cairo.FORMAT_ARGB32, *snap_size)
+    ctx = gtk.gdk.CairoContext(cairo.Context(layer))
+    ctx.scale(scale, scale)
+    ctx.set_source_rgb(0, 0, 0)
+    for x, y, (text, font) in labels:
+        layout = ctx.create_layout()
+        layout.set_font_description(pango.FontDescription(font))
+        layout.set_text(text)
+        ctx.move_to(x, y)
+        ctx.show_layout(layout)
+    return layer
+
+def SnapshotPNG(display_list, size, labels):
+    """
+    draw a canvas display list (see BlockPanel.DisplayList()), scaled down
+    to fit within size (wid, hgt), and encode it as a PNG string;
+    labels is the display list's SnapshotLabels() layer
+
+    safe to call from a worker thread: only Pixbufs and cairo image
+    surfaces are drawn (no X server access, no Pango)
+    """
+    _, bg_rgb, items = display_list
+    scale, snap_size = SnapshotScale(display_list, size)
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, *snap_size)
+    ctx = gtk.gdk.CairoContext(cairo.Context(surface))
+    ctx.scale(scale, scale)
+    ctx.set_source_rgb(*bg_rgb)
+    ctx.paint()
+
+    for x, y, sprite, _ in items:
+        if sprite:
+            ctx.set_source_pixbuf(sprite, x, y)
+            ctx.rectangle(x, y, sprite.get_width(), sprite.get_height())
+            ctx.fill()
+        elif labels:
+            # the labels' layer goes where the first label is listed
+            # (above the columns, below the blocks)
+            ctx.save()
+            ctx.identity_matrix()
+            ctx.set_source_surface(labels, 0, 0)
+            ctx.paint()
+            ctx.restore()
+            labels = None
+
+    out = cStringIO.StringIO()
+    surface.write_to_png(out)
+    return out.getvalue()
+
+@TRACE.Traced("CreateBlockImage")
 def CreateBlockImage(value, pixelcolor, borrow_block_flag=False):
     img = gtk.Image()
-    wid, hgt = P.BLOCK_WID, value * P.UNIT_HGT
-    img.set_size_request(wid, hgt)
+    img.set_size_request(P.BLOCK_WID, value * P.UNIT_HGT)
+
+    # the Pixmap is shared by all images of this block
+    img.set_from_pixmap(BlockPixmap(value, pixelcolor, borrow_block_flag), None)
+    return img
 
-    # color it in
-    pbuf = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, wid, hgt)
-    pbuf.fill(pixelcolor)
-    pmap = gtk.gdk.Pixmap(MyDrawable, wid, hgt, -1)
-    pmap.set_colormap(img.get_colormap())
+def BlockPixmap(value, pixelcolor, borrow_block_flag=False):
+    """
+    a block's image, drawn on a Pixmap (once per profile)
+    """
+    key = ("block", P.PROFILE, value, pixelcolor, borrow_block_flag)
+    if key in ImageCache:
+        return ImageCache[key]
+
+    ImageCache[key] = ServerPixmap(BlockSprite(value, pixelcolor, borrow_block_flag))
+    return ImageCache[key]
+
+@TRACE.Traced("ServerPixmap")
+def ServerPixmap(pbuf):
+    """
+    copy a Pixbuf to a new Pixmap, on the X server
+    """
+    pmap = gtk.gdk.Pixmap(MyDrawable, pbuf.get_width(), pbuf.get_height(), -1)
+    pmap.set_colormap(gtk.widget_get_default_colormap())
     pmap.draw_pixbuf(None, pbuf, 0, 0, 0, 0)
+    return pmap
 
-    # get ready to lines on pixmap, in black
-    gc = gtk.gdk.GC(pmap)
-    gc.set_rgb_fg_color(gtk.gdk.Color(0,0,0))
+def ShrinkFrames(color):
+    """
+    frames of the carry animation: a P.BASE-unit block, squeezed down
+    to one unit in P.SHRINK_FRAMES steps (rendered once per color)
+    return list of (Pixbuf, Pixmap) pairs: client-side source, server copy
+    """
+    key = ("shrink", P.PROFILE, P.BASE, P.SHRINK_FRAMES, color)
+    if key not in ImageCache:
+        sprite = BlockSprite(P.BASE, color)
+        wid, hgt = sprite.get_width(), sprite.get_height()
+        frames = []
+        # "sf" is scale factor
+        for i in range(1, P.SHRINK_FRAMES+1):
+            sf = (1.0/P.BASE)*(1.0*i/P.SHRINK_FRAMES) + 1.0*(1-1.0*i/P.SHRINK_FRAMES)
+            # scale vertically, but not horizontally
+            y = int(sf * hgt)
+            pbuf = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, sprite.get_has_alpha(), 8, wid, y)
+            sprite.scale(pbuf, 0,0, wid,y, 0,0, 1.0,sf, P.INTERP)
+            frames.append((pbuf, ServerPixmap(pbuf)))
+        ImageCache[key] = frames
+    return ImageCache[key]
+
+def ExpandFrames(color):
+    """
+    frames of the borrow animation: a "borrow block" of 1 to P.BASE units
+    (rendered once per color)
+    return list of (Pixbuf, Pixmap) pairs: client-side source, server copy
+    """
+    key = ("expand", P.PROFILE, P.BASE, color)
+    if key not in ImageCache:
+        ImageCache[key] = [(BlockSprite(i, color, True), BlockPixmap(i, color, True))
+                           for i in range(1, P.BASE+1)]
+    return ImageCache[key]
+
+def PrerenderFrames(kind, color):
+    """
+    idle callback: render the frames of a carry (kind = P.CARRY)
+    or borrow (kind = P.BORROW) animation, before they are needed
+    """
+    if kind == P.CARRY:
+        ShrinkFrames(color)
+    else:
+        ExpandFrames(color)
+    return False
+
+def BlockSprite(value, pixelcolor, borrow_block_flag=False):
+    """
+    a block's image, as a Pixbuf: from the sprite atlas,
+    or generated along with all the other block sprites
+    """
+    sprite = Atlas and Atlas.get(BlockSpriteName(value, pixelcolor, borrow_block_flag))
+    if sprite:
+        return sprite
+
+    key = ("sprite", P.PROFILE, value, pixelcolor, borrow_block_flag)
+    if key not in ImageCache:
+        GenerateBlockSprites(set(P.BLOCK_PIXEL_COLORS + [pixelcolor]))
+    return ImageCache[key]
+
+def GenerateBlockSprites(colors):
+    """
+    generate the sprites for blocks of every value, in the specified colors,
+    for the current profile (in one pass, without drawing on the X server)
+    """
+    bitmaps = BlockBitmaps(range(1, P.BASE+1), sorted(colors))
+    for (value, color, borrow_block_flag), pixels in bitmaps.items():
+        ImageCache["sprite", P.PROFILE, value, color, borrow_block_flag] = \
+            gtk.gdk.pixbuf_new_from_data(pixels, gtk.gdk.COLORSPACE_RGB, False, 8,
+                                         P.BLOCK_WID, value * P.UNIT_HGT, P.BLOCK_WID * 3)
+
+def RGBBytes(color_int):
+    """
+    RGB bytes of a color, specd as integer 0xRRGGBBAA
+    """
+    return chr((color_int >> 24) & 0xFF) + chr((color_int >> 16) & 0xFF) + chr((color_int >> 8) & 0xFF)
+
+def BlockBitmaps(values, colors, borrow_flags=(False, True)):
+    """
+    raster images of blocks: fill, unit lines
+    (a "borrow block" is divided into P.BASE segments), and outline
+
+    return dict of (value, color, borrow block flag) -> string of RGB pixels,
+    P.BLOCK_WID wide and value * P.UNIT_HGT high
 
-    # draw unit-lines
+    all the images are generated in one pass with NumPy array operations,
+    or row by row if NumPy is not available
+    """
+    if numpy is None:
+        return dict(((value, color, flag), BlockBitmap(value, color, flag))
+                    for value in values for color in colors for flag in borrow_flags)
+
+    value_arr = numpy.array(values)
+    flag_arr = numpy.array(borrow_flags, dtype=bool)
+    hgts = value_arr * P.UNIT_HGT
+    rows = numpy.arange(hgts.max())[numpy.newaxis, numpy.newaxis, :]
+
+    # unit-line spacing and count, per (flag, value)
+    segment_hgts = numpy.where(flag_arr[:, numpy.newaxis], hgts // P.BASE, P.UNIT_HGT)
+    line_counts = numpy.where(flag_arr[:, numpy.newaxis], P.BASE, value_arr)
+
+    # line rows, per (flag, value, row): unit lines and top edge, bottom edge
+    line_rows = (((rows % segment_hgts[..., numpy.newaxis] == 0) &
+                  (rows // segment_hgts[..., numpy.newaxis] < line_counts[..., numpy.newaxis])) |
+                 (rows == hgts[numpy.newaxis, :, numpy.newaxis] - 1))
+    row_kinds = line_rows.astype(numpy.intp)
+
+    line_rgb = numpy.frombuffer(RGBBytes(P.LINE_PIXEL_COLOR), dtype=numpy.uint8)
+    bitmaps = {}
+    for color in colors:
+        # the two kinds of row: fill (with left and right edges), and line
+        row_table = numpy.empty((2, P.BLOCK_WID, 3), dtype=numpy.uint8)
+        row_table[0] = numpy.frombuffer(RGBBytes(color), dtype=numpy.uint8)
+        row_table[0, [0, -1]] = line_rgb
+        row_table[1] = line_rgb
+
+        # pixels, per (flag, value, row, column)
+        pixels = row_table[row_kinds]
+        for flag_idx, flag in enumerate(borrow_flags):
+            for value_idx, value in enumerate(values):
+                bitmaps[value, color, flag] = pixels[flag_idx, value_idx, :hgts[value_idx]].tobytes()
+    return bitmaps
+
+def BlockBitmap(value, color, borrow_block_flag=False):
+    """
+    raster image of one block, as in BlockBitmaps(), built row by row
+    """
+    wid, hgt = P.BLOCK_WID, value * P.UNIT_HGT
     if borrow_block_flag:
         line_count = P.BASE
-        segment_hgt = value * P.UNIT_HGT // P.BASE
+        segment_hgt = hgt // P.BASE
     else:
         line_count = value
         segment_hgt = P.UNIT_HGT
 
-    for i in range(1, line_count):
-        line_y = i * segment_hgt
-        pmap.draw_line(gc,
-                       0, line_y,
-                       P.BLOCK_WID, line_y)
+    line = RGBBytes(P.LINE_PIXEL_COLOR)
+    fill_row = line + RGBBytes(color) * (wid - 2) + line
+    line_row = line * wid
+    line_ys = set([0, hgt - 1] + [i * segment_hgt for i in range(1, line_count)])
+    return "".join(line_row if y in line_ys else fill_row for y in range(hgt))
 
-    # draw overall outline
-    pmap.draw_rectangle(gc, False, 0,0, P.BLOCK_WID - 1,
-                        value * P.UNIT_HGT -1)
+def ChooseProfile(screen_hgt, dpi, name=None):
+    """
+    choose the device profile for a screen: among the profiles whose window
+    fits the screen height, the one whose blocks come closest to P.BLOCK_MM wide
 
-    # set final image
-    img.set_from_pixmap(pmap, None)
+    name: use the profile with this name, if there is one
+    """
+    for profile in P.PROFILES:
+        if profile[0] == name:
+            return profile
+
+    fitting = ([profile for profile in P.PROFILES
+                if 2 * P.BASE * profile[1] + P.CHROME_HGT <= screen_hgt]
+               or P.PROFILES[:1])
+    target_wid = P.BLOCK_MM * dpi / 25.4
+    return min(fitting, key=lambda profile: abs(profile[1] - target_wid))
 
-    # return both final image and the pixmap
-    return img, pmap
+def ScreenProfile(screen):
+    """
+    choose the device profile for a gtk.gdk.Screen, from its height and resolution
+    """
+    dpi = screen.get_resolution()
+    if dpi <= 0:
+        dpi = (25.4 * screen.get_height() / screen.get_height_mm()
+               if screen.get_height_mm() > 0 else 96.0)
+    return ChooseProfile(screen.get_height(), dpi, os.environ.get(P.PROFILE_ENV))
+
+def SetScale(profile):
+    """
+    set the sizes in P for a device profile: (name, block width, padding)
+    """
+    name, block_wid, block_pad = profile
+    ratio = 1.0 * block_wid / P.BLOCK_WID
+
+    P.PROFILE = name
+    P.BLOCK_WID = block_wid
+    P.BLOCK_PAD = block_pad
+    P.UNIT_HGT = block_wid
+    P.COL_WID = block_wid + 2*block_pad
+    P.COL_HGT = P.BASE * P.UNIT_HGT
+    P.TOTAL_OFFSET = P.ARROW_OFFSET[1] + int(round((P.TOTAL_OFFSET - P.ARROW_OFFSET[1]) * ratio))
+    P.WINDOW_HGT_ADJ = int(round(P.WINDOW_HGT_ADJ * ratio))
+
+def PrerenderAssets():
+    """
+    render every column and block image for the current profile,
+    so that none is rendered while a problem is being worked
+    """
+    for color in P.COLUMN_PIXEL_COLORS + [P.CAN_DROP_COLOR, P.CANNOT_DROP_COLOR]:
+        FilledPixmap(color, P.COL_WID, P.COL_HGT)
+    GenerateBlockSprites(set(P.BLOCK_PIXEL_COLORS))
+    for color in P.BLOCK_PIXEL_COLORS:
+        for value in range(1, P.BASE+1):
+            BlockPixmap(value, color)
+            # borrow expansion steps
+            BlockPixmap(value, color, True)
 
 def SetDisplayStringWidths():
     """
@@ -1398,7 +2846,26 @@ def SetDisplayStringWidths():
 
 def LoadImages():
     """
-    create images/pixbufs from XPM data
+    create images/pixbufs for the operator button and carry/borrow buttons,
+    from the sprite atlas, or else from XPM data
+    """
+    if Atlas:
+        pbufs = dict((key, Atlas[name]) for key, name in P.IMAGES.items())
+    else:
+        pbufs = ImagePixbufs()
+
+    # operator images (Image and Pixbuf objects)
+    pix = {
+        P.ADD_MODE:      gtk.image_new_from_pixbuf(pbufs[P.ADD_MODE]),
+        P.SUBTRACT_MODE: gtk.image_new_from_pixbuf(pbufs[P.SUBTRACT_MODE]),
+        P.CARRY:         pbufs[P.CARRY],
+        P.BORROW:        pbufs[P.BORROW],
+    }
+    return pix
+
+def ImagePixbufs():
+    """
+    create pixbufs from XPM data, scaled (once) for the current profile
     """
     LEFT_ARROW = [
         "30 12 2 1",
@@ -1488,22 +2955,443 @@ def LoadImages():
         ".........................."
     ]
 
-    def _image_new_from_xpm_data(datalist):
+    # XPM data is drawn for the "xo" profile
+    scale = 1.0 * P.BLOCK_WID / P.PROFILES[0][1]
+
+    def _pixbuf_new_from_xpm_data(datalist):
         """
-        create image using XPM data list
-        (missing from standard GTK/GDK library)
+        create pixbuf using XPM data list, scaled (once) for the current profile
         """
         pbuf = gtk.gdk.pixbuf_new_from_xpm_data(datalist)
-        return gtk.image_new_from_pixbuf(pbuf)
+        if scale != 1.0:
+            pbuf = pbuf.scale_simple(max(1, int(pbuf.get_width() * scale)),
+                                     max(1, int(pbuf.get_height() * scale)),
+                                     gtk.gdk.INTERP_BILINEAR)
+        return pbuf
+
+    return {
+        P.ADD_MODE:      _pixbuf_new_from_xpm_data(PLUS),
+        P.SUBTRACT_MODE: _pixbuf_new_from_xpm_data(MINUS),
+        P.CARRY:         _pixbuf_new_from_xpm_data(LEFT_ARROW),
+        P.BORROW:        _pixbuf_new_from_xpm_data(RIGHT_ARROW),
+    }
 
-    # operator images (Image and Pixbuf objects)
-    pix = {
-        P.ADD_MODE:      _image_new_from_xpm_data(PLUS),
-        P.SUBTRACT_MODE: _image_new_from_xpm_data(MINUS),
-        P.CARRY:         gtk.gdk.pixbuf_new_from_xpm_data(LEFT_ARROW),
-        P.BORROW:        gtk.gdk.pixbuf_new_from_xpm_data(RIGHT_ARROW),
+###
+### explaining wrong answers
+### (the parts of BlockHeadEngine.py that CheckCmd() uses)
+###
+
+class E():
+    """
+    engine parameters (from BlockHeadEngine.py)
+    """
+    # default number base
+    BASE = P.BASE
+
+    # operators, as written in a problem
+    ADD_OP = "+"
+    SUBTRACT_OP = "-"
+    OPERATORS = (ADD_OP, SUBTRACT_OP)
+
+    # per-column events
+    # CARRY: column total reached the base, 1 unit sent to the column at the left
+    # BORROW: column was too short to subtract from, 1 unit borrowed from the left
+    # CASCADE: column was empty when asked to lend, so it borrowed first
+    CARRY = "carry"
+    BORROW = "borrow"
+    CASCADE = "cascade"
+
+def DigitValues(base=E.BASE):
+    """
+    return a dictionary that maps each valid digit character to its value
+    """
+    return dict((str(d), d) for d in range(base))
+
+def DigitList(digits, base=E.BASE):
+    """
+    convert a STRING of digits to a list of INTs, starting at the ONES column
+    """
+    values = DigitValues(base)
+    try:
+        digit_list = [values[char] for char in reversed(digits.strip())]
+    except KeyError, exc_data:
+        raise ValueError("invalid digit %r for base %d" % (exc_data.args[0], base))
+
+    if not digit_list:
+        raise ValueError("empty number")
+    return digit_list
+
+def DigitString(digit_list):
+    """
+    convert a list of INTs (ONES column first) to a STRING,
+    dropping leading ZEROs, as CalcAnswer() does
+    """
+    strval = "".join(map(str, reversed(digit_list))).lstrip("0")
+    return strval or "0"
+
+def WorkColumn(operator, top, bottom, base, carry_in):
+    """
+    work one column, given its two digits and the carry/borrow
+    coming in from the column at the right
+
+    returns (answer digit, event or None, carry/borrow going out to the left)
+    """
+    if operator == E.ADD_OP:
+        total = top + bottom + carry_in
+        # Column.Carry(): replace P.BASE units with a 1-unit block in the next column
+        if total >= base:
+            return total - base, E.CARRY, 1
+        return total, None, 0
+
+    # SUBTRACT: carry_in is the unit this column lent to the column at the right
+    total = top - carry_in
+    if total < 0:
+        # Column.Borrow(): an empty column borrows from its left before lending
+        return total + base - bottom, E.CASCADE, 1
+    if total < bottom:
+        return total + base - bottom, E.BORROW, 1
+    return total - bottom, None, 0
+
+def ColumnEvents(operator, digits1, digits2, base=E.BASE):
+    """
+    generator: work a problem column by column, starting at the ONES column
+
+    digits1 and digits2 are iterables of INTs, ONES column first;
+    yields (answer digit, event or None) for each column
+
+    only one column is in memory at a time, so the digits can come from
+    generators (see ReadDigits()) for numbers of any length; note that a
+    CASCADE is reported in ONES-first order, while Column.Borrow()
+    animates a chain of borrows starting at the leftmost column
+    """
+    if operator not in E.OPERATORS:
+        raise ValueError("invalid operator %r" % operator)
+
+    carry_in = 0
+    iter1, iter2 = iter(digits1), iter(digits2)
+    while True:
+        top = next(iter1, None)
+        bottom = next(iter2, None)
+        if top is None and bottom is None:
+            break
+        digit, event, carry_in = WorkColumn(operator, top or 0, bottom or 0, base, carry_in)
+        yield digit, event
+
+    # ADD: final carry goes into the extra (gray) answer column
+    if carry_in and operator == E.ADD_OP:
+        yield 1, None
+    # SUBTRACT: nothing left to borrow from
+    elif carry_in:
+        raise ValueError("first number is smaller than second number")
+
+def Solve(operand1, operator, operand2, base=E.BASE):
+    """
+    work a problem written as STRINGs
+
+    returns (answer STRING, list of events, ONES column first)
+    """
+    columns = list(ColumnEvents(operator,
+                                DigitList(operand1, base),
+                                DigitList(operand2, base),
+                                base))
+    return DigitString([digit for digit, _ in columns]), [event for _, event in columns]
+
+class M():
+    """
+    mistakes that ExplainAnswer() can report, with their costs
+    (an explanation with the lowest total cost is preferred)
+    """
+    FORGOT_CARRY = "forgot-carry"
+    EXTRA_CARRY = "extra-carry"
+    SMALLER_FROM_LARGER = "smaller-from-larger"
+    FORGOT_DECREMENT = "forgot-decrement"
+    NO_CASCADE = "no-cascade"
+    SKIPPED_ZERO = "skipped-zero"
+    EXTRA_DECREMENT = "extra-decrement"
+    NOTHING_TO_BORROW = "nothing-to-borrow"
+    WRONG_DIGIT = "wrong-digit"
+    TOO_LONG = "too-long"
+    NOT_A_NUMBER = "not-a-number"
+
+    # an arithmetic slip explains anything, so it costs more than a carry/borrow mistake
+    COST = {WRONG_DIGIT: 2}
+
+    # message formats: %(col)s is the column, %(left)s is the column to its left
+    MESSAGES = {
+        FORGOT_CARRY: "forgot the carry out of the %(col)s column",
+        EXTRA_CARRY: "added a carry into the %(left)s column, but the %(col)s column did not need one",
+        SMALLER_FROM_LARGER: "subtracted the smaller digit from the larger one in the %(col)s column, instead of borrowing",
+        FORGOT_DECREMENT: "borrowed from the %(left)s column without taking 1 away from it",
+        NO_CASCADE: "borrowed from the %(col)s column, which was zero, without cascading the borrow to the %(left)s column",
+        SKIPPED_ZERO: "borrowed across the zero in the %(col)s column without changing it",
+        EXTRA_DECREMENT: "took 1 away from the %(left)s column, but nothing was borrowed from it",
+        NOTHING_TO_BORROW: "borrowed in the %(col)s column, but there is nothing to borrow from",
+        WRONG_DIGIT: "miscalculated the %(col)s column",
+        TOO_LONG: "the answer has too many digits",
+        NOT_A_NUMBER: "the answer is not a number",
     }
-    return pix
+
+    # column names, for base 10
+    COLUMN_NAMES = ["ones", "tens", "hundreds", "thousands", "ten-thousands",
+                    "hundred-thousands", "millions"]
+
+def ColumnName(index, base=E.BASE):
+    """
+    name of a column, given its index (ONES column is 0)
+    """
+    if index == 0:
+        return "ones"
+    if base == 10 and index < len(M.COLUMN_NAMES):
+        return M.COLUMN_NAMES[index]
+    # place value; exponent form keeps names of far-left columns short
+    if index < 10:
+        return "%d's" % base**index
+    return "%d**%d's" % (base, index)
+
+def Mistake(code, index=None, base=E.BASE):
+    """
+    create a (column index, mistake code, message) triple
+    """
+    if index is None:
+        return index, code, M.MESSAGES[code]
+    return index, code, M.MESSAGES[code] % {'col': ColumnName(index, base),
+                                            'left': ColumnName(index + 1, base)}
+
+def StudentOptions(operator, top, bottom, base, carry_in, written):
+    """
+    generator: ways a student might have worked one column, given the carry
+    (or lend) the student applied to it, that produce the written digit
+
+    yields (carry/borrow generated, event, mistake code or None)
+    """
+    digit, event, carry_out = WorkColumn(operator, top, bottom, base, carry_in)
+    if digit == written:
+        yield carry_out, event, None
+    else:
+        yield carry_out, event, M.WRONG_DIGIT
+
+    if operator == E.SUBTRACT_OP:
+        total = top - carry_in
+        # no borrow: "upside-down" subtraction
+        if 0 <= total < bottom and written == bottom - total:
+            yield 0, None, M.SMALLER_FROM_LARGER
+        # lend passed across an empty column, leaving it empty
+        if total < 0 and written == (base - bottom) % base:
+            yield 1, None, M.SKIPPED_ZERO
+
+def TransitionMistake(operator, carry_out, event, applied):
+    """
+    mistake (or None) made by applying (or not) the carry/borrow
+    generated by a column to the column at its left
+    """
+    if carry_out == applied:
+        return None
+    if operator == E.ADD_OP:
+        return M.FORGOT_CARRY if carry_out else M.EXTRA_CARRY
+    if not carry_out:
+        return M.EXTRA_DECREMENT
+    return M.NO_CASCADE if event == E.CASCADE else M.FORGOT_DECREMENT
+
+def ExplainAnswer(operand1, operator, operand2, answer, base=E.BASE):
+    """
+    explain a student's answer in terms of carry/borrow mistakes
+
+    returns a list of (column index, mistake code, message), ONES column
+    first -- an empty list means the answer is correct; raises ValueError
+    for a malformed problem
+
+    a dynamic program over column positions finds the cheapest set of
+    mistakes: its state is whether the student applied a carry (or lend)
+    to the current column, so run time is linear in the number of digits
+    """
+    digits1 = DigitList(operand1, base)
+    digits2 = DigitList(operand2, base)
+    # validate the problem
+    Solve(operand1, operator, operand2, base)
+
+    try:
+        written = DigitList(DigitString(DigitList(answer, base)), base)
+    except ValueError:
+        return [Mistake(M.NOT_A_NUMBER)]
+
+    # ADD: one extra answer column, for the final carry
+    count = max(len(digits1), len(digits2))
+    width = count + 1 if operator == E.ADD_OP else count
+    if len(written) > width:
+        return [Mistake(M.TOO_LONG)]
+    written += [0] * (width - len(written))
+    digits1 += [0] * (count - len(digits1))
+    digits2 += [0] * (count - len(digits2))
+
+    # costs[state]: cheapest cost of explaining the columns to the right;
+    # state is the carry/lend the student applied to the current column
+    costs = {0: 0}
+    # backptrs[idx][state]: (previous state, mistakes in column idx)
+    backptrs = []
+
+    for idx in range(count):
+        newcosts, back = {}, {}
+        for state, cost in costs.items():
+            for carry_out, event, mistake in StudentOptions(operator, digits1[idx], digits2[idx],
+                                                            base, state, written[idx]):
+                for applied in (0, 1):
+                    transition = TransitionMistake(operator, carry_out, event, applied)
+
+                    # SUBTRACT: there is no column to take the lend from
+                    if operator == E.SUBTRACT_OP and idx == count - 1:
+                        if applied:
+                            continue
+                        if carry_out:
+                            transition = M.NOTHING_TO_BORROW
+
+                    # messages are created only for the final explanation
+                    mistakes = [(code, idx) for code in (mistake, transition) if code]
+                    newcost = cost + sum(M.COST.get(code, 1) for code, _ in mistakes)
+                    if applied not in newcosts or newcost < newcosts[applied]:
+                        newcosts[applied] = newcost
+                        back[applied] = (state, mistakes)
+        costs = newcosts
+        backptrs.append(back)
+
+    # ADD: the carry column must show the carry the student applied to it
+    if operator == E.ADD_OP:
+        for state in costs:
+            if written[count] != state:
+                costs[state] += M.COST[M.WRONG_DIGIT]
+
+    # trace the cheapest explanation back to the ONES column
+    state = min(costs, key=lambda state: (costs[state], state))
+    final = []
+    if operator == E.ADD_OP and written[count] != state:
+        final.append((M.WRONG_DIGIT, count))
+
+    explanation = []
+    for back in reversed(backptrs):
+        state, mistakes = back[state]
+        explanation.extend(reversed(mistakes))
+    explanation.reverse()
+    return [Mistake(code, idx, base) for code, idx in explanation + final]
+
+###
+### sprite atlas
+###
+
+def AtlasPath():
+    """
+    pathname of the sprite atlas for the current profile
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), P.ATLAS_FILE % P.PROFILE)
+
+def BlockSpriteName(value, pixelcolor, borrow_block_flag=False):
+    """
+    name of a block's sprite in the atlas
+    """
+    return "block-%d-%08x-%d" % (value, pixelcolor, borrow_block_flag)
+
+def AtlasSprites():
+    """
+    render the sprites for the current profile:
+    operator and carry/borrow images, and every block image
+    return dict of sprite name -> Pixbuf
+    """
+    sprites = dict((P.IMAGES[key], pbuf) for key, pbuf in ImagePixbufs().items())
+
+    for color in set(P.BLOCK_PIXEL_COLORS):
+        for value in range(1, P.BASE+1):
+            for borrow_block_flag in (False, True):
+                sprites[BlockSpriteName(value, color, borrow_block_flag)] = \
+                    BlockSprite(value, color, borrow_block_flag)
+    return sprites
+
+def BuildAtlas(path, sprites):
+    """
+    write a sprite atlas file: a header line (magic, width, height, rowstride,
+    number base: borrow blocks are drawn in P.BASE segments), one line per sprite (name, x, y, width, height), an empty line,
+    then the atlas pixels (RGBA), ready to be loaded by LoadAtlas()
+    """
+    # shelf packing: tallest sprites first, left to right
+    wid = max([P.ATLAS_COLUMNS * P.BLOCK_WID] + [pbuf.get_width() for pbuf in sprites.values()])
+    places = {}
+    x = y = shelf_hgt = 0
+    for name in sorted(sprites, key=lambda name: (-sprites[name].get_height(), name)):
+        pbuf = sprites[name]
+        if x + pbuf.get_width() > wid:
+            x, y, shelf_hgt = 0, y + shelf_hgt, 0
+        places[name] = (x, y)
+        x += pbuf.get_width()
+        shelf_hgt = max(shelf_hgt, pbuf.get_height())
+    hgt = y + shelf_hgt
+
+    atlas = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, True, 8, wid, hgt)
+    atlas.fill(0)
+    header = ["%s %d %d %d %d" % (P.ATLAS_MAGIC, wid, hgt, atlas.get_rowstride(), P.BASE)]
+    for name, (x, y) in sorted(places.items()):
+        pbuf = sprites[name]
+        pbuf.add_alpha(False, 0, 0, 0).copy_area(0, 0, pbuf.get_width(), pbuf.get_height(),
+                                                 atlas, x, y)
+        header.append("%s %d %d %d %d" % (name, x, y, pbuf.get_width(), pbuf.get_height()))
+
+    outfile = open(path, "wb")
+    try:
+        outfile.write("\n".join(header) + "\n\n")
+        outfile.write(atlas.get_pixels())
+    finally:
+        outfile.close()
+
+def BuildAtlases(names=None):
+    """
+    build step (run by setup.py): write the sprite atlas
+    for each profile in names (default: all)
+    """
+    for profile in P.PROFILES:
+        if names and profile[0] not in names:
+            continue
+        SetScale(profile)
+        BuildAtlas(AtlasPath(), AtlasSprites())
+
+def LoadAtlas(path):
+    """
+    load a sprite atlas file (see BuildAtlas())
+    return dict of sprite name -> Pixbuf, or None if there is no usable
+    atlas (missing, truncated, or built for another format or number base)
+
+    the file is read in one piece, and its pixels become one Pixbuf
+    (PyGTK copies them: a mapped file would be copied too, so it is not
+    mapped); no image is decoded or rendered
+    """
+    try:
+        atlasfile = open(path, "rb")
+        try:
+            data = atlasfile.read()
+        finally:
+            atlasfile.close()
+    except EnvironmentError:
+        return None
+    if data[:len(P.ATLAS_MAGIC)] != P.ATLAS_MAGIC:
+        return None
+
+    header_len = data.find("\n\n") + 2
+    lines = data[:header_len].split("\n")
+    try:
+        wid, hgt, rowstride, base = [int(field) for field in lines[0].split()[1:]]
+        places = {}
+        for line in lines[1:]:
+            if line:
+                name, x, y, w, h = line.split()
+                places[name] = (int(x), int(y), int(w), int(h))
+    except ValueError:
+        return None
+    if (base != P.BASE or header_len < 2 or len(data) < header_len + rowstride * hgt
+        or not all([x + w <= wid and y + h <= hgt for x, y, w, h in places.values()])):
+        return None
+
+    # the whole atlas is one Pixbuf; each sprite is a sub-pixbuf, sharing its pixels
+    try:
+        atlas = gtk.gdk.pixbuf_new_from_data(buffer(data, header_len, rowstride * hgt),
+                                             gtk.gdk.COLORSPACE_RGB, True, 8, wid, hgt, rowstride)
+    except ValueError:
+        return None
+    return dict((name, atlas.subpixbuf(*place)) for name, place in places.items())
 
 def SpacerWidth(label_keys, answ_col_flag=False):
     """
@@ -1536,24 +3424,61 @@ mytype = activity.Activity if SUGAR_ACTIVITY else object
 class BlockHeadActivity(mytype):
 
     def __init__(self, handle=None):
-        global Mode, HelpWin, MyDrawable, Pix, MainWin, Bpnl, Cpnl
+        global Mode, HelpWin, MyDrawable, Pix, Atlas, MainWin, Bpnl, Cpnl, Wakeups
+        TRACE.Phase("import")
         if SUGAR_ACTIVITY:
             activity.Activity.__init__(self, handle)
+            TRACE.Phase("activity_init")
 
         Mode = P.ADD_MODE
         HelpWin = None
 
+        # tracing/profiling, if the environment asks for it
+        TRACE.Configure(os.environ.get(P.TRACE_ENV))
+        if "wakeups" in TRACE.options:
+            Wakeups = WakeupCounter()
+
+        # when saving power: no worker threads (with threads enabled, PyGTK's
+        # main loop wakes up 10 times a second, to check for signals), and no
+        # blinking text cursor; otherwise, canvas snapshots are encoded in
+        # worker threads
+        # a trace file is written by a background thread, which does not run
+        # while the main loop holds the interpreter lock: tracing to a file
+        # needs threads, even when saving power
+        P.POWER_SAVE = PowerSave()
+        if P.POWER_SAVE:
+            gtk.settings_get_default().set_property("gtk-cursor-blink", False)
+        if not P.POWER_SAVE or TRACE.chrome:
+            gobject.threads_init()
+
+        # sizes for this screen
+        SetScale(ScreenProfile(gtk.gdk.screen_get_default()))
+        TRACE.Phase("profile")
+
         # we need an invisible Drawable, for use by SetDisplayStringWidths()
         # also, CreateBlockImage() needs it to establish pixel-depth of a Pixmap
         _tempwin = gtk.Window()
         _tempwin.realize()
         MyDrawable = _tempwin.window
+        TRACE.Phase("realize")
 
         # establish string widths
         SetDisplayStringWidths()
+        TRACE.Phase("string_widths")
 
-        # load images for operator button and carry/borrow buttons
+        # load images for operator button and carry/borrow buttons;
+        # render the column and block images, unless they are in the atlas
+        Atlas = LoadAtlas(AtlasPath())
+        TRACE.Phase("atlas")
         Pix = LoadImages()
+        TRACE.Phase("images")
+        if not Atlas:
+            PrerenderAssets()
+            TRACE.Phase("prerender")
+
+        # animation frames and quality for this device
+        Calibrate()
+        TRACE.Phase("calibrate")
 
         # set up main window
         if SUGAR_ACTIVITY:
@@ -1566,6 +3491,10 @@ class BlockHeadActivity(mytype):
             MainWin.set_resizable(False)
             MainWin.set_position(gtk.WIN_POS_CENTER)
             MainWin.connect('destroy', lambda _: gtk.main_quit())
+        # tracing key chords, on the toplevel window
+        toplevel = self if SUGAR_ACTIVITY else MainWin
+        toplevel.connect('key-press-event', TraceKeyPress)
+        MainWin.first_frame_handler = MainWin.connect_after('expose-event', FirstFrame)
 
         # vertical box holds block canvas (BlockPanel) and control panel (CtrlPanel)
         vb = gtk.VBox()
@@ -1579,10 +3508,13 @@ class BlockHeadActivity(mytype):
         Bpnl.canv.set_has_window(True)
         SetBgColor(Bpnl.canv, P.CANV_COLOR_STR)
         vb.pack_start(Bpnl.canv, expand=True, fill=True)
+        TRACE.Phase("block_panel")
 
         # control panel, at bottom
         Cpnl = CtrlPanel()
+        TRACE.Phase("ctrl_panel")
         Cpnl.NewCmd(None)
+        TRACE.Phase("new_problem")
         vb.pack_start(Cpnl, expand=True, fill=True)
 
         # go
@@ -1593,6 +3525,13 @@ class BlockHeadActivity(mytype):
             self.set_toolbox(toolbox)
             toolbox.show()
             self.set_canvas(MainWin)
+        TRACE.Phase("show")
+
+    def get_preview(self):
+        """
+        Journal preview: a snapshot of the block canvas, not the whole window
+        """
+        return Bpnl.Thumbnail(P.THUMBNAIL_SIZE)
 
 if __name__ == "__main__":
     BlockHeadActivity()
@@ -1,3 +1,19 @@
 #!/usr/bin/env python
+import os
+import sys
+
 from sugar.activity import bundlebuilder
+
+if "dist_xo" in sys.argv[1:]:
+    # pack the images into the sprite atlas listed in MANIFEST
+    import BlockHeadActivity
+    BlockHeadActivity.BuildAtlases(BlockHeadActivity.P.BUNDLE_PROFILES)
+
+    # the atlas is generated, not kept in the source tree: a bundle
+    # without it would silently fall back to rendering at every launch
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in open(os.path.join(here, "MANIFEST")).read().split():
+        if name.endswith(".atlas") and not os.path.exists(os.path.join(here, name)):
+            sys.exit("setup.py: build step did not produce %s" % name)
+
 bundlebuilder.start()
@@ -0,0 +1,645 @@
+#!/usr/bin/env python
+# BlockHeadEngine.py -- BlockHead's column arithmetic, without the GUI
+# Copyright 2008, 2009 John Posner
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+BlockHeadEngine -- column arithmetic
+
+work a problem column by column, performing the same carry and
+borrow operations as Column.Carry() and Column.Borrow() in BlockHead.py,
+with number base <= 10
+
+usage: BlockHeadEngine.py [options] FILE1 OPERATOR FILE2
+(streams the numbers in two files, of any length, through the engine)
+"""
+
+__date__ = '21-Jul-2009'
+__version__ = 2039
+
+import multiprocessing
+import optparse
+import os
+import sys
+
+class E():
+    """
+    engine parameters
+    """
+    # default number base
+    BASE = 10
+
+    # operators, as written in a problem
+    ADD_OP = "+"
+    SUBTRACT_OP = "-"
+    OPERATORS = (ADD_OP, SUBTRACT_OP)
+
+    # per-column events
+    # CARRY: column total reached the base, 1 unit sent to the column at the left
+    # BORROW: column was too short to subtract from, 1 unit borrowed from the left
+    # CASCADE: column was empty when asked to lend, so it borrowed first
+    CARRY = "carry"
+    BORROW = "borrow"
+    CASCADE = "cascade"
+
+    # buffer size (bytes) for streaming digits from/to files
+    BUFSIZE = 64 * 1024
+
+    # columns per worker task, in ParallelSolve()
+    CHUNK_COLUMNS = 256 * 1024
+    # one-character codes for events returned by worker processes
+    EVENT_CODES = {None: ".", CARRY: "c", BORROW: "b", CASCADE: "z"}
+
+def DigitValues(base=E.BASE):
+    """
+    return a dictionary that maps each valid digit character to its value
+    """
+    return dict((str(d), d) for d in range(base))
+
+def DigitList(digits, base=E.BASE):
+    """
+    convert a STRING of digits to a list of INTs, starting at the ONES column
+    """
+    values = DigitValues(base)
+    try:
+        digit_list = [values[char] for char in reversed(digits.strip())]
+    except KeyError, exc_data:
+        raise ValueError("invalid digit %r for base %d" % (exc_data.args[0], base))
+
+    if not digit_list:
+        raise ValueError("empty number")
+    return digit_list
+
+def CheckDigits(digits, base=E.BASE):
+    """
+    raise the ValueError that DigitList() would raise for a STRING of
+    digits (already stripped), without converting it
+    """
+    invalid = digits.translate(None, "".join(DigitValues(base)))
+    if invalid:
+        # DigitList() reports the invalid digit nearest the ONES column
+        raise ValueError("invalid digit %r for base %d" % (invalid[-1], base))
+    if not digits:
+        raise ValueError("empty number")
+
+def DigitString(digit_list):
+    """
+    convert a list of INTs (ONES column first) to a STRING,
+    dropping leading ZEROs, as CalcAnswer() does
+    """
+    strval = "".join(map(str, reversed(digit_list))).lstrip("0")
+    return strval or "0"
+
+def WorkColumn(operator, top, bottom, base, carry_in):
+    """
+    work one column, given its two digits and the carry/borrow
+    coming in from the column at the right
+
+    returns (answer digit, event or None, carry/borrow going out to the left)
+    """
+    if operator == E.ADD_OP:
+        total = top + bottom + carry_in
+        # Column.Carry(): replace P.BASE units with a 1-unit block in the next column
+        if total >= base:
+            return total - base, E.CARRY, 1
+        return total, None, 0
+
+    # SUBTRACT: carry_in is the unit this column lent to the column at the right
+    total = top - carry_in
+    if total < 0:
+        # Column.Borrow(): an empty column borrows from its left before lending
+        return total + base - bottom, E.CASCADE, 1
+    if total < bottom:
+        return total + base - bottom, E.BORROW, 1
+    return total - bottom, None, 0
+
+def ColumnEvents(operator, digits1, digits2, base=E.BASE):
+    """
+    generator: work a problem column by column, starting at the ONES column
+
+    digits1 and digits2 are iterables of INTs, ONES column first;
+    yields (answer digit, event or None) for each column
+
+    only one column is in memory at a time, so the digits can come from
+    generators (see ReadDigits()) for numbers of any length; note that a
+    CASCADE is reported in ONES-first order, while Column.Borrow()
+    animates a chain of borrows starting at the leftmost column
+    """
+    if operator not in E.OPERATORS:
+        raise ValueError("invalid operator %r" % operator)
+
+    carry_in = 0
+    iter1, iter2 = iter(digits1), iter(digits2)
+    while True:
+        top = next(iter1, None)
+        bottom = next(iter2, None)
+        if top is None and bottom is None:
+            break
+        digit, event, carry_in = WorkColumn(operator, top or 0, bottom or 0, base, carry_in)
+        yield digit, event
+
+    # ADD: final carry goes into the extra (gray) answer column
+    if carry_in and operator == E.ADD_OP:
+        yield 1, None
+    # SUBTRACT: nothing left to borrow from
+    elif carry_in:
+        raise ValueError("first number is smaller than second number")
+
+def Solve(operand1, operator, operand2, base=E.BASE):
+    """
+    work a problem written as STRINGs
+
+    returns (answer STRING, list of events, ONES column first)
+    """
+    columns = list(ColumnEvents(operator,
+                                DigitList(operand1, base),
+                                DigitList(operand2, base),
+                                base))
+    return DigitString([digit for digit, _ in columns]), [event for _, event in columns]
+
+def Grade(operand1, operator, operand2, answer, base=E.BASE):
+    """
+    check a student's answer to a problem
+
+    returns (verdict, expected answer, list of events), where verdict
+    is "correct" or "incorrect"; raises ValueError for a malformed problem
+    """
+    expected, events = Solve(operand1, operator, operand2, base)
+
+    # leading ZEROs do not make an answer wrong, but a non-number does
+    try:
+        given = DigitString(DigitList(answer, base))
+    except ValueError:
+        given = None
+
+    verdict = "correct" if given == expected else "incorrect"
+    return verdict, expected, events
+
+###
+### explaining wrong answers
+###
+
+class M():
+    """
+    mistakes that ExplainAnswer() can report, with their costs
+    (an explanation with the lowest total cost is preferred)
+    """
+    FORGOT_CARRY = "forgot-carry"
+    EXTRA_CARRY = "extra-carry"
+    SMALLER_FROM_LARGER = "smaller-from-larger"
+    FORGOT_DECREMENT = "forgot-decrement"
+    NO_CASCADE = "no-cascade"
+    SKIPPED_ZERO = "skipped-zero"
+    EXTRA_DECREMENT = "extra-decrement"
+    NOTHING_TO_BORROW = "nothing-to-borrow"
+    WRONG_DIGIT = "wrong-digit"
+    TOO_LONG = "too-long"
+    NOT_A_NUMBER = "not-a-number"
+
+    # an arithmetic slip explains anything, so it costs more than a carry/borrow mistake
+    COST = {WRONG_DIGIT: 2}
+
+    # message formats: %(col)s is the column, %(left)s is the column to its left
+    MESSAGES = {
+        FORGOT_CARRY: "forgot the carry out of the %(col)s column",
+        EXTRA_CARRY: "added a carry into the %(left)s column, but the %(col)s column did not need one",
+        SMALLER_FROM_LARGER: "subtracted the smaller digit from the larger one in the %(col)s column, instead of borrowing",
+        FORGOT_DECREMENT: "borrowed from the %(left)s column without taking 1 away from it",
+        NO_CASCADE: "borrowed from the %(col)s column, which was zero, without cascading the borrow to the %(left)s column",
+        SKIPPED_ZERO: "borrowed across the zero in the %(col)s column without changing it",
+        EXTRA_DECREMENT: "took 1 away from the %(left)s column, but nothing was borrowed from it",
+        NOTHING_TO_BORROW: "borrowed in the %(col)s column, but there is nothing to borrow from",
+        WRONG_DIGIT: "miscalculated the %(col)s column",
+        TOO_LONG: "the answer has too many digits",
+        NOT_A_NUMBER: "the answer is not a number",
+    }
+
+    # column names, for base 10
+    COLUMN_NAMES = ["ones", "tens", "hundreds", "thousands", "ten-thousands",
+                    "hundred-thousands", "millions"]
+
+def ColumnName(index, base=E.BASE):
+    """
+    name of a column, given its index (ONES column is 0)
+    """
+    if index == 0:
+        return "ones"
+    if base == 10 and index < len(M.COLUMN_NAMES):
+        return M.COLUMN_NAMES[index]
+    # place value; exponent form keeps names of far-left columns short
+    if index < 10:
+        return "%d's" % base**index
+    return "%d**%d's" % (base, index)
+
+def Mistake(code, index=None, base=E.BASE):
+    """
+    create a (column index, mistake code, message) triple
+    """
+    if index is None:
+        return index, code, M.MESSAGES[code]
+    return index, code, M.MESSAGES[code] % {'col': ColumnName(index, base),
+                                            'left': ColumnName(index + 1, base)}
+
+def StudentOptions(operator, top, bottom, base, carry_in, written):
+    """
+    generator: ways a student might have worked one column, given the carry
+    (or lend) the student applied to it, that produce the written digit
+
+    yields (carry/borrow generated, event, mistake code or None)
+    """
+    digit, event, carry_out = WorkColumn(operator, top, bottom, base, carry_in)
+    if digit == written:
+        yield carry_out, event, None
+    else:
+        yield carry_out, event, M.WRONG_DIGIT
+
+    if operator == E.SUBTRACT_OP:
+        total = top - carry_in
+        # no borrow: "upside-down" subtraction
+        if 0 <= total < bottom and written == bottom - total:
+            yield 0, None, M.SMALLER_FROM_LARGER
+        # lend passed across an empty column, leaving it empty
+        if total < 0 and written == (base - bottom) % base:
+            yield 1, None, M.SKIPPED_ZERO
+
+def TransitionMistake(operator, carry_out, event, applied):
+    """
+    mistake (or None) made by applying (or not) the carry/borrow
+    generated by a column to the column at its left
+    """
+    if carry_out == applied:
+        return None
+    if operator == E.ADD_OP:
+        return M.FORGOT_CARRY if carry_out else M.EXTRA_CARRY
+    if not carry_out:
+        return M.EXTRA_DECREMENT
+    return M.NO_CASCADE if event == E.CASCADE else M.FORGOT_DECREMENT
+
+def ExplainAnswer(operand1, operator, operand2, answer, base=E.BASE):
+    """
+    explain a student's answer in terms of carry/borrow mistakes
+
+    returns a list of (column index, mistake code, message), ONES column
+    first -- an empty list means the answer is correct; raises ValueError
+    for a malformed problem
+
+    a dynamic program over column positions finds the cheapest set of
+    mistakes: its state is whether the student applied a carry (or lend)
+    to the current column, so run time is linear in the number of digits
+    """
+    digits1 = DigitList(operand1, base)
+    digits2 = DigitList(operand2, base)
+    # validate the problem
+    Solve(operand1, operator, operand2, base)
+
+    try:
+        written = DigitList(DigitString(DigitList(answer, base)), base)
+    except ValueError:
+        return [Mistake(M.NOT_A_NUMBER)]
+
+    # ADD: one extra answer column, for the final carry
+    count = max(len(digits1), len(digits2))
+    width = count + 1 if operator == E.ADD_OP else count
+    if len(written) > width:
+        return [Mistake(M.TOO_LONG)]
+    written += [0] * (width - len(written))
+    digits1 += [0] * (count - len(digits1))
+    digits2 += [0] * (count - len(digits2))
+
+    # costs[state]: cheapest cost of explaining the columns to the right;
+    # state is the carry/lend the student applied to the current column
+    costs = {0: 0}
+    # backptrs[idx][state]: (previous state, mistakes in column idx)
+    backptrs = []
+
+    for idx in range(count):
+        newcosts, back = {}, {}
+        for state, cost in costs.items():
+            for carry_out, event, mistake in StudentOptions(operator, digits1[idx], digits2[idx],
+                                                            base, state, written[idx]):
+                for applied in (0, 1):
+                    transition = TransitionMistake(operator, carry_out, event, applied)
+
+                    # SUBTRACT: there is no column to take the lend from
+                    if operator == E.SUBTRACT_OP and idx == count - 1:
+                        if applied:
+                            continue
+                        if carry_out:
+                            transition = M.NOTHING_TO_BORROW
+
+                    # messages are created only for the final explanation
+                    mistakes = [(code, idx) for code in (mistake, transition) if code]
+                    newcost = cost + sum(M.COST.get(code, 1) for code, _ in mistakes)
+                    if applied not in newcosts or newcost < newcosts[applied]:
+                        newcosts[applied] = newcost
+                        back[applied] = (state, mistakes)
+        costs = newcosts
+        backptrs.append(back)
+
+    # ADD: the carry column must show the carry the student applied to it
+    if operator == E.ADD_OP:
+        for state in costs:
+            if written[count] != state:
+                costs[state] += M.COST[M.WRONG_DIGIT]
+
+    # trace the cheapest explanation back to the ONES column
+    state = min(costs, key=lambda state: (costs[state], state))
+    final = []
+    if operator == E.ADD_OP and written[count] != state:
+        final.append((M.WRONG_DIGIT, count))
+
+    explanation = []
+    for back in reversed(backptrs):
+        state, mistakes = back[state]
+        explanation.extend(reversed(mistakes))
+    explanation.reverse()
+    return [Mistake(code, idx, base) for code, idx in explanation + final]
+
+###
+### streaming numbers from/to files
+###
+
+def ReadDigits(path, base=E.BASE, bufsize=E.BUFSIZE):
+    """
+    generator: yield the digits of the number in a file, as INTs,
+    starting at the ONES column
+
+    the file is read backward, one buffer at a time, so memory use does
+    not depend on the length of the number; whitespace is ignored, but a
+    file without digits is an error, as an empty STRING is for DigitList()
+    """
+    valid = DigitValues(base)
+    empty = True
+
+    fil = open(path, "rb")
+    try:
+        fil.seek(0, os.SEEK_END)
+        pos = fil.tell()
+        while pos > 0:
+            size = min(bufsize, pos)
+            pos -= size
+            fil.seek(pos)
+            for char in reversed(fil.read(size)):
+                if char in valid:
+                    empty = False
+                    yield valid[char]
+                elif not char.isspace():
+                    raise ValueError("invalid digit %r for base %d in %s" % (char, base, path))
+    finally:
+        fil.close()
+
+    if empty:
+        raise ValueError("empty number in %s" % path)
+
+def WriteDigits(path, digits, width, bufsize=E.BUFSIZE):
+    """
+    write digits (INTs, ONES column first) to a file as a number, with its
+    most significant digit first and no leading ZEROs
+
+    width is an upper bound on the number of digits; the digits are written
+    backward from that position, then shifted to the start of the file,
+    so memory use does not depend on the length of the number
+
+    returns the number of digits written
+    """
+    fil = open(path, "w+b")
+    try:
+        # write digits, last buffer first
+        pos = width
+        buf = []
+        for digit in digits:
+            buf.append(str(digit))
+            if len(buf) == bufsize:
+                pos = _WriteBackward(fil, pos, buf)
+                buf = []
+        pos = _WriteBackward(fil, pos, buf)
+
+        # skip leading ZEROs (but keep a final ZERO)
+        fil.seek(pos)
+        while pos < width - 1:
+            chunk = fil.read(min(bufsize, width - 1 - pos)).lstrip("0")
+            if chunk:
+                pos = fil.tell() - len(chunk)
+                break
+            pos = fil.tell()
+
+        # shift the digits to the start of the file
+        count = width - pos
+        src, dest = pos, 0
+        while src < width:
+            fil.seek(src)
+            chunk = fil.read(min(bufsize, width - src))
+            fil.seek(dest)
+            fil.write(chunk)
+            src += len(chunk)
+            dest += len(chunk)
+        fil.truncate(count)
+        fil.seek(count)
+        fil.write("\n")
+    finally:
+        fil.close()
+
+    return count
+
+def _WriteBackward(fil, pos, buf):
+    """
+    write a buffer of digit STRINGs (ONES column first) so that it ends
+    at file position pos; returns the position of its start
+    """
+    if pos < len(buf):
+        raise ValueError("number has more than the expected number of digits")
+    pos -= len(buf)
+    fil.seek(pos)
+    fil.write("".join(reversed(buf)))
+    return pos
+
+def StreamFile(path1, operator, path2, answer_path, base=E.BASE, events_path=None):
+    """
+    work a problem whose numbers are stored in files, writing the answer
+    to a file and, optionally, each column's event to another file
+    (one line per event: "column-index event", ONES column first)
+
+    memory use does not depend on the length of the numbers;
+    returns the number of digits in the answer
+    """
+    # every digit takes at least one byte; ADD might need an extra column
+    width = max(os.path.getsize(path1), os.path.getsize(path2)) + 1
+    events_file = open(events_path, "wb") if events_path else None
+
+    def _answer_digits():
+        columns = ColumnEvents(operator,
+                               ReadDigits(path1, base),
+                               ReadDigits(path2, base),
+                               base)
+        for idx, (digit, event) in enumerate(columns):
+            if event and events_file:
+                events_file.write("%d %s\n" % (idx, event))
+            yield digit
+
+    try:
+        return WriteDigits(answer_path, _answer_digits(), width)
+    finally:
+        if events_file:
+            events_file.close()
+
+###
+### parallel carry-lookahead, for one huge problem
+###
+
+def ChunkSummary(args):
+    """
+    carry/borrow going out of a chunk of columns, for each value of
+    the carry/borrow coming in (runs in a worker process)
+
+    args: (operator, digits1, digits2, base), where the digits are
+    STRINGs of equal length, most significant digit first
+
+    returns (carry out if carry in is 0, carry out if carry in is 1)
+    """
+    operator, digits1, digits2, base = args
+    carry0, carry1 = 0, 1
+    for top, bottom in zip(DigitList(digits1, base), DigitList(digits2, base)):
+        # once the two cases agree, they agree for the rest of the chunk
+        if carry0 == carry1:
+            carry0 = carry1 = WorkColumn(operator, top, bottom, base, carry0)[2]
+        else:
+            carry0 = WorkColumn(operator, top, bottom, base, carry0)[2]
+            carry1 = WorkColumn(operator, top, bottom, base, carry1)[2]
+    return carry0, carry1
+
+def CombineSummaries(right, left):
+    """
+    summary of two adjacent chunks of columns, given the summaries
+    of the right-hand chunk and the left-hand chunk
+    """
+    return left[right[0]], left[right[1]]
+
+def PrefixSummaries(summaries):
+    """
+    inclusive prefix scan of chunk summaries, ONES chunk first:
+    element k summarizes chunks 0 through k
+
+    this is the carry-lookahead step: ceil(log2(N)) rounds, and the
+    combinations within a round are independent of each other
+    """
+    scan = list(summaries)
+    step = 1
+    while step < len(scan):
+        scan = [scan[idx] if idx < step else CombineSummaries(scan[idx-step], scan[idx])
+                for idx in range(len(scan))]
+        step *= 2
+    return scan
+
+def ChunkEvents(args):
+    """
+    work a chunk of columns, given the carry/borrow coming into it
+    (runs in a worker process)
+
+    args: (operator, digits1, digits2, base, carry_in), as in ChunkSummary()
+
+    returns (STRING of answer digits, STRING of event codes), ONES column first
+    """
+    operator, digits1, digits2, base, carry_in = args
+    answer, events = [], []
+    for top, bottom in zip(DigitList(digits1, base), DigitList(digits2, base)):
+        digit, event, carry_in = WorkColumn(operator, top, bottom, base, carry_in)
+        answer.append(str(digit))
+        events.append(E.EVENT_CODES[event])
+    return "".join(answer), "".join(events)
+
+def ParallelSolve(operand1, operator, operand2, base=E.BASE, processes=None,
+                  chunk_columns=E.CHUNK_COLUMNS):
+    """
+    work a huge problem written as STRINGs, splitting the columns into
+    chunks that are handled by a pool of worker processes
+
+    returns the same (answer STRING, list of events) as Solve():
+    each chunk is summarized in parallel, the carry/borrow into every chunk
+    is found by a prefix scan of the summaries, and then the chunks are
+    worked in parallel, using the same WorkColumn() as Solve()
+    """
+    if operator not in E.OPERATORS:
+        raise ValueError("invalid operator %r" % operator)
+
+    # same normalization and checks as Solve(), before any work is sent
+    # to the workers
+    operand1, operand2 = operand1.strip(), operand2.strip()
+    CheckDigits(operand1, base)
+    CheckDigits(operand2, base)
+
+    width = max(len(operand1), len(operand2))
+    operand1, operand2 = operand1.zfill(width), operand2.zfill(width)
+
+    # chunks of columns, ONES chunk first
+    chunks = [(operator,
+               operand1[max(end - chunk_columns, 0):end],
+               operand2[max(end - chunk_columns, 0):end],
+               base)
+              for end in range(width, 0, -chunk_columns)]
+
+    pool = multiprocessing.Pool(processes) if processes != 1 else None
+    mapper = pool.map if pool else map
+    try:
+        # carry/borrow into each chunk: the ONES chunk gets none
+        prefixes = PrefixSummaries(mapper(ChunkSummary, chunks))
+        carries_in = [0] + [summary[0] for summary in prefixes[:-1]]
+        carry_out = prefixes[-1][0]
+
+        results = mapper(ChunkEvents, [chunk + (carry_in,)
+                                       for chunk, carry_in in zip(chunks, carries_in)])
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    answer = "".join(digits for digits, _ in results)
+    codes = "".join(codes for _, codes in results)
+
+    # final carry/borrow, as in ColumnEvents()
+    if carry_out and operator == E.ADD_OP:
+        answer += "1"
+        codes += E.EVENT_CODES[None]
+    elif carry_out:
+        raise ValueError("first number is smaller than second number")
+
+    events_by_code = dict((code, event) for event, code in E.EVENT_CODES.items())
+    return (answer[::-1].lstrip("0") or "0",
+            [events_by_code[code] for code in codes])
+
+###
+### main routine
+###
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage="%prog [options] FILE1 OPERATOR FILE2")
+    parser.add_option("-o", "--output", help="answer file (required)")
+    parser.add_option("-e", "--events", help="file for carry/borrow events")
+    parser.add_option("-b", "--base", type="int", default=E.BASE,
+                      help="number base (default: %default)")
+    opts, args = parser.parse_args()
+
+    if len(args) != 3 or args[1] not in E.OPERATORS:
+        parser.error("specify FILE1 %s FILE2 or FILE1 %s FILE2" % E.OPERATORS)
+    if not opts.output:
+        parser.error("specify an answer file")
+    if not 2 <= opts.base <= 10:
+        parser.error("number base must be between 2 and 10")
+
+    try:
+        StreamFile(args[0], args[1], args[2], opts.output, opts.base, opts.events)
+    except ValueError, exc_data:
+        print >> sys.stderr, "%s: %s" % (os.path.basename(sys.argv[0]), exc_data)
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,860 @@
+#!/usr/bin/env python
+# BlockHeadExport.py -- export BlockHead solution animations to files
+# Copyright 2008, 2009 John Posner
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+BlockHeadExport -- solution animations, rendered off-screen
+
+for each problem in a problem set (CSV or JSONL file of records, as read
+by BlockHeadGrader.py), play the solution as BlockHead animates it --
+block moves, carry shrinks, borrow expansions -- on an off-screen canvas,
+and write it to a file: an animated PNG, an animated GIF, or a directory
+of PNG frames with an ffmpeg "concat" list, for making a video:
+
+    ffmpeg -f concat -i DIR/frames.txt -vsync vfr -pix_fmt yuv420p DIR.mp4
+
+the animation is timed by a virtual clock, so sleeping costs nothing, and
+a problem is exported as fast as its frames can be drawn; a frame that is
+the same as the one before it is not written, the earlier frame is just
+shown for longer
+
+problems are exported in parallel by a pool of worker processes
+
+usage: BlockHeadExport.py [options] INFILE ...
+"""
+
+__date__ = '21-Jul-2009'
+__version__ = 2039
+
+import multiprocessing
+import optparse
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+import cairo
+
+import BlockHeadGrader
+import BlockHeadRender
+from BlockHeadEngine import E
+from BlockHeadRender import R, Geometry
+
+class X():
+    """
+    export parameters
+    """
+    # output formats
+    APNG, GIF, FRAMES = "apng", "gif", "frames"
+    EXTENSIONS = {APNG: ".png", GIF: ".gif", FRAMES: ""}
+
+    # space (pixels) around the column sets
+    MARGIN = 20
+    # space below the columns, for column totals
+    LABEL_SPACE = 50
+    # background color
+    BACKGROUND_PIXEL_COLOR = 0xFFFFFF00
+
+    # wider problems do not fit on a reasonable canvas
+    MAX_COLUMNS = 10
+
+    # how long the finished problem stays on the last frame (seconds)
+    FINAL_HOLD = 2.0
+
+PNG_SIGNATURE = "\x89PNG\r\n\x1a\n"
+
+# position of R, G, B bytes within a pixel of a cairo RGB24 surface
+# (a native-endian 32-bit integer 0xXXRRGGBB)
+RGB_OFFSETS = (2, 1, 0) if sys.byteorder == "little" else (1, 2, 3)
+
+class VirtualClock(object):
+    """
+    stands in for time.sleep(): sleeping just advances the clock
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def sleep(self, secs):
+        self.now += secs
+
+###
+### the off-screen canvas
+###
+
+class ExportBlock(object):
+    """
+    off-screen counterpart of BlockHead's Block: value, column,
+    and the image currently shown at (x,y)
+    """
+    def __init__(self, value, color):
+        self.value = value
+        self.column = None
+        self.x = self.y = 0
+        # (value, color, borrow_block_flag, height) -- replaced during
+        # carry shrinks and borrow expansions, as BlockHead replaces the
+        # Image in a block's EventBox
+        self.image = (value, color, False, None)
+
+class ExportColumn(object):
+    """
+    off-screen counterpart of BlockHead's Column
+    """
+    def __init__(self, number_obj, colnumber, x, y, color):
+        self.number_obj = number_obj
+        self.colnumber = colnumber
+        # (x,y) of column lower-left corner
+        self.x, self.y = x, y
+        self.color = color
+        self.blocks = []
+        # column total, as shown below the column
+        self.label = ""
+
+    def Index(self):
+        return self.colnumber
+
+    def ColumnToRight(self):
+        return self.number_obj.columns[self.Index() - 1]
+
+    def ColumnToLeft(self):
+        return self.number_obj.columns[self.Index() + 1]
+
+    def Total(self):
+        return sum(blk.value for blk in self.blocks)
+
+    def Add(self, blk):
+        self.blocks.append(blk)
+        blk.column = self
+
+    def Remove(self, blk):
+        self.blocks.remove(blk)
+
+    def Show(self):
+        """
+        stack the column's blocks, and update the column total
+        """
+        geom = self.number_obj.scene.geom
+        total = 0
+        for blk in self.blocks:
+            blk.x = self.x + geom.BLOCK_PAD
+            blk.y = self.y - (blk.value + total) * geom.UNIT_HGT
+            total += blk.value
+
+        self.label = "".join(map(str, divmod(total, geom.BASE))).lstrip("0") or "0"
+
+class ExportNumber(object):
+    """
+    off-screen counterpart of BlockHead's Number: a set of count columns
+    centered at centerX, with a block for each digit in digit_list
+    """
+    def __init__(self, scene, digit_list, count, centerX, bottomY):
+        self.scene = scene
+        self.centerX = centerX
+        self.columns = []
+        for idx in range(count):
+            col = ExportColumn(self, idx,
+                               BlockHeadRender.ColumnX(idx, count, centerX, scene.geom.COL_WID),
+                               bottomY, scene.column_colors[idx])
+            self.columns.append(col)
+
+            value = digit_list[idx] if idx < len(digit_list) else 0
+            if value:
+                scene.Block(value, col)
+                col.Show()
+
+class Scene(object):
+    """
+    the column sets and blocks of one problem, laid out left to right
+    as in BlockHead's window, and drawn on an off-screen surface
+    """
+    def __init__(self, operator, digits1, digits2, geom):
+        self.operator = operator
+        self.geom = geom
+        count = max(len(digits1), len(digits2))
+        self.column_colors, self.block_colors = BlockHeadRender.ColumnPalettes(count)
+
+        # all blocks, bottom to top
+        self.blocks = []
+
+        # room above the columns for blocks stacked past the top, as in BlockHead
+        bottomY = X.MARGIN + 2 * geom.COL_HGT
+
+        if operator == E.ADD_OP:
+            # first number, second number, answer (with column for final carry)
+            specs = [(digits1, count), (digits2, count), ([], count + 1)]
+        else:
+            # larger number (in the answer columns, as in SUB mode), smaller number
+            specs = [(digits1, count), (digits2, count)]
+
+        # one column width between column sets, for operator and equals sign
+        self.numbers = []
+        x = X.MARGIN
+        for digit_list, set_count in specs:
+            self.numbers.append(ExportNumber(self, digit_list, set_count,
+                                             x + set_count * geom.COL_WID // 2, bottomY))
+            x += (set_count + 1) * geom.COL_WID
+
+        if operator == E.ADD_OP:
+            self.Num1, self.Num2, self.NumA = self.numbers
+        else:
+            self.NumA, self.Num2 = self.numbers
+
+        self.width = x - geom.COL_WID + X.MARGIN
+        self.height = bottomY + X.LABEL_SPACE
+        self.surface = cairo.ImageSurface(cairo.FORMAT_RGB24, self.width, self.height)
+
+    def Block(self, value, colobj):
+        """
+        create a block in the specified column, on top of the other blocks
+        """
+        blk = ExportBlock(value, self.block_colors[colobj.Index()])
+        self.blocks.append(blk)
+        colobj.Add(blk)
+        return blk
+
+    def Destroy(self, blk):
+        self.blocks.remove(blk)
+
+    def Render(self):
+        """
+        draw the scene, and return its pixels (a STRING, in cairo's RGB24 format)
+        """
+        geom = self.geom
+        ctx = cairo.Context(self.surface)
+        # no antialiasing: exact colors, and few of them (for GIF palettes)
+        ctx.set_antialias(cairo.ANTIALIAS_NONE)
+        options = cairo.FontOptions()
+        options.set_antialias(cairo.ANTIALIAS_NONE)
+        ctx.set_font_options(options)
+
+        BlockHeadRender.SetColor(ctx, X.BACKGROUND_PIXEL_COLOR)
+        ctx.paint()
+
+        for number in self.numbers:
+            for col in number.columns:
+                BlockHeadRender.DrawColumn(ctx, col.x, col.y, col.color, geom)
+                if col.label:
+                    BlockHeadRender.DrawText(ctx, col.label, col.x + geom.COL_WID // 2,
+                                             col.y + X.LABEL_SPACE // 2, geom.UNIT_HGT // 2)
+
+        # operator and equals sign, between the column sets
+        symbols = [self.operator, "="]
+        for number, next_number, symbol in zip(self.numbers, self.numbers[1:], symbols):
+            BlockHeadRender.DrawText(ctx, symbol,
+                                     (number.columns[0].x + geom.COL_WID + next_number.columns[-1].x) // 2,
+                                     number.columns[0].y - geom.COL_HGT // 2, geom.UNIT_HGT)
+
+        for blk in self.blocks:
+            value, color, borrow_block_flag, hgt = blk.image
+            BlockHeadRender.DrawBlock(ctx, blk.x, blk.y, value, color, geom, borrow_block_flag, hgt)
+
+        self.surface.flush()
+        return str(self.surface.get_data())
+
+###
+### frames
+###
+
+def _FirstDiff(old, new):
+    """
+    index of the first byte at which two (different) STRINGs of equal length differ
+    """
+    lo, hi = 0, len(old)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if buffer(old, 0, mid) == buffer(new, 0, mid):
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+def _LastDiff(old, new):
+    """
+    index of the last byte at which two (different) STRINGs of equal length differ
+    """
+    lo, hi = 0, len(old)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if buffer(old, mid) == buffer(new, mid):
+            hi = mid
+        else:
+            lo = mid
+    return lo
+
+def ChangedRect(old, new, width, height):
+    """
+    (x, y, width, height) of the smallest rectangle containing all the pixels
+    that differ between two frames (the whole frame if there is no old frame)
+    """
+    if old is None:
+        return (0, 0, width, height)
+
+    stride = width * 4
+    rows = [y for y in xrange(height)
+            if buffer(old, y * stride, stride) != buffer(new, y * stride, stride)]
+    if not rows:
+        # nothing changed: a token subframe
+        return (0, 0, 1, 1)
+
+    left, right = width, 0
+    for y in rows:
+        old_row, new_row = old[y * stride:(y+1) * stride], new[y * stride:(y+1) * stride]
+        left = min(left, _FirstDiff(old_row, new_row) // 4)
+        right = max(right, _LastDiff(old_row, new_row) // 4)
+    return (left, rows[0], right - left + 1, rows[-1] - rows[0] + 1)
+
+def RGBRows(pixels, width, rect):
+    """
+    generator: yield the rows of a frame's rectangle, as bytearrays of R,G,B bytes
+    """
+    x, y, wid, hgt = rect
+    stride = width * 4
+    red, green, blue = RGB_OFFSETS
+    for row in xrange(y, y + hgt):
+        start = row * stride + x * 4
+        pixel_bytes = bytearray(pixels[start:start + wid * 4])
+        rgb = bytearray(wid * 3)
+        rgb[0::3] = pixel_bytes[red::4]
+        rgb[1::3] = pixel_bytes[green::4]
+        rgb[2::3] = pixel_bytes[blue::4]
+        yield rgb
+
+def PixelRows(pixels, width, rect):
+    """
+    generator: yield the rows of a frame's rectangle, as arrays of INTs 0xRRGGBB
+    """
+    x, y, wid, hgt = rect
+    stride = width * 4
+    for row in xrange(y, y + hgt):
+        start = row * stride + x * 4
+        yield [pix & 0xFFFFFF for pix in array("I", pixels[start:start + wid * 4])]
+
+class Recorder(object):
+    """
+    capture the scene at each step of the animation, passing only
+    frames that differ from the one before to the sink
+    """
+    def __init__(self, scene, sink, clock):
+        self.scene = scene
+        self.sink = sink
+        self.clock = clock
+        # pixels of the frame last written to the sink
+        self.last = None
+        # frame not yet written (its duration is not known yet):
+        # (pixels, changed rectangle, start time)
+        self.pending = None
+        self.frames = 0
+
+    def Capture(self):
+        pixels = self.scene.Render()
+        if pixels == (self.pending[0] if self.pending else self.last):
+            return
+
+        now = self.clock.now
+        if self.pending:
+            start = self.pending[2]
+            if now - start < self.sink.MIN_DELAY:
+                # pending frame would be shown too briefly for this format:
+                # the new frame takes its place
+                self.pending = (pixels, self.ChangedRect(pixels), start)
+                return
+            self.Flush(now)
+        self.pending = (pixels, self.ChangedRect(pixels), now)
+
+    def ChangedRect(self, pixels):
+        return ChangedRect(self.last, pixels, self.scene.width, self.scene.height)
+
+    def Flush(self, end):
+        """
+        write the pending frame, to be shown until time end
+        """
+        pixels, rect, start = self.pending
+        self.sink.Write(pixels, rect, start, end)
+        self.last = pixels
+        self.pending = None
+        self.frames += 1
+
+    def Close(self, hold=X.FINAL_HOLD):
+        if self.pending:
+            self.Flush(self.clock.now + hold)
+        self.sink.Close()
+
+###
+### sinks: animated PNG, animated GIF, PNG frames
+###
+
+def PNGChunk(kind, payload):
+    return (struct.pack(">I", len(payload)) + kind + payload +
+            struct.pack(">I", zlib.crc32(kind + payload) & 0xFFFFFFFF))
+
+def PNGImageData(pixels, width, rect):
+    """
+    compressed image data for a frame's rectangle (filter type 0 on each row)
+    """
+    return zlib.compress("".join("\0" + str(row) for row in RGBRows(pixels, width, rect)))
+
+def PNGHeader(width, height):
+    # 8-bit RGB
+    return PNG_SIGNATURE + PNGChunk("IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+class APNGWriter(object):
+    """
+    animated PNG: each frame after the first is a subframe,
+    covering the pixels that changed
+    """
+    MIN_DELAY = 0
+
+    def __init__(self, path, width, height):
+        self.width = width
+        self.outfile = open(path, "wb")
+        self.outfile.write(PNGHeader(width, height))
+        # frame count is patched in by Close()
+        self.actl_pos = self.outfile.tell()
+        self.outfile.write(PNGChunk("acTL", struct.pack(">II", 0, 0)))
+        self.frames = 0
+        self.sequence = 0
+
+    def Write(self, pixels, rect, start, end):
+        x, y, wid, hgt = rect
+        # delay in milliseconds, rounded so the errors do not add up
+        delay = min(int(round(end * 1000)) - int(round(start * 1000)), 0xFFFF)
+        # dispose: none; blend: source
+        self.outfile.write(PNGChunk("fcTL", struct.pack(">IIIIIHHBB", self.sequence,
+                                                        wid, hgt, x, y, delay, 1000, 0, 0)))
+        self.sequence += 1
+
+        data = PNGImageData(pixels, self.width, rect)
+        if self.frames == 0:
+            self.outfile.write(PNGChunk("IDAT", data))
+        else:
+            self.outfile.write(PNGChunk("fdAT", struct.pack(">I", self.sequence) + data))
+            self.sequence += 1
+        self.frames += 1
+
+    def Close(self):
+        self.outfile.write(PNGChunk("IEND", ""))
+        self.outfile.seek(self.actl_pos)
+        # loop forever
+        self.outfile.write(PNGChunk("acTL", struct.pack(">II", self.frames, 0)))
+        self.outfile.close()
+
+def LZWEncode(indexes, code_size):
+    """
+    GIF's variable-length-code LZW compression of a STRING of palette indexes
+    """
+    clear_code = 1 << code_size
+    end_code = clear_code + 1
+
+    out = bytearray()
+    state = {"bits": 0, "count": 0, "width": code_size + 1}
+    def _emit(code):
+        state["bits"] |= code << state["count"]
+        state["count"] += state["width"]
+        while state["count"] >= 8:
+            out.append(state["bits"] & 0xFF)
+            state["bits"] >>= 8
+            state["count"] -= 8
+
+    table = {}
+    next_code = end_code + 1
+    _emit(clear_code)
+
+    prefix = ord(indexes[0])
+    for char in indexes[1:]:
+        key = (prefix, char)
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+
+        _emit(prefix)
+        if next_code < 4096:
+            table[key] = next_code
+            next_code += 1
+            # the decoder's table is one code behind the encoder's
+            if next_code - 1 >= 1 << state["width"]:
+                state["width"] += 1
+        else:
+            # table full: start over
+            _emit(clear_code)
+            table = {}
+            next_code = end_code + 1
+            state["width"] = code_size + 1
+        prefix = ord(char)
+
+    _emit(prefix)
+    _emit(end_code)
+    if state["count"]:
+        out.append(state["bits"] & 0xFF)
+    return str(out)
+
+class GIFWriter(object):
+    """
+    animated GIF: each frame after the first is a subframe, with its own
+    palette, covering the pixels that changed
+    """
+    # viewers show shorter frames for much longer than asked
+    MIN_DELAY = 0.02
+
+    def __init__(self, path, width, height):
+        self.width = width
+        self.outfile = open(path, "wb")
+        # header, screen descriptor (no global palette), loop forever
+        self.outfile.write("GIF89a" + struct.pack("<HHBBB", width, height, 0, 0, 0))
+        self.outfile.write("\x21\xFF\x0BNETSCAPE2.0\x03\x01\x00\x00\x00")
+
+    def Write(self, pixels, rect, start, end):
+        x, y, wid, hgt = rect
+        rows = list(PixelRows(pixels, self.width, rect))
+
+        colors = sorted(set().union(*rows))
+        if len(colors) > 256:
+            raise ValueError("too many colors for GIF: %d" % len(colors))
+        index = dict((color, chr(i)) for i, color in enumerate(colors))
+        indexes = "".join("".join([index[pix] for pix in row]) for row in rows)
+
+        # palette size: a power of 2
+        bits = 1
+        while 1 << bits < len(colors):
+            bits += 1
+        palette = "".join(struct.pack(">I", color)[1:] for color in colors)
+        palette += "\0" * (3 * (1 << bits) - len(palette))
+
+        # delay in hundredths of a second, rounded so the errors do not add up
+        delay = min(int(round(end * 100)) - int(round(start * 100)), 0xFFFF)
+        # graphic control: keep this frame in place under the next one
+        self.outfile.write("\x21\xF9\x04" + struct.pack("<BHBB", 1 << 2, delay, 0, 0))
+        self.outfile.write("\x2C" + struct.pack("<HHHHB", x, y, wid, hgt, 0x80 | (bits - 1)))
+        self.outfile.write(palette)
+
+        code_size = max(2, bits)
+        data = LZWEncode(indexes, code_size)
+        self.outfile.write(chr(code_size))
+        for pos in xrange(0, len(data), 255):
+            block = data[pos:pos + 255]
+            self.outfile.write(chr(len(block)) + block)
+        self.outfile.write("\0")
+
+    def Close(self):
+        self.outfile.write(";")
+        self.outfile.close()
+
+class FrameWriter(object):
+    """
+    a directory of PNG frames, with an ffmpeg "concat" list
+    that gives each frame's duration
+    """
+    MIN_DELAY = 0
+    LIST_NAME = "frames.txt"
+
+    def __init__(self, path, width, height):
+        self.path = path
+        self.width, self.height = width, height
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.listfile = open(os.path.join(path, self.LIST_NAME), "w")
+        self.listfile.write("ffconcat version 1.0\n")
+        self.frames = 0
+        self.name = None
+
+    def Write(self, pixels, rect, start, end):
+        # a video needs whole frames
+        self.frames += 1
+        self.name = "frame-%05d.png" % self.frames
+        outfile = open(os.path.join(self.path, self.name), "wb")
+        outfile.write(PNGHeader(self.width, self.height))
+        outfile.write(PNGChunk("IDAT", PNGImageData(pixels, self.width,
+                                                    (0, 0, self.width, self.height))))
+        outfile.write(PNGChunk("IEND", ""))
+        outfile.close()
+
+        self.listfile.write("file '%s'\nduration %.3f\n" % (self.name, end - start))
+
+    def Close(self):
+        # the concat demuxer ignores the last frame's duration, unless the frame is repeated
+        if self.name:
+            self.listfile.write("file '%s'\n" % self.name)
+        self.listfile.close()
+
+SINKS = {X.APNG: APNGWriter, X.GIF: GIFWriter, X.FRAMES: FrameWriter}
+
+###
+### the solution, animated as BlockHead animates it
+###
+
+class Animation(object):
+    """
+    play the solution of one problem on a Scene, following the moves
+    BlockHead's hints suggest, and animating them as Column.Carry(),
+    Column.Borrow(), PlaceWidget() and AniMove() do
+    """
+    def __init__(self, scene, sink):
+        self.scene = scene
+        self.clock = VirtualClock()
+        self.recorder = Recorder(scene, sink, self.clock)
+        self.sleep = self.clock.sleep
+
+    def UpdateScreen(self):
+        self.recorder.Capture()
+
+    def Show(self, col):
+        col.Show()
+        self.UpdateScreen()
+
+    def AniMove(self, blk, endX, endY, duration=R.IN_COL):
+        """
+        animate the move of a block from current position to (endX,endY)
+        """
+        origX, origY = blk.x, blk.y
+        count = R.MOVE_FRAMES
+        for i in range(1, count+1):
+            pf = i * 1.0 / count
+            blk.x = int(pf*endX + (1-pf)*origX)
+            blk.y = int(pf*endY + (1-pf)*origY)
+            self.UpdateScreen()
+            self.sleep(duration/count)
+
+        blk.x, blk.y = endX, endY
+
+    def PlaceBlock_Add(self, blk, destcol):
+        """
+        drag a block to the top of an answer column
+        """
+        geom = self.scene.geom
+        origcol = blk.column
+        self.AniMove(blk, destcol.x + geom.BLOCK_PAD,
+                     destcol.y - (destcol.Total() + blk.value) * geom.UNIT_HGT, R.COL_TO_COL)
+
+        destcol.Add(blk)
+        origcol.Remove(blk)
+        origcol.Show()
+        self.Show(destcol)
+
+    def PlaceBlock_Sub(self, blk, destcol):
+        """
+        drag a block onto the top block of an answer column, and subtract it
+        """
+        scene = self.scene
+        origcol = blk.column
+        topblk = destcol.blocks[-1]
+        self.AniMove(blk, topblk.x, topblk.y, R.COL_TO_COL)
+        self.sleep(R.PAUSE)
+
+        scene.Destroy(blk)
+        origcol.Remove(blk)
+        self.Show(origcol)
+
+        result = destcol.Total() - blk.value
+        for oldblk in destcol.blocks:
+            scene.Destroy(oldblk)
+        destcol.blocks = []
+        if result > 0:
+            scene.Block(result, destcol)
+        self.Show(destcol)
+
+    def Carry(self, srccol):
+        """
+        trade P.BASE units in an answer column for 1 unit in the column to its left
+        """
+        scene, geom = self.scene, self.scene.geom
+        destcol = srccol.ColumnToLeft()
+
+        total = srccol.Total()
+        for blk in srccol.blocks:
+            scene.Destroy(blk)
+        srccol.blocks = []
+
+        fillblk = scene.Block(geom.BASE, srccol)
+        excessblk = scene.Block(total - geom.BASE, srccol) if total > geom.BASE else None
+        self.Show(srccol)
+        self.sleep(R.PAUSE)
+
+        # collapse the block of P.BASE units into a single unit
+        value, color, _, _ = fillblk.image
+        for sf in BlockHeadRender.ScaleFactors(1.0, 1.0/geom.BASE, R.SHRINK_FRAMES):
+            fillblk.image = (value, color, False, int(sf * value * geom.UNIT_HGT))
+            self.UpdateScreen()
+            self.sleep(R.SHRINK_EXPAND_DELAY)
+
+        self.sleep(R.PAUSE)
+        self.AniMove(fillblk, destcol.x + geom.BLOCK_PAD,
+                     destcol.y - (destcol.Total() + 1) * geom.UNIT_HGT)
+
+        scene.Block(1, destcol)
+        self.Show(destcol)
+
+        if excessblk:
+            self.AniMove(excessblk, srccol.x + geom.BLOCK_PAD,
+                         srccol.y - excessblk.value * geom.UNIT_HGT)
+
+        scene.Destroy(fillblk)
+        srccol.Remove(fillblk)
+        self.Show(srccol)
+
+    def Borrow(self, srccol):
+        """
+        borrow 1 unit FROM an answer column: send P.BASE units to the column to its right
+        """
+        scene, geom = self.scene, self.scene.geom
+
+        # cannot borrow from an empty column: first borrow from column to the left
+        if srccol.Total() == 0:
+            self.Borrow(srccol.ColumnToLeft())
+            self.sleep(R.PAUSE)
+
+        destcol = srccol.ColumnToRight()
+
+        # decompose last block in this column (ex: 8 --> 7+1)
+        origblk = srccol.blocks[-1]
+        scene.Destroy(origblk)
+        srccol.Remove(origblk)
+        if origblk.value > 1:
+            scene.Block(origblk.value - 1, srccol)
+            self.Show(srccol)
+        borrowblk = scene.Block(1, srccol)
+        self.Show(srccol)
+
+        top_of_destblock_Y = destcol.y - destcol.Total() * geom.UNIT_HGT
+        self.AniMove(borrowblk, destcol.x + geom.BLOCK_PAD, top_of_destblock_Y - geom.UNIT_HGT)
+
+        # expand vertically from 1 unit to P.BASE units
+        self.sleep(R.PAUSE)
+        for i in range(1, geom.BASE+1):
+            borrowblk.image = (i, scene.block_colors[srccol.Index()-1], True, None)
+            borrowblk.y = top_of_destblock_Y - i * geom.UNIT_HGT
+            self.UpdateScreen()
+            self.sleep(R.SHRINK_EXPAND_DELAY)
+
+        scene.Destroy(borrowblk)
+        srccol.Remove(borrowblk)
+        self.Show(srccol)
+        scene.Block(geom.BASE, destcol)
+        self.Show(destcol)
+
+    def CarryAll(self):
+        """
+        carry from answer columns, starting at the ONES column, as long as
+        there is anything to carry
+        """
+        base = self.scene.geom.BASE
+        while True:
+            carrycols = [col for col in self.scene.NumA.columns if col.Total() >= base]
+            if not carrycols:
+                return
+            self.Carry(carrycols[0])
+            self.sleep(R.PAUSE)
+
+    def Play(self):
+        """
+        play the whole solution; return the number of frames written
+        """
+        scene = self.scene
+        self.UpdateScreen()
+        self.sleep(R.PAUSE)
+
+        if scene.operator == E.ADD_OP:
+            # drag the blocks of both numbers column by column, carrying whenever possible
+            for idx in range(len(scene.Num1.columns)):
+                for number in (scene.Num1, scene.Num2):
+                    for blk in list(number.columns[idx].blocks):
+                        self.PlaceBlock_Add(blk, scene.NumA.columns[idx])
+                        self.sleep(R.PAUSE)
+                        self.CarryAll()
+        else:
+            # subtract column by column, borrowing first if need be
+            for idx in range(len(scene.Num2.columns)):
+                destcol = scene.NumA.columns[idx]
+                for blk in list(scene.Num2.columns[idx].blocks):
+                    if destcol.Total() < blk.value:
+                        self.Borrow(destcol.ColumnToLeft())
+                        self.sleep(R.PAUSE)
+                    self.PlaceBlock_Sub(blk, destcol)
+                    self.sleep(R.PAUSE)
+
+        self.recorder.Close()
+        return self.recorder.frames
+
+###
+### batch export
+###
+
+def ExportProblem(args):
+    """
+    export the animated solution of one problem (runs in a worker process)
+
+    args: (operator, digits1, digits2, number base, output path, output format)
+
+    returns (output path, number of frames, duration in seconds)
+    """
+    operator, digits1, digits2, base, outpath, fmt = args
+    scene = Scene(operator, digits1, digits2, Geometry(base=base))
+    animation = Animation(scene, SINKS[fmt](outpath, scene.width, scene.height))
+    frames = animation.Play()
+    return outpath, frames, animation.clock.now + X.FINAL_HOLD
+
+def Tasks(inpaths, outdir, fmt, base):
+    """
+    generator: yield an ExportProblem() task for each valid problem in the
+    input files; outputs are numbered as BlockHeadWorksheets.py numbers problems
+    """
+    for inpath in inpaths:
+        name = os.path.splitext(os.path.basename(inpath))[0]
+        infile = open(inpath, "rb")
+        try:
+            records = BlockHeadGrader.ReadRecords(infile, BlockHeadGrader.FileFormat(inpath))
+            for number, (operator, digits1, digits2) in enumerate(
+                    BlockHeadGrader.Problems(records, base), 1):
+                if max(len(digits1), len(digits2)) > X.MAX_COLUMNS:
+                    print >> sys.stderr, "skipping %s problem %d: more than %d columns" % (
+                        name, number, X.MAX_COLUMNS)
+                    continue
+                outpath = os.path.join(outdir, "%s-%03d%s" % (name, number, X.EXTENSIONS[fmt]))
+                yield (operator, digits1, digits2, base, outpath, fmt)
+        finally:
+            infile.close()
+
+###
+### main routine
+###
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage="%prog [options] INFILE ...")
+    parser.add_option("-d", "--output-dir", default=".",
+                      help="directory for animations (default: current directory)")
+    parser.add_option("-f", "--format", choices=[X.APNG, X.GIF, X.FRAMES], default=X.APNG,
+                      help="output format: apng, gif, or frames (default: %default)")
+    parser.add_option("-b", "--base", type="int", default=E.BASE,
+                      help="number base (default: %default)")
+    parser.add_option("-j", "--processes", type="int",
+                      help="worker processes (default: one per CPU)")
+    opts, args = parser.parse_args()
+
+    if not args:
+        parser.error("specify one or more problem set files")
+    if not 2 <= opts.base <= 10:
+        parser.error("number base must be between 2 and 10")
+
+    tasks = Tasks(args, opts.output_dir, opts.format, opts.base)
+
+    if opts.processes == 1:
+        results = (ExportProblem(task) for task in tasks)
+    else:
+        pool = multiprocessing.Pool(opts.processes)
+        results = pool.imap_unordered(ExportProblem, tasks)
+
+    for outpath, frames, duration in results:
+        print "%s: %d frame(s), %.1f seconds" % (outpath, frames, duration)
+    sys.exit(0)
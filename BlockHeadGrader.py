@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# BlockHeadGrader.py -- batch grader for student answers
+# Copyright 2008, 2009 John Posner
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+BlockHeadGrader -- batch grader
+
+read (operand1, operator, operand2, student_answer) records
+from a CSV or JSONL file, check each answer using BlockHead's
+carry/borrow rules, and write one result record per input record,
+in input order; a wrong answer is explained in terms of the carries
+and borrows the student missed
+
+usage: BlockHeadGrader.py [options] [INFILE]
+"""
+
+__date__ = '21-Jul-2009'
+__version__ = 2039
+
+import csv
+import json
+import multiprocessing
+import optparse
+import os
+import sys
+from collections import deque
+from itertools import islice
+
+import BlockHeadEngine
+from BlockHeadEngine import E
+
+class G():
+    """
+    grader parameters
+    """
+    # record fields, in CSV column order
+    FIELDS = ["operand1", "operator", "operand2", "student_answer"]
+    RESULT_FIELDS = FIELDS + ["verdict", "expected", "carries", "borrows",
+                              "explanation", "error"]
+
+    # file formats
+    CSV, JSONL = "csv", "jsonl"
+
+    # records per task sent to a worker process
+    CHUNK_SIZE = 500
+    # tasks in flight per worker process (bounds memory use)
+    TASKS_PER_PROCESS = 4
+
+def ReadRecords(infile, fmt):
+    """
+    generator: yield one record (a list of 4 STRINGs) per input line
+
+    a line that cannot be read as a record is yielded anyway (JSONL: the
+    line itself, as operand1), so that GradeRecord() reports it as invalid
+    """
+    if fmt == G.JSONL:
+        for line in infile:
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                obj = None
+            if not isinstance(obj, dict):
+                yield [line.strip()] + [""] * (len(G.FIELDS) - 1)
+                continue
+            yield [FieldString(obj.get(key, "")) for key in G.FIELDS]
+
+    elif fmt == G.CSV:
+        for row in csv.reader(infile):
+            # skip blank lines and an optional header line
+            if not row or row[0].strip() == G.FIELDS[0]:
+                continue
+            yield [fld.strip() for fld in (row + [""] * len(G.FIELDS))[:len(G.FIELDS)]]
+
+def FieldString(value):
+    """
+    a JSON value as a STRING, as it would appear in a CSV file
+    (non-ASCII text is encoded as UTF-8)
+    """
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return str(value)
+
+def Problems(records, base=E.BASE):
+    """
+    generator: yield (operator, digits1, digits2) for each record that is a
+    valid problem (digits as INTs, ONES column first), skipping the others
+    """
+    for operand1, operator, operand2, _ in records:
+        try:
+            BlockHeadEngine.Solve(operand1, operator, operand2, base)
+        except ValueError, exc_data:
+            print >> sys.stderr, "skipping %s %s %s: %s" % (operand1, operator, operand2, exc_data)
+            continue
+        yield (operator,
+               BlockHeadEngine.DigitList(operand1, base),
+               BlockHeadEngine.DigitList(operand2, base))
+
+def GradeRecord(record, base):
+    """
+    grade one record, returning a result dictionary
+    """
+    result = dict(zip(G.FIELDS, record))
+    operand1, operator, operand2, answer = record
+
+    try:
+        verdict, expected, events = BlockHeadEngine.Grade(operand1, operator, operand2,
+                                                          answer, base)
+    except ValueError, exc_data:
+        result.update(verdict="invalid", error=str(exc_data))
+        return result
+
+    result.update(verdict=verdict,
+                  expected=expected,
+                  carries=events.count(E.CARRY),
+                  borrows=events.count(E.BORROW) + events.count(E.CASCADE))
+
+    if verdict == "incorrect":
+        mistakes = BlockHeadEngine.ExplainAnswer(operand1, operator, operand2, answer, base)
+        result.update(explanation="; ".join(msg for _, _, msg in mistakes))
+    return result
+
+def GradeChunk(args):
+    """
+    grade a list of records (runs in a worker process)
+    """
+    records, base = args
+    return [GradeRecord(record, base) for record in records]
+
+def GradeStream(records, base=E.BASE, processes=None, chunk_size=G.CHUNK_SIZE):
+    """
+    generator: grade a stream of records, yielding results in input order
+
+    records are sent to a pool of worker processes in chunks; no more than
+    G.TASKS_PER_PROCESS chunks per process are outstanding at any time,
+    so memory use does not depend on the size of the input
+    """
+    records = iter(records)
+    def _chunks():
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                return
+            yield chunk, base
+
+    # single process: no pool needed
+    if processes == 1:
+        for args in _chunks():
+            for result in GradeChunk(args):
+                yield result
+        return
+
+    pool = multiprocessing.Pool(processes)
+    max_pending = G.TASKS_PER_PROCESS * (processes or multiprocessing.cpu_count())
+    pending = deque()
+    try:
+        for args in _chunks():
+            pending.append(pool.apply_async(GradeChunk, (args,)))
+            # wait for the oldest task, to keep the results in input order
+            if len(pending) >= max_pending:
+                for result in pending.popleft().get():
+                    yield result
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def WriteResults(results, outfile, fmt):
+    """
+    write result dictionaries, one per line
+    """
+    if fmt == G.JSONL:
+        for result in results:
+            outfile.write(json.dumps(result, sort_keys=True) + "\n")
+
+    elif fmt == G.CSV:
+        writer = csv.DictWriter(outfile, G.RESULT_FIELDS, restval="")
+        writer.writerow(dict(zip(G.RESULT_FIELDS, G.RESULT_FIELDS)))
+        for result in results:
+            writer.writerow(result)
+
+def FileFormat(path, default=G.CSV):
+    """
+    determine file format from filename extension
+    """
+    ext = os.path.splitext(path or "")[1].lower()
+    return {".csv": G.CSV, ".jsonl": G.JSONL, ".json": G.JSONL}.get(ext, default)
+
+###
+### main routine
+###
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage="%prog [options] [INFILE]")
+    parser.add_option("-o", "--output", help="output file (default: standard output)")
+    parser.add_option("-f", "--format", choices=[G.CSV, G.JSONL],
+                      help="input format (default: from filename, else csv)")
+    parser.add_option("-F", "--output-format", choices=[G.CSV, G.JSONL],
+                      help="output format (default: same as input)")
+    parser.add_option("-b", "--base", type="int", default=E.BASE,
+                      help="number base (default: %default)")
+    parser.add_option("-j", "--processes", type="int",
+                      help="worker processes (default: one per CPU)")
+    parser.add_option("-c", "--chunk-size", type="int", default=G.CHUNK_SIZE,
+                      help="records per worker task (default: %default)")
+    opts, args = parser.parse_args()
+
+    if len(args) > 1:
+        parser.error("at most one input file")
+    if not 2 <= opts.base <= 10:
+        parser.error("number base must be between 2 and 10")
+
+    inpath = args[0] if args else None
+    in_fmt = opts.format or FileFormat(inpath)
+    out_fmt = opts.output_format or FileFormat(opts.output, in_fmt)
+
+    infile = open(inpath, "rb") if inpath else sys.stdin
+    outfile = open(opts.output, "wb") if opts.output else sys.stdout
+
+    results = GradeStream(ReadRecords(infile, in_fmt), opts.base,
+                          opts.processes, opts.chunk_size)
+    WriteResults(results, outfile, out_fmt)
+
+    outfile.close()
+    sys.exit(0)
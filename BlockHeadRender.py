@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# BlockHeadRender.py -- BlockHead's column/block geometry and colors, for on-screen and off-screen drawing
+# Copyright 2008, 2009 John Posner
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+BlockHeadRender -- geometry, colors, and off-screen drawing
+
+BlockHead.py takes its colors and column layout from here, and
+the off-screen tools draw columns and blocks with cairo, so that
+what they produce matches the screen
+"""
+
+__date__ = '21-Jul-2009'
+__version__ = 2039
+
+import ctypes
+import ctypes.util
+import time
+
+import cairo
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class R():
+    """
+    rendering parameters
+    """
+    # block width
+    BLOCK_WID = 40
+    # padding between block and column edge
+    BLOCK_PAD = 16
+    # number base
+    BASE = 10
+
+    # device profiles: (name, block width, padding), smallest first
+    # (the images in the app's directory are drawn for "desktop")
+    PROFILES = [("xo", 24, 12),
+                ("compact", 32, 13),
+                ("desktop", 40, 16),
+                ("large", 56, 22),
+                ("huge", 80, 32),
+                ]
+    # preferred block width on the screen (millimeters)
+    BLOCK_MM = 10.0
+
+    # animation times
+    IN_COL = 0.10
+    COL_TO_COL = 0.20
+    SHRINK_EXPAND_DELAY = 0.07
+    PAUSE = 0.25
+    # animation steps: block move, carry shrink
+    MOVE_FRAMES = 15
+    SHRINK_FRAMES = 12
+    # fewest steps, on a slow device
+    MIN_FRAMES = 4
+
+    # clock_gettime() clock ID
+    CLOCK_MONOTONIC = 1
+
+    # colors repeat every N columns
+    COLUMN_PIXEL_COLORS = [0xA6E2F400, 0xFFD5D700, 0xD3FFD300, 0xFEEDB100, 0xD1B5F300, 0xD8C3C100,
+                           0xA6E2F400, 0xFFD5D700, 0xD3FFD300, 0xFEEDB100,
+                           ]
+    BLOCK_PIXEL_COLORS = [0x3280EA00, 0xE35BA000, 0x6FD48A00, 0xF2BC0200, 0xCB00FF00, 0x99667600,
+                          0x3280EA00, 0xE35BA000, 0x6FD48A00, 0xF2BC0200,
+                          ]
+    # gray column, and gray block, for final carry
+    CARRY_COLUMN_PIXEL_COLOR = 0xE8E8E800
+    CARRY_BLOCK_PIXEL_COLOR = 0xC0C0C000
+
+    # unit lines and block outlines
+    LINE_PIXEL_COLOR = 0x00000000
+
+    # font
+    FONTNAME = "Sans"
+
+class Geometry(object):
+    """
+    sizes derived from the block width and padding,
+    in the same way as the sizes in BlockHead.P
+    """
+    def __init__(self, block_wid=R.BLOCK_WID, block_pad=R.BLOCK_PAD, base=R.BASE):
+        self.BASE = base
+        self.BLOCK_WID = block_wid
+        self.BLOCK_PAD = block_pad
+        # height of one unit
+        self.UNIT_HGT = block_wid
+        # column width (make the columns contiguous)
+        self.COL_WID = block_wid + 2*block_pad
+        # column height
+        self.COL_HGT = base * self.UNIT_HGT
+
+def ChooseProfile(screen_hgt, dpi, chrome_hgt, base=R.BASE, name=None):
+    """
+    choose the device profile for a screen: among the profiles whose window
+    (2*base units of blocks, plus chrome_hgt pixels) fits the screen height,
+    the one whose blocks come closest to R.BLOCK_MM wide
+
+    name: use the profile with this name, if there is one
+    """
+    for profile in R.PROFILES:
+        if profile[0] == name:
+            return profile
+
+    fitting = ([profile for profile in R.PROFILES
+                if 2 * base * profile[1] + chrome_hgt <= screen_hgt]
+               or R.PROFILES[:1])
+    target_wid = R.BLOCK_MM * dpi / 25.4
+    return min(fitting, key=lambda profile: abs(profile[1] - target_wid))
+
+def ColumnPalettes(count):
+    """
+    return (column colors, block colors) for a set of count columns,
+    plus a gray column/block for the final carry
+    """
+    column_colors = [R.COLUMN_PIXEL_COLORS[i % len(R.COLUMN_PIXEL_COLORS)] for i in range(count)]
+    block_colors = [R.BLOCK_PIXEL_COLORS[i % len(R.BLOCK_PIXEL_COLORS)] for i in range(count)]
+    return (column_colors + [R.CARRY_COLUMN_PIXEL_COLOR],
+            block_colors + [R.CARRY_BLOCK_PIXEL_COLOR])
+
+def ColumnX(idx, count, centerX, col_wid):
+    """
+    X-coordinate of the left edge of column idx (ONES column is 0)
+    in a set of count columns centered at centerX
+    """
+    # all X-coordinates are offsets from the middle column's position
+    if count % 2 == 1:
+        # odd number of columns: middle column does not start at center of column-set
+        middle_idx = count // 2
+        offset = -col_wid // 2
+    else:
+        # even number of columns: middle column DOES start at center of column-set
+        middle_idx = count // 2 - 1
+        offset = 0
+
+    return centerX + (middle_idx - idx) * col_wid + offset
+
+def UnitLineOffsets(value, unit_hgt, base, borrow_block_flag=False):
+    """
+    Y-offsets of the unit lines within a block of the specified value
+    (a "borrow block" is always divided into base segments)
+    """
+    if borrow_block_flag:
+        line_count = base
+        segment_hgt = value * unit_hgt // base
+    else:
+        line_count = value
+        segment_hgt = unit_hgt
+
+    return [i * segment_hgt for i in range(1, line_count)]
+
+def ScaleFactors(start, end, count):
+    """
+    scale factors for the count steps of a shrink/expand animation,
+    from start (not included) to end
+    """
+    return [end*(1.0*i/count) + start*(1-1.0*i/count) for i in range(1, count+1)]
+
+###
+### animation pacing
+###
+
+class TimeSpec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+def MonotonicClock():
+    """
+    return a function that reads the monotonic clock (seconds),
+    or time.time, if the C library has no clock_gettime()
+    """
+    try:
+        lib = ctypes.CDLL(ctypes.util.find_library("rt") or ctypes.util.find_library("c"))
+        clock_gettime = lib.clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(TimeSpec)]
+    timespec = TimeSpec()
+    def _monotonic():
+        clock_gettime(R.CLOCK_MONOTONIC, ctypes.byref(timespec))
+        return timespec.tv_sec + timespec.tv_nsec * 1e-9
+    return _monotonic
+
+Monotonic = MonotonicClock()
+
+def PacedFrames(count, duration, sleep=time.sleep, clock=Monotonic):
+    """
+    generator: frame numbers (1 to count) of an animation lasting
+    duration seconds; frame N is due (N-1)/count of the way through,
+    and the last frame stays on screen until the end
+
+    a frame that is not drawn before the next one is due is dropped,
+    so the animation keeps its duration on a slow device (the last
+    frame is never dropped)
+    """
+    if duration <= 0:
+        for frame in range(1, count+1):
+            yield frame
+        return
+
+    step = float(duration) / count
+    start = clock()
+    frame = 1
+    while True:
+        yield frame
+        if frame == count:
+            break
+        # the frame that is due now, or the next one
+        frame = min(max(frame + 1, int((clock() - start) / step) + 1), count)
+        wait = start + (frame - 1) * step - clock()
+        if wait > 0:
+            sleep(wait)
+
+    wait = start + duration - clock()
+    if wait > 0:
+        sleep(wait)
+
+def FrameCount(duration, frame_cost, max_frames):
+    """
+    number of frames (at most max_frames) that can be drawn in
+    duration seconds, at frame_cost seconds each
+    """
+    if frame_cost <= 0:
+        return max_frames
+    return max(min(int(duration / frame_cost), max_frames), min(R.MIN_FRAMES, max_frames))
+
+###
+### block bitmaps
+###
+
+def RGBBytes(color_int):
+    """
+    RGB bytes of a color, specd as integer 0xRRGGBBAA
+    """
+    return chr((color_int >> 24) & 0xFF) + chr((color_int >> 16) & 0xFF) + chr((color_int >> 8) & 0xFF)
+
+def BlockBitmaps(values, colors, geom, borrow_flags=(False, True)):
+    """
+    raster images of blocks, drawn as BlockHead draws them: fill, unit lines
+    (a "borrow block" is divided into base segments), and outline
+
+    return dict of (value, color, borrow block flag) -> string of RGB pixels,
+    geom.BLOCK_WID wide and value * geom.UNIT_HGT high
+
+    all the images are generated in one pass with NumPy array operations,
+    or row by row if NumPy is not available
+    """
+    if numpy is None:
+        return dict(((value, color, flag), BlockBitmap(value, color, geom, flag))
+                    for value in values for color in colors for flag in borrow_flags)
+
+    value_arr = numpy.array(values)
+    flag_arr = numpy.array(borrow_flags, dtype=bool)
+    hgts = value_arr * geom.UNIT_HGT
+    rows = numpy.arange(hgts.max())[numpy.newaxis, numpy.newaxis, :]
+
+    # unit-line spacing and count, per (flag, value)
+    segment_hgts = numpy.where(flag_arr[:, numpy.newaxis], hgts // geom.BASE, geom.UNIT_HGT)
+    line_counts = numpy.where(flag_arr[:, numpy.newaxis], geom.BASE, value_arr)
+
+    # line rows, per (flag, value, row): unit lines and top edge, bottom edge
+    line_rows = (((rows % segment_hgts[..., numpy.newaxis] == 0) &
+                  (rows // segment_hgts[..., numpy.newaxis] < line_counts[..., numpy.newaxis])) |
+                 (rows == hgts[numpy.newaxis, :, numpy.newaxis] - 1))
+    row_kinds = line_rows.astype(numpy.intp)
+
+    line_rgb = numpy.frombuffer(RGBBytes(R.LINE_PIXEL_COLOR), dtype=numpy.uint8)
+    bitmaps = {}
+    for color in colors:
+        # the two kinds of row: fill (with left and right edges), and line
+        row_table = numpy.empty((2, geom.BLOCK_WID, 3), dtype=numpy.uint8)
+        row_table[0] = numpy.frombuffer(RGBBytes(color), dtype=numpy.uint8)
+        row_table[0, [0, -1]] = line_rgb
+        row_table[1] = line_rgb
+
+        # pixels, per (flag, value, row, column)
+        pixels = row_table[row_kinds]
+        for flag_idx, flag in enumerate(borrow_flags):
+            for value_idx, value in enumerate(values):
+                bitmaps[value, color, flag] = pixels[flag_idx, value_idx, :hgts[value_idx]].tobytes()
+    return bitmaps
+
+def BlockBitmap(value, color, geom, borrow_block_flag=False):
+    """
+    raster image of one block, as in BlockBitmaps(), built row by row
+    """
+    wid, hgt = geom.BLOCK_WID, value * geom.UNIT_HGT
+    line = RGBBytes(R.LINE_PIXEL_COLOR)
+    fill_row = line + RGBBytes(color) * (wid - 2) + line
+    line_row = line * wid
+    line_ys = set([0, hgt - 1] + UnitLineOffsets(value, geom.UNIT_HGT, geom.BASE, borrow_block_flag))
+    return "".join(line_row if y in line_ys else fill_row for y in range(hgt))
+
+###
+### drawing with cairo
+###
+
+def SetColor(ctx, color_int):
+    """
+    set cairo source color, specd as integer 0xRRGGBBAA
+    """
+    ctx.set_source_rgb(((color_int >> 24) & 0xFF) / 255.0,
+                       ((color_int >> 16) & 0xFF) / 255.0,
+                       ((color_int >> 8) & 0xFF) / 255.0)
+
+def DrawColumn(ctx, x, y, color, geom):
+    """
+    draw a column, given its lower-left corner (x,y)
+    """
+    SetColor(ctx, color)
+    ctx.rectangle(x, y - geom.COL_HGT, geom.COL_WID, geom.COL_HGT)
+    ctx.fill()
+
+def DrawBlock(ctx, x, y, value, color, geom, borrow_block_flag=False, hgt=None):
+    """
+    draw a block, given its upper-left corner (x,y):
+    filled rectangle, unit lines, and outline
+
+    hgt: squeeze/stretch the block vertically to this height, as the
+    app's carry-shrink frames do (they scale the block's BlockBitmaps()
+    sprite, which BlockPixmap() copies to the X server unscaled)
+    """
+    if hgt is not None:
+        ctx.save()
+        ctx.translate(x, y)
+        ctx.scale(1, hgt / float(value * geom.UNIT_HGT))
+        DrawBlock(ctx, 0, 0, value, color, geom, borrow_block_flag)
+        ctx.restore()
+        return
+
+    wid, hgt = geom.BLOCK_WID, value * geom.UNIT_HGT
+
+    SetColor(ctx, color)
+    ctx.rectangle(x, y, wid, hgt)
+    ctx.fill()
+
+    # one-pixel lines, on pixel centers
+    SetColor(ctx, R.LINE_PIXEL_COLOR)
+    ctx.set_line_width(1)
+    for line_y in UnitLineOffsets(value, geom.UNIT_HGT, geom.BASE, borrow_block_flag):
+        ctx.move_to(x, y + line_y + 0.5)
+        ctx.line_to(x + wid, y + line_y + 0.5)
+    ctx.rectangle(x + 0.5, y + 0.5, wid - 1, hgt - 1)
+    ctx.stroke()
+
+def DrawNumber(ctx, digit_list, centerX, bottomY, geom, count, show_blocks=True):
+    """
+    draw a set of count columns centered at centerX, with a block for
+    each digit in digit_list (INTs, ONES column first)
+    """
+    column_colors, block_colors = ColumnPalettes(count)
+
+    for idx in range(count):
+        x = ColumnX(idx, count, centerX, geom.COL_WID)
+        DrawColumn(ctx, x, bottomY, column_colors[idx], geom)
+
+        value = digit_list[idx] if idx < len(digit_list) else 0
+        if show_blocks and value:
+            DrawBlock(ctx, x + geom.BLOCK_PAD, bottomY - value * geom.UNIT_HGT,
+                      value, block_colors[idx], geom)
+
+def DrawText(ctx, text, centerX, baselineY, size, bold=True):
+    """
+    draw text centered horizontally at centerX
+    """
+    ctx.select_font_face(R.FONTNAME, cairo.FONT_SLANT_NORMAL,
+                         cairo.FONT_WEIGHT_BOLD if bold else cairo.FONT_WEIGHT_NORMAL)
+    ctx.set_font_size(size)
+    SetColor(ctx, R.LINE_PIXEL_COLOR)
+    extents = ctx.text_extents(text)
+    ctx.move_to(centerX - extents[2] / 2.0 - extents[0], baselineY)
+    ctx.show_text(text)
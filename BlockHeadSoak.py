@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# BlockHeadSoak.py -- soak test for BlockHead: resource leaks over many problems
+# Copyright 2008, 2009 John Posner
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+BlockHeadSoak -- soak test
+
+run BlockHead (under a virtual X server, if there is no display), and
+drive many New -> Draw -> solve cycles through its command methods,
+switching between ADD and SUB at random; each problem is solved with the moves
+the Hint button suggests, and the answer is checked
+
+every few cycles, record the process's memory use (RSS), the number of
+Python objects of each type, and the X windows and pixmaps the process
+holds in the X server; fail if any of these keeps growing
+
+usage: BlockHeadSoak.py [options]
+"""
+
+__date__ = '21-Jul-2009'
+__version__ = 2039
+
+import ctypes
+import ctypes.util
+import gc
+import optparse
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import BlockHeadEngine
+from BlockHeadEngine import E
+
+class S():
+    """
+    soak test parameters
+    """
+    CYCLES = 2000
+    # record resources every N cycles
+    SAMPLE_EVERY = 50
+    # cycles before the first record (pools and caches fill up)
+    WARMUP = 100
+    # a resource "keeps growing" if its peak increases in every one
+    # of this many consecutive stretches of records ...
+    SEGMENTS = 4
+    # ... by more than this much, in total
+    RSS_TOLERANCE_KB = 1024
+    OBJECT_TOLERANCE = 50
+    X_TOLERANCE = 0
+
+    # moves allowed for one problem
+    MAX_MOVES = 100
+
+    # virtual X server
+    XVFB = ["Xvfb", "-screen", "0", "1280x1024x24", "-nolisten", "tcp"]
+    XVFB_DISPLAY = 99
+    XVFB_WAIT = 10.0
+
+def StartXvfb(display_number):
+    """
+    start a virtual X server, and point DISPLAY at it
+    """
+    server = subprocess.Popen([S.XVFB[0], ":%d" % display_number] + S.XVFB[1:])
+    socket_path = "/tmp/.X11-unix/X%d" % display_number
+    deadline = time.time() + S.XVFB_WAIT
+    while not os.path.exists(socket_path):
+        if server.poll() is not None or time.time() > deadline:
+            raise RuntimeError("cannot start %s on display :%d" % (S.XVFB[0], display_number))
+        time.sleep(0.1)
+    os.environ["DISPLAY"] = ":%d" % display_number
+    return server
+
+###
+### resource measurements
+###
+
+def RSS():
+    """
+    resident set size of this process, in KB
+    """
+    statm = open("/proc/self/statm").read().split()
+    return int(statm[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+def ObjectCounts():
+    """
+    number of (garbage-collected) Python objects, by type name
+    """
+    gc.collect()
+    return Counter(type(obj).__name__ for obj in gc.get_objects())
+
+class XResClient(ctypes.Structure):
+    _fields_ = [("resource_base", ctypes.c_ulong), ("resource_mask", ctypes.c_ulong)]
+
+class XResType(ctypes.Structure):
+    _fields_ = [("resource_type", ctypes.c_ulong), ("count", ctypes.c_uint)]
+
+class XResources(object):
+    """
+    count the resources that one X client (identified by the ID of
+    one of its windows) holds in the X server, using the X-Resource
+    extension, over a connection of our own
+    """
+    def __init__(self, display_name, xid):
+        self.xlib = ctypes.cdll.LoadLibrary(ctypes.util.find_library("X11"))
+        self.xres = ctypes.cdll.LoadLibrary(ctypes.util.find_library("XRes"))
+        self.xlib.XOpenDisplay.restype = ctypes.c_void_p
+        self.xlib.XGetAtomName.restype = ctypes.c_void_p
+        self.xlib.XGetAtomName.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        self.xlib.XFree.argtypes = [ctypes.c_void_p]
+
+        self.dpy = self.xlib.XOpenDisplay(display_name)
+        if not self.dpy:
+            raise RuntimeError("cannot open display %s" % display_name)
+        self.client = self.FindClient(xid)
+        self.names = {}
+
+    def FindClient(self, xid):
+        count = ctypes.c_int()
+        clients = ctypes.POINTER(XResClient)()
+        self.xres.XResQueryClients(ctypes.c_void_p(self.dpy), ctypes.byref(count), ctypes.byref(clients))
+        try:
+            for i in range(count.value):
+                if xid & ~clients[i].resource_mask == clients[i].resource_base:
+                    return clients[i].resource_base
+        finally:
+            self.xlib.XFree(clients)
+        raise RuntimeError("no X client owns window 0x%x" % xid)
+
+    def AtomName(self, atom):
+        if atom not in self.names:
+            ptr = self.xlib.XGetAtomName(ctypes.c_void_p(self.dpy), atom)
+            self.names[atom] = ctypes.string_at(ptr)
+            self.xlib.XFree(ptr)
+        return self.names[atom]
+
+    def Counts(self):
+        """
+        return {resource type name: count}, e.g. {"WINDOW": 40, "PIXMAP": 25, ...}
+        """
+        count = ctypes.c_int()
+        types = ctypes.POINTER(XResType)()
+        self.xres.XResQueryClientResources(ctypes.c_void_p(self.dpy), ctypes.c_ulong(self.client),
+                                           ctypes.byref(count), ctypes.byref(types))
+        try:
+            return dict((self.AtomName(types[i].resource_type), types[i].count)
+                        for i in range(count.value))
+        finally:
+            self.xlib.XFree(types)
+
+def Growing(samples, tolerance):
+    """
+    does a series of samples keep growing? (see S.SEGMENTS)
+    """
+    size = len(samples) // S.SEGMENTS
+    if size == 0:
+        return False
+    peaks = [max(samples[i*size:(i+1)*size]) for i in range(S.SEGMENTS)]
+    return (all(later > earlier for earlier, later in zip(peaks, peaks[1:]))
+            and peaks[-1] - peaks[0] > tolerance)
+
+###
+### driving BlockHead
+###
+
+def Settle(gtk):
+    while gtk.events_pending():
+        gtk.main_iteration(False)
+
+def RandomProblem(app, rng):
+    """
+    return (first number, second number) STRINGs for the current mode
+    """
+    base = app.P.BASE
+    limit = base ** app.P.COL_COUNT
+    num1, num2 = rng.randrange(limit), rng.randrange(limit)
+    if app.Mode == app.P.SUBTRACT_MODE and num1 < num2:
+        num1, num2 = num2, num1
+
+    def _digits(value):
+        digits = []
+        for _ in range(app.P.COL_COUNT):
+            value, digit = divmod(value, base)
+            digits.append(str(digit))
+        return "".join(reversed(digits)).lstrip("0") or "0"
+    return _digits(num1), _digits(num2)
+
+def SolveCycle(app, gtk, rng):
+    """
+    one New -> Draw -> solve cycle; return (problem, answer shown, expected answer)
+    """
+    app.Cpnl.NewCmd(None)
+    if rng.random() < 0.5:
+        app.Cpnl.ChangeSign(None)
+    Settle(gtk)
+
+    digits1, digits2 = RandomProblem(app, rng)
+    app.Cpnl.entries[app.Cpnl.N1].set_text(digits1)
+    app.Cpnl.entries[app.Cpnl.N2].set_text(digits2)
+    app.Cpnl.DrawBlocksCmd()
+    Settle(gtk)
+
+    for _ in range(S.MAX_MOVES):
+        widget = app.NextMove()
+        if not widget:
+            break
+        if isinstance(widget, gtk.Button):
+            # carry or borrow arrow
+            widget.clicked()
+        else:
+            # drag the block onto its answer column, and drop it
+            app.WidgetClicked(widget, gtk.gdk.Event(gtk.gdk.BUTTON_PRESS))
+            app.DropOk = True
+            app.PlaceWidget(widget, None)
+        Settle(gtk)
+    else:
+        raise RuntimeError("no answer after %d moves" % S.MAX_MOVES)
+
+    operator = E.ADD_OP if app.Mode == app.P.ADD_MODE else E.SUBTRACT_OP
+    expected, _ = BlockHeadEngine.Solve(digits1, operator, digits2, app.P.BASE)
+    problem = "%s %s %s" % (digits1, operator, digits2)
+    return problem, app.Cpnl.entries[app.Cpnl.ANS].get_text(), expected
+
+def Soak(cycles, seed, verbose):
+    """
+    run the soak test; return a list of failure messages
+    """
+    import gtk
+    import BlockHead as app
+
+    # no waiting for animations
+    for name in ("IN_COL", "COL_TO_COL", "SHRINK_EXPAND_DELAY", "PAUSE"):
+        setattr(app.P, name, 0)
+    app.StartApp()
+    Settle(gtk)
+
+    try:
+        xres = XResources(os.environ.get("DISPLAY"), app.mainwin.window.xid)
+    except (OSError, AttributeError, RuntimeError), exc_data:
+        print >> sys.stderr, "not counting X resources: %s" % exc_data
+        xres = None
+
+    rng = random.Random(seed)
+    failures = []
+    records = []
+    print "%8s %10s %10s %8s %8s" % ("cycle", "RSS (KB)", "objects", "windows", "pixmaps")
+    for cycle in range(1, cycles + 1):
+        problem, answer, expected = SolveCycle(app, gtk, rng)
+        if answer != expected:
+            failures.append("cycle %d: %s gave %r, expected %r" % (cycle, problem, answer, expected))
+
+        if cycle > S.WARMUP and cycle % S.SAMPLE_EVERY == 0:
+            xcounts = xres.Counts() if xres else {}
+            record = {"rss": RSS(), "objects": ObjectCounts(), "x": xcounts}
+            records.append(record)
+            print "%8d %10d %10d %8s %8s" % (cycle, record["rss"], sum(record["objects"].values()),
+                                             xcounts.get("WINDOW", "-"), xcounts.get("PIXMAP", "-"))
+            if verbose:
+                print "    %s" % ", ".join("%s=%d" % item
+                                           for item in record["objects"].most_common(10))
+            sys.stdout.flush()
+
+    if Growing([rec["rss"] for rec in records], S.RSS_TOLERANCE_KB):
+        failures.append("RSS keeps growing: %d KB -> %d KB" % (records[0]["rss"], records[-1]["rss"]))
+
+    type_names = set().union(*[rec["objects"] for rec in records]) if records else set()
+    for name in sorted(type_names):
+        counts = [rec["objects"].get(name, 0) for rec in records]
+        if Growing(counts, S.OBJECT_TOLERANCE):
+            failures.append("Python objects of type %s keep growing: %d -> %d" % (name, counts[0], counts[-1]))
+
+    resource_names = set().union(*[rec["x"] for rec in records]) if records else set()
+    for name in sorted(resource_names):
+        counts = [rec["x"].get(name, 0) for rec in records]
+        if Growing(counts, S.X_TOLERANCE):
+            failures.append("X resources of type %s keep growing: %d -> %d" % (name, counts[0], counts[-1]))
+
+    return failures
+
+###
+### main routine
+###
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--cycles", type="int", default=S.CYCLES,
+                      help="New -> Draw -> solve cycles (default: %default)")
+    parser.add_option("-s", "--seed", type="int", default=0,
+                      help="random seed for the problems (default: %default)")
+    parser.add_option("-x", "--xvfb", action="store_true", default=not os.environ.get("DISPLAY"),
+                      help="run under a virtual X server (default: if DISPLAY is not set)")
+    parser.add_option("-d", "--xvfb-display", type="int", default=S.XVFB_DISPLAY,
+                      help="display number for the virtual X server (default: %default)")
+    parser.add_option("-v", "--verbose", action="store_true",
+                      help="show the most numerous Python object types at each record")
+    opts, args = parser.parse_args()
+
+    if opts.cycles < S.WARMUP + S.SEGMENTS * S.SAMPLE_EVERY:
+        parser.error("need at least %d cycles" % (S.WARMUP + S.SEGMENTS * S.SAMPLE_EVERY))
+
+    server = StartXvfb(opts.xvfb_display) if opts.xvfb else None
+    try:
+        failures = Soak(opts.cycles, opts.seed, opts.verbose)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    for msg in failures:
+        print "FAIL:", msg
+    print "%s: %d cycle(s)" % ("FAILED" if failures else "passed", opts.cycles)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# BlockHeadStartup.py -- startup benchmark for BlockHead
+# Copyright 2008, 2009 John Posner
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+BlockHeadStartup -- startup benchmark
+
+launch BlockHead repeatedly, each time until its first frame is on
+screen, and report the time taken by each startup phase, and the time
+to first frame (from launch), as median/min/max over the runs
+
+warm runs follow one unrecorded run, so the files BlockHead reads are
+in the page cache; cold runs drop the page cache before each run (this
+needs root)
+
+with --history, append the medians to a CSV file, one row per benchmark,
+to track startup time across releases
+
+usage: BlockHeadStartup.py [options]
+"""
+
+__date__ = '21-Jul-2009'
+__version__ = 2039
+
+import csv
+import optparse
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from BlockHeadSoak import S, StartXvfb
+from BlockHeadTrace import T
+
+class B():
+    """
+    benchmark parameters
+    """
+    RUNS = 10
+    WARM, COLD = "warm", "cold"
+
+    # the program to launch
+    SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "BlockHead.py")
+
+    # seconds to wait for a run's first frame
+    TIMEOUT = 60.0
+
+def DropCaches():
+    """
+    write out dirty pages, then drop the page cache (needs root)
+    """
+    subprocess.call(["sync"])
+    cachefile = open("/proc/sys/vm/drop_caches", "w")
+    try:
+        cachefile.write("3\n")
+    finally:
+        cachefile.close()
+
+def Launch(script):
+    """
+    run BlockHead until its first frame is on screen
+
+    returns [(phase name, msec), ...], ending with ("first_frame", msec from launch)
+    """
+    env = dict(os.environ)
+    env[T.ENV] = "%s,%s" % (T.STARTUP, T.QUIT)
+    env[T.LAUNCH_ENV] = repr(time.time())
+    proc = subprocess.Popen([sys.executable, script], env=env, stderr=subprocess.PIPE)
+
+    # a run that never gets its first frame on screen is killed
+    timer = threading.Timer(B.TIMEOUT, proc.kill)
+    timer.start()
+    try:
+        stderr = proc.communicate()[1]
+    finally:
+        timer.cancel()
+
+    phases = None
+    for line in stderr.splitlines():
+        if line.startswith(T.STARTUP_PREFIX):
+            phases = [(name, float(msec)) for name, _, msec in
+                      [word.partition("=") for word in line[len(T.STARTUP_PREFIX):].split()]]
+
+    if phases is None:
+        raise RuntimeError("%s exited (status %s) without reporting its startup"
+                           % (script, proc.returncode))
+    return phases
+
+def Median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2.0
+
+def Benchmark(script, runs, mode):
+    """
+    launch BlockHead runs times
+
+    returns [(phase name, [msec of each run]), ...], in startup order
+    """
+    if mode == B.WARM:
+        Launch(script)
+
+    names = []
+    times = {}
+    for _ in range(runs):
+        if mode == B.COLD:
+            DropCaches()
+        for name, msec in Launch(script):
+            if name not in times:
+                names.append(name)
+                times[name] = []
+            times[name].append(msec)
+    return [(name, times[name]) for name in names]
+
+def PrintReport(results, mode, outfile=sys.stdout):
+    print >> outfile, "%s startup, %d run(s)" % (mode, len(results[-1][1]))
+    print >> outfile, "%-16s %9s %9s %9s" % ("phase", "median ms", "min ms", "max ms")
+    for name, times in results:
+        print >> outfile, "%-16s %9.1f %9.1f %9.1f" % (name, Median(times), min(times), max(times))
+
+def ScriptVersion(script):
+    """
+    __version__ of the launched program (without importing it)
+    """
+    match = re.search(r"^__version__ = (\S+)", open(script).read(), re.M)
+    return match.group(1) if match else "?"
+
+def AppendHistory(path, results, mode, version):
+    """
+    append one row of medians to a CSV file (with a header row, if the file is new)
+    """
+    names = [name for name, _ in results]
+    new_file = not os.path.exists(path)
+    outfile = open(path, "ab")
+    try:
+        writer = csv.writer(outfile)
+        if new_file:
+            writer.writerow(["date", "version", "mode", "runs"] + names)
+        writer.writerow([time.strftime("%Y-%m-%d %H:%M"), version, mode, len(results[-1][1])] +
+                        ["%.1f" % Median(times) for _, times in results])
+    finally:
+        outfile.close()
+
+###
+### main routine
+###
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--runs", type="int", default=B.RUNS,
+                      help="launches to time (default: %default)")
+    parser.add_option("-c", "--cold", action="store_true",
+                      help="drop the page cache before each launch (needs root)")
+    parser.add_option("-o", "--history",
+                      help="append the medians to this CSV file")
+    parser.add_option("-x", "--xvfb", action="store_true", default=not os.environ.get("DISPLAY"),
+                      help="run under a virtual X server (default: if DISPLAY is not set)")
+    parser.add_option("-d", "--xvfb-display", type="int", default=S.XVFB_DISPLAY,
+                      help="display number for the virtual X server (default: %default)")
+    opts, args = parser.parse_args()
+
+    if opts.runs < 1:
+        parser.error("need at least 1 run")
+    mode = B.COLD if opts.cold else B.WARM
+    if opts.cold and not os.access("/proc/sys/vm/drop_caches", os.W_OK):
+        parser.error("--cold needs permission to write /proc/sys/vm/drop_caches (run as root)")
+
+    server = StartXvfb(opts.xvfb_display) if opts.xvfb else None
+    try:
+        results = Benchmark(B.SCRIPT, opts.runs, mode)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    PrintReport(results, mode)
+    if opts.history:
+        AppendHistory(opts.history, results, mode, ScriptVersion(B.SCRIPT))
+    sys.exit(0)
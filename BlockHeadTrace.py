@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# BlockHeadTrace.py -- structured tracing and on-demand profiling for BlockHead
+# Copyright 2008, 2009 John Posner
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+BlockHeadTrace -- structured tracing
+
+named spans around BlockHead's handlers and animation loops; when
+tracing is off, a traced function costs one flag test per call, and
+Span() returns a shared do-nothing span
+
+tracing (and the profiler) can be switched on at startup with the
+BLOCKHEAD_TRACE environment variable, a comma-separated list of:
+    spans    record spans; print a per-span summary when tracing stops
+    chrome   also write every span to a trace file in Chrome's trace-event
+             format (viewable in chrome://tracing or Perfetto);
+             chrome=PATH names the file
+    profile  run cProfile over the session; print the callbacks with the
+             highest cumulative time, and write the stats to a file
+    startup  print the time taken by each startup phase, when the
+             first frame is on screen
+    quit     quit when the first frame is on screen (for benchmarks:
+             see BlockHeadStartup.py)
+    wakeups  record spans; once a minute, print the main-loop wakeups,
+             redraws and CPU time of that minute, and whether it was idle
+             (no spans)
+or at runtime with a key chord (see BlockHead.py)
+
+startup phases are timed from the import of this module (import it
+before the GUI modules), or from the BLOCKHEAD_LAUNCH_TIME environment
+variable (a time.time() value), if the launcher sets it
+
+trace events are queued as spans end, and encoded and written to the
+file by a background thread
+"""
+
+__date__ = '21-Jul-2009'
+__version__ = 2039
+
+import atexit
+import cProfile
+import json
+import os
+import pstats
+import sys
+import thread
+import threading
+import time
+from collections import deque
+from functools import wraps
+from timeit import default_timer as Clock
+
+class T():
+    """
+    tracing parameters
+    """
+    # environment variable, and its keywords
+    ENV = "BLOCKHEAD_TRACE"
+    SPANS = "spans"
+    CHROME = "chrome"
+    PROFILE = "profile"
+    STARTUP = "startup"
+    QUIT = "quit"
+    WAKEUPS = "wakeups"
+
+    # launch time, set by the launcher; startup report line starts with
+    LAUNCH_ENV = "BLOCKHEAD_LAUNCH_TIME"
+    STARTUP_PREFIX = "startup:"
+
+    # trace file (%d: process ID), and how often (seconds) it is written to
+    TRACE_FILE = "blockhead-%d.trace.json"
+    FLUSH_INTERVAL = 0.5
+
+    # profiler stats file (%d: process ID), and callbacks to print
+    PROFILE_FILE = "blockhead-%d.prof"
+    PROFILE_LINES = 30
+
+class Span(object):
+    """
+    one timed run of a named piece of code (use in a "with" statement)
+    """
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = Clock()
+        return self
+
+    def __exit__(self, *_exc):
+        self.tracer.Record(self.name, self.start, Clock() - self.start, self.args)
+        return False
+
+class NoSpan(object):
+    """
+    span used while tracing is off: does nothing
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+NO_SPAN = NoSpan()
+
+class ChromeTrace(object):
+    """
+    span sink: write spans as complete ("X") events of Chrome's
+    trace-event format (JSON array form), from a background thread
+    """
+    # the writer thread needs PyGTK's threads enabled (see Tracer.Threaded())
+    threaded = True
+
+    def __init__(self, path, origin):
+        self.path = path
+        # timestamps are microseconds after origin (a Clock() value)
+        self.origin = origin
+        self.pid = os.getpid()
+        # (name, start, duration, args, thread ID) of spans not yet written
+        self.queue = deque()
+        self.wakeup = threading.Event()
+        self.closing = False
+
+        self.outfile = open(path, "w")
+        self.outfile.write("[")
+        self.Write({"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0,
+                    "args": {"name": "BlockHead"}}, first=True)
+
+        self.writer = threading.Thread(target=self.Writer, name="trace writer")
+        self.writer.setDaemon(True)
+        self.writer.start()
+
+    def Record(self, name, start, duration, args):
+        """
+        queue an ended span (called on the interaction path: no encoding here)
+        """
+        self.queue.append((name, start, duration, args, thread.get_ident()))
+
+    def Write(self, event, first=False):
+        self.outfile.write(("\n" if first else ",\n") + json.dumps(event))
+
+    def Flush(self):
+        """
+        encode and write the queued spans
+        """
+        queue = self.queue
+        while queue:
+            name, start, duration, args, tid = queue.popleft()
+            event = {"name": name, "ph": "X", "pid": self.pid, "tid": tid,
+                     "ts": round((start - self.origin) * 1e6, 1),
+                     "dur": round(duration * 1e6, 1)}
+            if args:
+                event["args"] = args
+            self.Write(event)
+        self.outfile.flush()
+
+    def Writer(self):
+        """
+        background thread: flush every T.FLUSH_INTERVAL seconds, until closed
+        """
+        while not self.closing:
+            self.wakeup.wait(T.FLUSH_INTERVAL)
+            self.Flush()
+
+    def Close(self):
+        """
+        stop the writer, write the last spans, and end the JSON array
+        """
+        self.closing = True
+        self.wakeup.set()
+        self.writer.join()
+        self.Flush()
+        self.outfile.write("\n]\n")
+        self.outfile.close()
+
+class Tracer(object):
+    """
+    span recorder and profiler switch
+    """
+    def __init__(self):
+        self.enabled = False
+        # span name -> [count, total seconds, longest seconds]
+        self.stats = {}
+        # objects with Record(name, start, duration, args) and Close()
+        # methods, given every span as it ends
+        self.sinks = []
+        self.profiler = None
+        self.options = {}
+        atexit.register(self.Shutdown)
+
+        # startup phases: (name, start, duration), timed from launch,
+        # if the launcher says when that was, else from now
+        self.origin = Clock()
+        self.phases = []
+        launch = os.environ.get(T.LAUNCH_ENV)
+        if launch:
+            launch_delay = max(time.time() - float(launch), 0.0)
+            self.origin -= launch_delay
+            self.phases.append(("launch", self.origin, launch_delay))
+        self.phase_start = Clock()
+
+    def Span(self, name, **args):
+        """
+        return a span for a "with" statement
+        """
+        if not self.enabled:
+            return NO_SPAN
+        return Span(self, name, args)
+
+    def Traced(self, name):
+        """
+        decorator: record each call of the function as a span
+        """
+        def _decorate(func):
+            @wraps(func)
+            def _traced(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = Clock()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.Record(name, start, Clock() - start, None)
+            return _traced
+        return _decorate
+
+    def Sleep(self, seconds):
+        """
+        time.sleep(), recorded as a "sleep" span
+        """
+        if not self.enabled:
+            time.sleep(seconds)
+            return
+        start = Clock()
+        time.sleep(seconds)
+        self.Record("sleep", start, Clock() - start, None)
+
+    def Record(self, name, start, duration, args):
+        """
+        add an ended span to the summary, and pass it to the sinks
+        """
+        entry = self.stats.get(name)
+        if entry:
+            entry[0] += 1
+            entry[1] += duration
+            if duration > entry[2]:
+                entry[2] = duration
+        else:
+            self.stats[name] = [1, duration, duration]
+        for sink in self.sinks:
+            sink.Record(name, start, duration, args)
+
+    def Start(self):
+        self.stats = {}
+        self.enabled = True
+
+    def Stop(self, outfile=sys.stderr):
+        """
+        stop tracing, and print the per-span summary
+        """
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.PrintSummary(outfile)
+
+    def PrintSummary(self, outfile=sys.stderr):
+        """
+        print count, total, mean and longest time (msec) per span name,
+        longest total first
+        """
+        rows = sorted(self.stats.items(), key=lambda item: -item[1][1])
+        print >> outfile, "%-28s %7s %10s %9s %9s" % ("span", "count", "total ms", "mean ms", "max ms")
+        for name, (count, total, longest) in rows:
+            print >> outfile, "%-28s %7d %10.1f %9.2f %9.2f" % (
+                name, count, total * 1000, total * 1000 / count, longest * 1000)
+
+    def SpanCount(self):
+        """
+        number of spans recorded since tracing started
+        """
+        return sum([entry[0] for entry in self.stats.values()])
+
+    def Threaded(self):
+        """
+        does a sink write from a thread of its own? (a GTK app must then
+        call gobject.threads_init(), or the thread is starved while the
+        main loop runs)
+        """
+        return any([getattr(sink, "threaded", False) for sink in self.sinks])
+
+    def Toggle(self):
+        if self.enabled:
+            self.Stop()
+        else:
+            self.Start()
+
+    def StartProfile(self):
+        if self.profiler:
+            return
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def StopProfile(self, outfile=sys.stderr):
+        """
+        stop the profiler, print the callbacks with the highest
+        cumulative time, and write the full stats to a file
+        """
+        if not self.profiler:
+            return
+        self.profiler.disable()
+        stats = pstats.Stats(self.profiler, stream=outfile)
+        self.profiler = None
+
+        path = T.PROFILE_FILE % os.getpid()
+        stats.dump_stats(path)
+        stats.sort_stats("cumulative").print_stats(T.PROFILE_LINES)
+        print >> outfile, "profile written to %s" % path
+
+    def ToggleProfile(self):
+        if self.profiler:
+            self.StopProfile()
+        else:
+            self.StartProfile()
+
+    def Phase(self, name):
+        """
+        end a startup phase (the next one starts now)
+        """
+        now = Clock()
+        self.phases.append((name, self.phase_start, now - self.phase_start))
+        self.phase_start = now
+
+    def StartupDone(self, outfile=sys.stderr):
+        """
+        the first frame is on screen: add the startup phases to the trace,
+        and print them (msec), if asked to
+
+        returns True if the app should quit now
+        """
+        for name, start, duration in self.phases:
+            if self.enabled:
+                self.Record("startup." + name, start, duration, None)
+        if T.STARTUP in self.options:
+            print >> outfile, T.STARTUP_PREFIX, " ".join(
+                ["%s=%.1f" % (name, duration * 1000) for name, _, duration in self.phases] +
+                ["first_frame=%.1f" % ((Clock() - self.origin) * 1000)])
+        return T.QUIT in self.options
+
+    def Configure(self, spec):
+        """
+        switch on what the BLOCKHEAD_TRACE value asks for
+        """
+        options = self.options = {}
+        for word in (spec or "").split(","):
+            key, _, value = word.strip().partition("=")
+            options[key.lower()] = value
+        if T.CHROME in options:
+            path = options[T.CHROME] or T.TRACE_FILE % os.getpid()
+            self.sinks.append(ChromeTrace(path, self.origin))
+        if T.SPANS in options or T.CHROME in options or T.WAKEUPS in options:
+            self.Start()
+        if T.PROFILE in options:
+            self.StartProfile()
+
+    def Shutdown(self):
+        """
+        at exit: report whatever is still running
+        """
+        self.StopProfile()
+        self.Stop()
+        for sink in self.sinks:
+            sink.Close()
+        self.sinks = []
+
+# shared by all of BlockHead's modules
+TRACE = Tracer()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# BlockHeadWorksheets.py -- printable worksheets with BlockHead block diagrams
+# Copyright 2008, 2009 John Posner
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+BlockHeadWorksheets -- worksheet generator
+
+render each problem set (CSV or JSONL file of records, as read by
+BlockHeadGrader.py; the student_answer field is ignored) as a printable
+worksheet: each problem is drawn as BlockHead draws it, with columns and
+blocks for its numbers, and an empty answer
+
+worksheets are rendered in parallel by a pool of worker processes;
+each worksheet is written page by page (PDF: one file, SVG: one file per page)
+
+usage: BlockHeadWorksheets.py [options] INFILE ...
+"""
+
+__date__ = '21-Jul-2009'
+__version__ = 2039
+
+import multiprocessing
+import optparse
+import os
+import sys
+from itertools import islice
+
+import cairo
+
+import BlockHeadEngine
+import BlockHeadGrader
+import BlockHeadRender
+from BlockHeadEngine import E
+from BlockHeadRender import Geometry
+
+class W():
+    """
+    worksheet parameters
+    """
+    # output formats
+    PDF, SVG = "pdf", "svg"
+
+    # page size (points): US Letter
+    PAGE_WID = 612
+    PAGE_HGT = 792
+    MARGIN = 36
+
+    # problems per page
+    PER_PAGE = 2
+
+    # font size (points)
+    TITLE_SIZE = 14
+
+    # vertical space (pixels, before scaling) below columns, for digits
+    DIGIT_SPACE = 45
+    # vertical space (points) for title
+    TITLE_SPACE = 30
+
+class ProblemLayout(object):
+    """
+    positions of the column sets of one problem, arranged as in BlockHead's
+    window: numbers left to right, with operator and equals sign between
+    them (all sizes in pixels, before scaling to fit the page)
+    """
+    def __init__(self, operator, digits1, digits2, geom):
+        count = max(len(digits1), len(digits2))
+        self.operator = operator
+        self.geom = geom
+
+        if operator == E.ADD_OP:
+            # first number, second number, empty answer (with column for final carry)
+            self.sets = [(digits1, count, True),
+                         (digits2, count, True),
+                         ([], count + 1, False)]
+        else:
+            # larger number (in the answer columns, as in SUB mode), smaller number, empty answer
+            self.sets = [(digits1, count, True),
+                         (digits2, count, True),
+                         ([], count, False)]
+
+        # one column width between column sets, for operator and equals sign
+        self.gap = geom.COL_WID
+        self.centers = []
+        x = 0
+        for _, set_count, _ in self.sets:
+            self.centers.append(x + set_count * geom.COL_WID // 2)
+            x += set_count * geom.COL_WID + self.gap
+        self.width = x - self.gap
+        self.height = geom.COL_HGT + W.DIGIT_SPACE
+
+    def Draw(self, ctx, number):
+        """
+        draw the problem, with its upper-left corner at (0,0)
+        """
+        geom = self.geom
+        bottomY = geom.COL_HGT
+
+        for (digit_list, count, show_blocks), centerX in zip(self.sets, self.centers):
+            BlockHeadRender.DrawNumber(ctx, digit_list, centerX, bottomY, geom, count, show_blocks)
+
+            # written number below the columns (blank line for the answer)
+            digits = BlockHeadEngine.DigitString(digit_list) if digit_list else "_" * count
+            BlockHeadRender.DrawText(ctx, digits, centerX, bottomY + W.DIGIT_SPACE * 2 // 3,
+                                     geom.UNIT_HGT // 2)
+
+        # operator and equals sign, between the column sets
+        symbols = [self.operator, "="]
+        for idx, symbol in enumerate(symbols):
+            left_edge = self.centers[idx] + self.sets[idx][1] * geom.COL_WID // 2
+            BlockHeadRender.DrawText(ctx, symbol, left_edge + self.gap // 2,
+                                     bottomY - geom.COL_HGT // 2, geom.UNIT_HGT)
+
+        # problem number, at upper left
+        BlockHeadRender.DrawText(ctx, "%d." % number, -self.gap // 2, geom.UNIT_HGT // 2,
+                                 geom.UNIT_HGT // 2)
+
+def Pages(records, base, per_page):
+    """
+    generator: yield lists of per_page (operator, digits1, digits2) problems,
+    skipping records that are not valid problems
+    """
+    problems = BlockHeadGrader.Problems(records, base)
+    while True:
+        page = list(islice(problems, per_page))
+        if not page:
+            return
+        yield page
+
+def DrawPage(ctx, page, first_number, title, geom, per_page):
+    """
+    draw one page of problems, numbering them starting at first_number
+    """
+    usable_wid = W.PAGE_WID - 2 * W.MARGIN
+    usable_hgt = W.PAGE_HGT - 2 * W.MARGIN - W.TITLE_SPACE
+    slot_hgt = usable_hgt / float(per_page)
+
+    # white background, title
+    ctx.set_source_rgb(1, 1, 1)
+    ctx.paint()
+    BlockHeadRender.DrawText(ctx, title, W.PAGE_WID / 2.0, W.MARGIN + W.TITLE_SIZE, W.TITLE_SIZE)
+
+    for idx, (operator, digits1, digits2) in enumerate(page):
+        layout = ProblemLayout(operator, digits1, digits2, geom)
+        # scale to fit the problem's slot, leaving room for the problem number
+        scale = min(usable_wid / float(layout.width + layout.gap),
+                    slot_hgt / float(layout.height))
+
+        ctx.save()
+        ctx.translate(W.MARGIN + layout.gap * scale, W.MARGIN + W.TITLE_SPACE + idx * slot_hgt)
+        ctx.scale(scale, scale)
+        layout.Draw(ctx, first_number + idx)
+        ctx.restore()
+
+def RenderWorksheet(args):
+    """
+    render one worksheet file, page by page (runs in a worker process)
+
+    args: (input path, output path, output format, number base, problems per page)
+
+    returns (output path, number of pages)
+    """
+    inpath, outpath, fmt, base, per_page = args
+    geom = Geometry(base=base)
+    name = os.path.splitext(os.path.basename(inpath))[0]
+
+    infile = open(inpath, "rb")
+    records = BlockHeadGrader.ReadRecords(infile, BlockHeadGrader.FileFormat(inpath))
+    surface = None
+    page_count = 0
+    try:
+        for page_count, page in enumerate(Pages(records, base, per_page), 1):
+            if fmt == W.PDF:
+                # one multi-page file, each page written out as it is finished
+                if not surface:
+                    surface = cairo.PDFSurface(outpath, W.PAGE_WID, W.PAGE_HGT)
+                    ctx = cairo.Context(surface)
+            else:
+                # one file per page
+                surface = cairo.SVGSurface("%s-%03d.svg" % (os.path.splitext(outpath)[0], page_count),
+                                           W.PAGE_WID, W.PAGE_HGT)
+                ctx = cairo.Context(surface)
+
+            title = "%s -- page %d" % (name, page_count)
+            DrawPage(ctx, page, (page_count - 1) * per_page + 1, title, geom, per_page)
+            ctx.show_page()
+
+            if fmt == W.SVG:
+                surface.finish()
+                surface = None
+    finally:
+        infile.close()
+        if surface:
+            surface.finish()
+
+    if fmt == W.SVG:
+        outpath = "%s-*.svg" % os.path.splitext(outpath)[0]
+    return outpath, page_count
+
+###
+### main routine
+###
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage="%prog [options] INFILE ...")
+    parser.add_option("-d", "--output-dir", default=".",
+                      help="directory for worksheets (default: current directory)")
+    parser.add_option("-f", "--format", choices=[W.PDF, W.SVG], default=W.PDF,
+                      help="output format (default: %default)")
+    parser.add_option("-b", "--base", type="int", default=E.BASE,
+                      help="number base (default: %default)")
+    parser.add_option("-n", "--per-page", type="int", default=W.PER_PAGE,
+                      help="problems per page (default: %default)")
+    parser.add_option("-j", "--processes", type="int",
+                      help="worker processes (default: one per CPU)")
+    opts, args = parser.parse_args()
+
+    if not args:
+        parser.error("specify one or more problem set files")
+    if not 2 <= opts.base <= 10:
+        parser.error("number base must be between 2 and 10")
+
+    tasks = [(inpath,
+              os.path.join(opts.output_dir,
+                           os.path.splitext(os.path.basename(inpath))[0] + "." + opts.format),
+              opts.format, opts.base, opts.per_page)
+             for inpath in args]
+
+    if opts.processes == 1:
+        results = (RenderWorksheet(task) for task in tasks)
+    else:
+        pool = multiprocessing.Pool(opts.processes)
+        results = pool.imap_unordered(RenderWorksheet, tasks)
+
+    for outpath, page_count in results:
+        print "%s: %d page(s)" % (outpath, page_count)
+    sys.exit(0)
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# BlockHeadXStats.py -- X protocol traffic of BlockHead's operations
+# Copyright 2008, 2009 John Posner
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+BlockHeadXStats -- X traffic instrumentation
+
+run BlockHead (interactively, or through scripted problems as the soak
+test does) with its major operations wrapped, and record the X requests
+it sends, with the RECORD extension, over a connection of our own
+
+each request is attributed to the innermost operation in progress when
+it was sent (by sequence number, so the attribution is exact); at the
+end, print a table of X requests, round trips (requests answered by a
+reply), and windows, pixmaps and GCs created/destroyed, per operation
+
+usage: BlockHeadXStats.py [options]
+"""
+
+__date__ = '21-Jul-2009'
+__version__ = 2039
+
+import bisect
+import ctypes
+import ctypes.util
+import optparse
+import os
+import random
+import sys
+import threading
+
+import BlockHeadSoak
+
+class I():
+    """
+    instrumentation parameters
+    """
+    # operations to instrument: (class name or None for a function, name)
+    OPERATIONS = [("CtrlPanel", "NewCmd"),
+                  ("CtrlPanel", "DrawBlocksCmd"),
+                  ("Column", "Show"),
+                  ("Column", "Carry"),
+                  ("Column", "Borrow"),
+                  (None, "WidgetClicked"),
+                  (None, "MoveWidget"),
+                  (None, "PlaceWidget"),
+                  (None, "AniMove"),
+                  (None, "CarryAll"),
+                  (None, "CommitLayout"),
+                  (None, "UpdateArrows"),
+                  (None, "UpdateScreen"),
+                  ]
+    # traffic sent outside any operation (GTK main loop: redraws, events)
+    OUTSIDE = "(main loop)"
+
+    # core request opcodes that create/destroy resources
+    CREATE_WINDOW, DESTROY_WINDOW = 1, 4
+    CREATE_PIXMAP, FREE_PIXMAP = 53, 54
+    CREATE_GC, FREE_GC = 55, 60
+
+    # RECORD categories, and the first byte of a reply
+    FROM_SERVER, FROM_CLIENT = 0, 1
+    REPLY = 1
+
+class XRecordRange8(ctypes.Structure):
+    _fields_ = [("first", ctypes.c_ubyte), ("last", ctypes.c_ubyte)]
+
+class XRecordRange16(ctypes.Structure):
+    _fields_ = [("first", ctypes.c_ushort), ("last", ctypes.c_ushort)]
+
+class XRecordExtRange(ctypes.Structure):
+    _fields_ = [("ext_major", XRecordRange8), ("ext_minor", XRecordRange16)]
+
+class XRecordRange(ctypes.Structure):
+    _fields_ = [("core_requests", XRecordRange8),
+                ("core_replies", XRecordRange8),
+                ("ext_requests", XRecordExtRange),
+                ("ext_replies", XRecordExtRange),
+                ("delivered_events", XRecordRange8),
+                ("device_events", XRecordRange8),
+                ("errors", XRecordRange8),
+                ("client_started", ctypes.c_int),
+                ("client_died", ctypes.c_int)]
+
+class XRecordInterceptData(ctypes.Structure):
+    _fields_ = [("id_base", ctypes.c_ulong),
+                ("server_time", ctypes.c_ulong),
+                ("client_seq", ctypes.c_ulong),
+                ("category", ctypes.c_int),
+                ("client_swapped", ctypes.c_int),
+                ("data", ctypes.POINTER(ctypes.c_ubyte)),
+                ("data_len", ctypes.c_ulong)]
+
+XRecordInterceptProc = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.POINTER(XRecordInterceptData))
+
+class XRecorder(object):
+    """
+    record the requests that one X client (identified by the ID of one of
+    its windows) sends, and the replies it gets, using the RECORD extension
+
+    the records arrive on a data connection, read by a thread of our own
+    """
+    def __init__(self, display_name, xid):
+        self.xlib = ctypes.cdll.LoadLibrary(ctypes.util.find_library("X11"))
+        self.xtst = ctypes.cdll.LoadLibrary(ctypes.util.find_library("Xtst"))
+        self.xlib.XOpenDisplay.restype = ctypes.c_void_p
+        self.xtst.XRecordAllocRange.restype = ctypes.POINTER(XRecordRange)
+        self.xtst.XRecordCreateContext.restype = ctypes.c_ulong
+        self.xtst.XRecordCreateContext.argtypes = [
+            ctypes.c_void_p, ctypes.c_int, ctypes.POINTER(ctypes.c_ulong), ctypes.c_int,
+            ctypes.POINTER(ctypes.POINTER(XRecordRange)), ctypes.c_int]
+        self.xtst.XRecordEnableContext.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, XRecordInterceptProc, ctypes.c_void_p]
+        self.xtst.XRecordDisableContext.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        self.xtst.XRecordFreeContext.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        self.xtst.XRecordFreeData.argtypes = [ctypes.POINTER(XRecordInterceptData)]
+
+        # control connection, and data connection
+        self.ctl_dpy = self.xlib.XOpenDisplay(display_name)
+        self.data_dpy = self.xlib.XOpenDisplay(display_name)
+        if not (self.ctl_dpy and self.data_dpy):
+            raise RuntimeError("cannot open display %s" % display_name)
+        major, minor = ctypes.c_int(), ctypes.c_int()
+        if not self.xtst.XRecordQueryVersion(ctypes.c_void_p(self.ctl_dpy),
+                                             ctypes.byref(major), ctypes.byref(minor)):
+            raise RuntimeError("X server has no RECORD extension")
+
+        # all requests (core and extension), and their replies
+        rng = self.xtst.XRecordAllocRange()
+        rng.contents.core_requests.first, rng.contents.core_requests.last = 1, 127
+        rng.contents.core_replies.first, rng.contents.core_replies.last = 1, 127
+        for ext in (rng.contents.ext_requests, rng.contents.ext_replies):
+            ext.ext_major.first, ext.ext_major.last = 128, 255
+            ext.ext_minor.first, ext.ext_minor.last = 0, 65535
+        client = ctypes.c_ulong(xid)
+        self.context = self.xtst.XRecordCreateContext(self.ctl_dpy, 0, ctypes.byref(client), 1,
+                                                      ctypes.byref(rng), 1)
+        self.xlib.XFree(rng)
+        self.xlib.XSync(ctypes.c_void_p(self.ctl_dpy), 0)
+
+        # (category, sequence number, first byte of data)
+        self.records = []
+        self.callback = XRecordInterceptProc(self.Intercept)
+        self.reader = threading.Thread(target=self.xtst.XRecordEnableContext,
+                                       args=(self.data_dpy, self.context, self.callback, None))
+        self.reader.setDaemon(True)
+        self.reader.start()
+
+    def Intercept(self, _closure, data):
+        rec = data.contents
+        if rec.category in (I.FROM_CLIENT, I.FROM_SERVER) and rec.data_len:
+            self.records.append((rec.category, rec.client_seq, rec.data[0]))
+        self.xtst.XRecordFreeData(data)
+
+    def Stop(self):
+        """
+        stop recording (the client should have synced with the server,
+        so that all of its requests are recorded); return the records
+        """
+        self.xtst.XRecordDisableContext(self.ctl_dpy, self.context)
+        self.xlib.XSync(ctypes.c_void_p(self.ctl_dpy), 0)
+        self.reader.join()
+        self.xtst.XRecordFreeContext(self.ctl_dpy, self.context)
+        self.xlib.XCloseDisplay(ctypes.c_void_p(self.data_dpy))
+        self.xlib.XCloseDisplay(ctypes.c_void_p(self.ctl_dpy))
+        return self.records
+
+class Operations(object):
+    """
+    wrap an app's operations, and note the X sequence number
+    at which each one starts and ends
+    """
+    def __init__(self, app):
+        xlib = ctypes.cdll.LoadLibrary(ctypes.util.find_library("X11"))
+        gdk = ctypes.cdll.LoadLibrary("libgdk-x11-2.0.so.0")
+        gdk.gdk_x11_get_default_xdisplay.restype = ctypes.c_void_p
+        xlib.XNextRequest.restype = ctypes.c_ulong
+        xlib.XNextRequest.argtypes = [ctypes.c_void_p]
+        dpy = gdk.gdk_x11_get_default_xdisplay()
+        self.NextRequest = lambda: xlib.XNextRequest(dpy) & 0xFFFFFFFF
+
+        self.stack = []
+        # (sequence number, operation name): requests from this sequence number
+        # on belong to this operation
+        self.transitions = [(0, I.OUTSIDE)]
+        self.calls = {}
+
+        for class_name, name in I.OPERATIONS:
+            if class_name:
+                cls = getattr(app, class_name)
+                setattr(cls, name, self.Wrap("%s.%s" % (class_name, name), cls.__dict__[name]))
+            else:
+                setattr(app, name, self.Wrap(name, getattr(app, name)))
+
+    def Wrap(self, name, func):
+        def _wrapper(*args, **kwargs):
+            self.Enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.Leave()
+        _wrapper.__name__ = func.__name__
+        _wrapper.__doc__ = func.__doc__
+        return _wrapper
+
+    def Enter(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.stack.append(name)
+        self.transitions.append((self.NextRequest(), name))
+
+    def Leave(self):
+        self.stack.pop()
+        self.transitions.append((self.NextRequest(), self.stack[-1] if self.stack else I.OUTSIDE))
+
+    def Table(self, records):
+        """
+        attribute the records to operations: return {name: {column: count}}
+        """
+        seqs = [seq for seq, _ in self.transitions]
+        counter_names = {I.CREATE_WINDOW: "win+", I.DESTROY_WINDOW: "win-",
+                         I.CREATE_PIXMAP: "pix+", I.FREE_PIXMAP: "pix-",
+                         I.CREATE_GC: "gc+", I.FREE_GC: "gc-"}
+        table = {}
+        for category, seq, first_byte in records:
+            name = self.transitions[bisect.bisect_right(seqs, seq) - 1][1]
+            row = table.setdefault(name, {})
+            if category == I.FROM_CLIENT:
+                row["requests"] = row.get("requests", 0) + 1
+                if first_byte in counter_names:
+                    row[counter_names[first_byte]] = row.get(counter_names[first_byte], 0) + 1
+            elif first_byte == I.REPLY:
+                row["round trips"] = row.get("round trips", 0) + 1
+        for name, count in self.calls.items():
+            table.setdefault(name, {})["calls"] = count
+        return table
+
+def PrintTable(table, outfile=sys.stdout):
+    """
+    print the per-operation table, busiest operation first
+    """
+    columns = ["calls", "requests", "round trips", "win+", "win-", "pix+", "pix-", "gc+", "gc-"]
+    print >> outfile, "%-24s" % "operation" + "".join("%12s" % col for col in columns)
+    for name in sorted(table, key=lambda name: -table[name].get("requests", 0)):
+        print >> outfile, "%-24s" % name + "".join("%12d" % table[name].get(col, 0) for col in columns)
+
+def Run(cycles, seed):
+    """
+    run the app with its operations instrumented; return the table
+    cycles: number of scripted problems (0: run interactively, until the window is closed)
+    """
+    import gobject
+    import gtk
+    import BlockHead as app
+
+    # our reader thread must run while the main loop does, even if the
+    # app saves power (and so does not enable threads itself)
+    gobject.threads_init()
+
+    ops = Operations(app)
+    if cycles:
+        # no waiting for animations
+        for name in ("IN_COL", "COL_TO_COL", "SHRINK_EXPAND_DELAY", "PAUSE"):
+            setattr(app.P, name, 0)
+    app.StartApp()
+    BlockHeadSoak.Settle(gtk)
+
+    recorder = XRecorder(os.environ.get("DISPLAY"), app.mainwin.window.xid)
+    if cycles:
+        rng = random.Random(seed)
+        for _ in range(cycles):
+            BlockHeadSoak.SolveCycle(app, gtk, rng)
+    else:
+        gtk.main()
+
+    # all of the app's requests have reached the server
+    gtk.gdk.flush()
+    return ops.Table(recorder.Stop())
+
+###
+### main routine
+###
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--cycles", type="int", default=0,
+                      help="solve this many random problems, as the soak test does "
+                      "(default: run interactively, until the window is closed)")
+    parser.add_option("-s", "--seed", type="int", default=0,
+                      help="random seed for the problems (default: %default)")
+    parser.add_option("-o", "--output",
+                      help="write the table to this file (default: standard output)")
+    opts, args = parser.parse_args()
+
+    try:
+        table = Run(opts.cycles, opts.seed)
+    except (OSError, RuntimeError), exc_data:
+        print >> sys.stderr, "cannot record X traffic: %s" % exc_data
+        sys.exit(1)
+
+    outfile = open(opts.output, "w") if opts.output else sys.stdout
+    PrintTable(table, outfile)
+    sys.exit(0)
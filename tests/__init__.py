@@ -0,0 +1,56 @@
+# tests -- property checks for BlockHead's non-GUI modules
+# Copyright 2008, 2009 John Posner
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+property checks for BlockHead's non-GUI modules: random problems are
+worked by the engine and compared with INT arithmetic, with each other,
+and with the grader's output
+
+usage (in BlockHead's directory): python -m unittest discover
+"""
+
+import random
+
+# same problems on every run
+SEED = 2039
+
+def NumberString(value, base):
+    """
+    write an INT as a STRING of digits in the specified base
+    """
+    digits = []
+    while True:
+        value, digit = divmod(value, base)
+        digits.append(str(digit))
+        if not value:
+            break
+    return "".join(reversed(digits))
+
+def RandomProblems(count, max_digits=8, seed=SEED):
+    """
+    generator: yield (operand1, operator, operand2, base, value1, value2)
+    for random problems; a SUBTRACT problem has the larger number first
+    """
+    rand = random.Random(seed)
+    for _ in range(count):
+        base = rand.randint(2, 10)
+        value1 = rand.randint(0, base ** rand.randint(1, max_digits) - 1)
+        value2 = rand.randint(0, base ** rand.randint(1, max_digits) - 1)
+        operator = rand.choice("+-")
+        if operator == "-" and value1 < value2:
+            value1, value2 = value2, value1
+        yield (NumberString(value1, base), operator, NumberString(value2, base),
+               base, value1, value2)
@@ -0,0 +1,136 @@
+"""
+property checks for BlockHeadEngine
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import BlockHeadEngine
+from BlockHeadEngine import E
+from tests import NumberString, RandomProblems
+
+class SolveTest(unittest.TestCase):
+    def testIntArithmetic(self):
+        for operand1, operator, operand2, base, value1, value2 in RandomProblems(2000):
+            answer, events = BlockHeadEngine.Solve(operand1, operator, operand2, base)
+            expected = value1 + value2 if operator == E.ADD_OP else value1 - value2
+            self.assertEqual(answer, NumberString(expected, base))
+            # one event per column, plus the carry column
+            self.assertTrue(len(events) >= max(len(operand1), len(operand2)))
+
+    def testEvents(self):
+        # 999 + 1: a carry out of every column
+        self.assertEqual(BlockHeadEngine.Solve("999", "+", "1"),
+                         ("1000", [E.CARRY, E.CARRY, E.CARRY, None]))
+        # 100 - 1: the empty tens column cascades the borrow
+        self.assertEqual(BlockHeadEngine.Solve("100", "-", "1"),
+                         ("99", [E.BORROW, E.CASCADE, None]))
+
+    def testWhitespaceAndZeros(self):
+        self.assertEqual(BlockHeadEngine.Solve(" 0042 ", "+", "8\n")[0], "50")
+        self.assertEqual(BlockHeadEngine.Solve("42", "-", "42")[0], "0")
+
+    def testErrors(self):
+        for problem in [("12", "-", "13"), ("12", "*", "3"), ("1a", "+", "1"),
+                        ("", "+", "1"), ("12", "+", "2", 2)]:
+            self.assertRaises(ValueError, BlockHeadEngine.Solve, *problem)
+
+class ParallelSolveTest(unittest.TestCase):
+    def testSameAsSolve(self):
+        for operand1, operator, operand2, base, _, _ in RandomProblems(500, max_digits=20):
+            for chunk_columns in (1, 3, 7):
+                self.assertEqual(BlockHeadEngine.ParallelSolve(operand1, operator, operand2, base,
+                                                               processes=1,
+                                                               chunk_columns=chunk_columns),
+                                 BlockHeadEngine.Solve(operand1, operator, operand2, base))
+
+    def testWorkerProcesses(self):
+        for operand1, operator, operand2, base, _, _ in RandomProblems(5, max_digits=40):
+            self.assertEqual(BlockHeadEngine.ParallelSolve(operand1, operator, operand2, base,
+                                                           processes=2, chunk_columns=4),
+                             BlockHeadEngine.Solve(operand1, operator, operand2, base))
+
+    def testSameErrors(self):
+        for problem in [(" 123 ", "+", "  99"), ("12", "-", "13"), ("12", "*", "3"),
+                        ("1a", "+", "1"), ("", "+", "1"), (" ", "+", "1")]:
+            try:
+                expected = BlockHeadEngine.Solve(*problem)
+            except ValueError, exc_data:
+                expected = str(exc_data)
+            try:
+                result = BlockHeadEngine.ParallelSolve(*problem, processes=1, chunk_columns=2)
+            except ValueError, exc_data:
+                result = str(exc_data)
+            self.assertEqual(result, expected)
+
+class ExplainAnswerTest(unittest.TestCase):
+    def testCorrectAnswer(self):
+        for operand1, operator, operand2, base, _, _ in RandomProblems(2000):
+            answer = BlockHeadEngine.Solve(operand1, operator, operand2, base)[0]
+            self.assertEqual(BlockHeadEngine.ExplainAnswer(operand1, operator, operand2,
+                                                           answer, base), [])
+            # leading ZEROs do not make an answer wrong
+            self.assertEqual(BlockHeadEngine.ExplainAnswer(operand1, operator, operand2,
+                                                           "0" + answer, base), [])
+
+    def testWrongAnswer(self):
+        for operand1, operator, operand2, base, _, _ in RandomProblems(500):
+            answer = BlockHeadEngine.Solve(operand1, operator, operand2, base)[0]
+            wrong = NumberString((int(answer, base) + 1) % base**len(answer), base)
+            self.assertNotEqual(BlockHeadEngine.ExplainAnswer(operand1, operator, operand2,
+                                                              wrong, base), [])
+
+    def testMistakes(self):
+        codes = lambda *args: [code for _, code, _ in BlockHeadEngine.ExplainAnswer(*args)]
+        self.assertEqual(codes("19", "+", "1", "10"), [BlockHeadEngine.M.FORGOT_CARRY])
+        self.assertEqual(codes("53", "-", "17", "44"), [BlockHeadEngine.M.SMALLER_FROM_LARGER])
+        self.assertEqual(codes("53", "-", "17", "46"), [BlockHeadEngine.M.FORGOT_DECREMENT])
+        self.assertEqual(codes("1", "+", "1", "x"), [BlockHeadEngine.M.NOT_A_NUMBER])
+
+class StreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def Path(self, name, contents=None):
+        path = os.path.join(self.tmpdir, name)
+        if contents is not None:
+            outfile = open(path, "wb")
+            outfile.write(contents)
+            outfile.close()
+        return path
+
+    def testReadWriteDigits(self):
+        for operand1, _, _, base, _, _ in RandomProblems(200, max_digits=30):
+            path = self.Path("number", operand1[:3] + "\n" + operand1[3:] + " \n")
+            digits = list(BlockHeadEngine.ReadDigits(path, base, bufsize=4))
+            self.assertEqual(digits, BlockHeadEngine.DigitList(operand1, base))
+
+            count = BlockHeadEngine.WriteDigits(path, digits + [0, 0], len(digits) + 5, bufsize=3)
+            self.assertEqual(count, len(operand1))
+            self.assertEqual(open(path, "rb").read(), operand1 + "\n")
+
+    def testStreamFile(self):
+        for operand1, operator, operand2, base, _, _ in RandomProblems(200, max_digits=30):
+            answer_path = self.Path("answer")
+            BlockHeadEngine.StreamFile(self.Path("n1", operand1), operator,
+                                       self.Path("n2", operand2), answer_path, base)
+            self.assertEqual(open(answer_path, "rb").read(),
+                             BlockHeadEngine.Solve(operand1, operator, operand2, base)[0] + "\n")
+
+    def testInvalidDigit(self):
+        path = self.Path("number", "12x3\n")
+        self.assertRaises(ValueError, list, BlockHeadEngine.ReadDigits(path))
+
+        # no digits: rejected, as Solve() rejects an empty number
+        for contents in ("", " \n"):
+            self.assertRaises(ValueError, BlockHeadEngine.Solve, contents, "+", "5")
+            self.assertRaises(ValueError, BlockHeadEngine.StreamFile, self.Path("n1", contents),
+                              "+", self.Path("n2", "5\n"), self.Path("answer"))
+
+if __name__ == "__main__":
+    unittest.main()
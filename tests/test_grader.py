@@ -0,0 +1,65 @@
+"""
+property checks for BlockHeadGrader
+"""
+
+import unittest
+from cStringIO import StringIO
+
+import BlockHeadEngine
+import BlockHeadGrader
+from tests import RandomProblems
+
+def Records(count):
+    """
+    grader records for random base-10 problems, half of them answered wrongly
+    """
+    records = []
+    for idx, (operand1, operator, operand2, _, _, _) in enumerate(RandomProblems(count)):
+        answer = BlockHeadEngine.Solve(operand1, operator, operand2)[0] if idx % 2 else "1"
+        records.append([operand1, operator, operand2, answer])
+    return records
+
+class GradeStreamTest(unittest.TestCase):
+    def testInputOrder(self):
+        records = Records(300)
+        serial = list(BlockHeadGrader.GradeStream(records, processes=1, chunk_size=7))
+        parallel = list(BlockHeadGrader.GradeStream(iter(records), processes=3, chunk_size=7))
+        self.assertEqual(parallel, serial)
+        self.assertEqual([[result[field] for field in BlockHeadGrader.G.FIELDS]
+                          for result in parallel],
+                         records)
+
+    def testVerdicts(self):
+        records = Records(300)
+        for record, result in zip(records, BlockHeadGrader.GradeStream(records, processes=1)):
+            expected = BlockHeadEngine.Solve(*record[:3])[0]
+            self.assertEqual(result["expected"], expected)
+            self.assertEqual(result["verdict"],
+                             "correct" if record[3] == expected else "incorrect")
+            # only a wrong answer is explained
+            self.assertEqual(bool(result.get("explanation")), result["verdict"] == "incorrect")
+
+    def testInvalidRecord(self):
+        result = list(BlockHeadGrader.GradeStream([["12", "-", "13", "1"]], processes=1))[0]
+        self.assertEqual(result["verdict"], "invalid")
+
+    def testInvalidJSONL(self):
+        lines = ['{"operand1": 12, "operator": "+", "operand2": "9", "student_answer": "21"}',
+                 '{"operand1": "1\\u00e9", "operator": "+", "operand2": "9", "student_answer": "10"}',
+                 '{"operand1": "12", "operator": "+"',
+                 '[12, "+", 9, 21]',
+                 '']
+        records = list(BlockHeadGrader.ReadRecords(StringIO("\n".join(lines)), BlockHeadGrader.G.JSONL))
+        self.assertEqual(records[0], ["12", "+", "9", "21"])
+        self.assertEqual(records[1][0], "1\xc3\xa9")
+
+        # a bad line does not stop the batch
+        results = list(BlockHeadGrader.GradeStream(records, processes=1))
+        self.assertEqual([result["verdict"] for result in results],
+                         ["correct", "invalid", "invalid", "invalid"])
+        outfile = StringIO()
+        BlockHeadGrader.WriteResults(results, outfile, BlockHeadGrader.G.JSONL)
+        self.assertEqual(len(outfile.getvalue().splitlines()), 4)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+property checks for BlockHeadRender (skipped if cairo is not installed)
+"""
+
+import unittest
+
+try:
+    import BlockHeadRender
+except ImportError:
+    BlockHeadRender = None
+
+class FakeClock(object):
+    """
+    clock that advances only when slept on, or by frame_cost per reading
+    """
+    def __init__(self, frame_cost=0.0):
+        self.now = 0.0
+        self.frame_cost = frame_cost
+        self.sleeps = []
+
+    def __call__(self):
+        self.now += self.frame_cost
+        return self.now
+
+    def Sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@unittest.skipIf(BlockHeadRender is None, "cairo is not installed")
+class PacedFramesTest(unittest.TestCase):
+    def Frames(self, count, duration, frame_cost):
+        clock = FakeClock(frame_cost)
+        frames = list(BlockHeadRender.PacedFrames(count, duration, clock.Sleep, clock))
+        return frames, clock
+
+    def testFastDevice(self):
+        frames, clock = self.Frames(12, 0.84, 0.0)
+        self.assertEqual(frames, range(1, 13))
+        # the animation lasts its duration
+        self.assertAlmostEqual(clock.now, 0.84)
+
+    def testSlowDevice(self):
+        for frame_cost in (0.1, 0.2, 0.5):
+            frames, clock = self.Frames(12, 0.84, frame_cost)
+            # frames are dropped, but never the first or the last
+            self.assertEqual(frames[0], 1)
+            self.assertEqual(frames[-1], 12)
+            self.assertEqual(frames, sorted(set(frames)))
+            self.assertTrue(len(frames) < 12)
+
+    def testNoDuration(self):
+        self.assertEqual(self.Frames(5, 0, 1.0)[0], range(1, 6))
+
+    def testFrameCount(self):
+        self.assertEqual(BlockHeadRender.FrameCount(0.84, 0.0, 12), 12)
+        self.assertEqual(BlockHeadRender.FrameCount(0.84, 0.1, 12), 8)
+        self.assertEqual(BlockHeadRender.FrameCount(0.84, 1.0, 12), BlockHeadRender.R.MIN_FRAMES)
+
+@unittest.skipIf(BlockHeadRender is None, "cairo is not installed")
+class BlockBitmapsTest(unittest.TestCase):
+    def testSameAsRowByRow(self):
+        geom = BlockHeadRender.Geometry(24, 12)
+        values = range(1, geom.BASE + 1)
+        colors = [0xFF0000FF, 0x00FF00FF]
+        bitmaps = BlockHeadRender.BlockBitmaps(values, colors, geom)
+        self.assertEqual(len(bitmaps), len(values) * len(colors) * 2)
+        for (value, color, flag), pixels in bitmaps.items():
+            self.assertEqual(len(pixels), geom.BLOCK_WID * value * geom.UNIT_HGT * 3)
+            self.assertEqual(pixels, BlockHeadRender.BlockBitmap(value, color, geom, flag))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+property checks for BlockHeadTrace
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+import BlockHeadTrace
+from BlockHeadTrace import T
+
+class ConfigureTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.tracer = BlockHeadTrace.Tracer()
+
+    def tearDown(self):
+        self.Shutdown()
+        shutil.rmtree(self.tmpdir)
+
+    def Shutdown(self):
+        # no span summary on the test output
+        self.tracer.Stop(StringIO())
+        self.tracer.Shutdown()
+
+    def testOff(self):
+        self.tracer.Configure(None)
+        self.assertFalse(self.tracer.enabled)
+        self.assertFalse(self.tracer.Threaded())
+        with self.tracer.Span("off"):
+            pass
+        self.assertEqual(self.tracer.SpanCount(), 0)
+
+    def testSpans(self):
+        self.tracer.Configure(" Spans ,startup")
+        self.assertTrue(self.tracer.enabled)
+        self.assertEqual(sorted(self.tracer.options), [T.SPANS, T.STARTUP])
+        self.assertFalse(self.tracer.Threaded())
+
+        traced = self.tracer.Traced("traced")(lambda value: value * 2)
+        self.assertEqual(traced(21), 42)
+        with self.tracer.Span("span"):
+            pass
+        self.assertEqual(self.tracer.SpanCount(), 2)
+
+    def testChromeTrace(self):
+        path = os.path.join(self.tmpdir, "trace.json")
+        self.tracer.Configure("chrome=%s" % path)
+        self.assertTrue(self.tracer.enabled)
+        # the trace file is written by a thread of its own
+        self.assertTrue(self.tracer.Threaded())
+
+        with self.tracer.Span("span", column=2):
+            pass
+        self.Shutdown()
+
+        events = json.load(open(path))
+        self.assertEqual([event["name"] for event in events if event["ph"] == "X"], ["span"])
+        self.assertEqual(events[-1]["args"], {"column": 2})
+
+if __name__ == "__main__":
+    unittest.main()